@@ -4,6 +4,12 @@ adsb2mqtt.py - Forward Beast Binary data from ultrafeeder to MQTT
 
 Connects to ultrafeeder on port 30005 (Beast Binary format), parses individual
 messages and publishes each to MQTT with timestamp and station ID.
+Published frames are unescaped (0x1a 0x1a inside a frame becomes a single 0x1a).
+
+Publish modes (ADSB_PUBLISH_MODE):
+    json:   one message per frame on MQTT_TOPIC, {"station": ..., "data": "<HEX>"}
+    binary: all frames of ADSB_BATCH_WINDOW seconds in one binary message on
+            MQTT_TOPIC/bin, format and reference decoder: dfld.Beast.unpack_batch
 
 Environment Variables:
     BEAST_HOST: ultrafeeder host (default: ultrafeeder)
@@ -11,6 +17,13 @@ Environment Variables:
     MQTT_SERVER: MQTT broker (default: mqtt:1883)
     MQTT_TOPIC: MQTT topic (default: dfld/adsb/beast)
     DFLD_STATION_ID: Station ID
+    ADSB_PUBLISH_MODE: json or binary (default: json)
+    ADSB_BATCH_WINDOW: binary mode batch window in seconds (default: 0.1)
+    ADSB_FILTER_CRC: drop DF11/17/18 frames failing the Mode-S CRC (default: false)
+    ADSB_DEDUP_WINDOW: suppress identical Mode-S messages within this many seconds, 0 = off (default: 0)
+    ADSB_DF_ALLOW: comma separated downlink formats to publish, e.g. 11,17,18 (default: all)
+    ADSB_ICAO_ALLOW: comma separated hex ICAO addresses to publish (default: all)
+    STATS_INTERVAL: seconds between decoder stats log lines (default: 600)
     LOG_LEVEL: Logging level (default: INFO)
 """
 
@@ -21,6 +34,8 @@ import json
 import socket
 import logging
 from dfld import MqttDataSink
+from dfld.Beast import BeastDecoder, pack_batch, BATCH_MAX_FRAMES
+from dfld.ModeS import ModeSFilter
 
 # Configure logging
 log_level = os.getenv('LOG_LEVEL', 'INFO').upper()
@@ -32,18 +47,29 @@ BEAST_HOST = os.getenv('BEAST_HOST', 'ultrafeeder')
 BEAST_PORT = int(os.getenv('BEAST_PORT', '30005'))
 MQTT_TOPIC = os.getenv('MQTT_TOPIC', 'dfld/adsb/beast')
 STATION_ID = os.getenv('DFLD_STATION_ID')
+PUBLISH_MODE = os.getenv('ADSB_PUBLISH_MODE', 'json').lower()
+BATCH_WINDOW = float(os.getenv('ADSB_BATCH_WINDOW', '0.1'))
+# opt-in: without them the published stream is unchanged for existing consumers
+FILTER_CRC = os.getenv('ADSB_FILTER_CRC', 'false').lower() in ['true', 'yes', '1']
+DEDUP_WINDOW = float(os.getenv('ADSB_DEDUP_WINDOW', '0'))
+DF_ALLOW = os.getenv('ADSB_DF_ALLOW', '')
+ICAO_ALLOW = os.getenv('ADSB_ICAO_ALLOW', '')
+STATS_INTERVAL = int(os.getenv('STATS_INTERVAL', 600))
 
 if not STATION_ID:
     logger.error('DFLD_STATION_ID not set')
     sys.exit(1)
 
-# Beast message lengths by type
-BEAST_LENGTHS = {
-    0x31: 2,   # Mode-AC
-    0x32: 7,   # Mode-S Short
-    0x33: 14,  # Mode-S Long
-    0x34: 1    # Signal Level
-}
+if PUBLISH_MODE not in ('json', 'binary'):
+    logger.error(f'Invalid ADSB_PUBLISH_MODE "{PUBLISH_MODE}" (expected: json, binary)')
+    sys.exit(1)
+
+try:
+    DF_ALLOW = {int(df) for df in DF_ALLOW.split(',') if df.strip()}
+    ICAO_ALLOW = {int(icao, 16) for icao in ICAO_ALLOW.split(',') if icao.strip()}
+except ValueError as e:
+    logger.error(f'Invalid ADSB_DF_ALLOW / ADSB_ICAO_ALLOW: {e}')
+    sys.exit(1)
 
 
 def connect_beast():
@@ -64,74 +90,92 @@ def connect_beast():
             attempt += 1
 
 
-def parse_beast_messages(data):
-    """Parse Beast Binary format and yield individual messages."""
-    i = 0
-    while i < len(data):
-        # Look for escape character
-        if data[i] != 0x1a:
-            i += 1
-            continue
-        
-        # Need at least escape + type
-        if i + 1 >= len(data):
-            break
-        
-        msg_type = data[i + 1]
-        
-        # Get expected message length
-        payload_len = BEAST_LENGTHS.get(msg_type)
-        if payload_len is None:
-            i += 2
-            continue
-        
-        # Total: 1 (escape) + 1 (type) + 6 (timestamp) + 1 (signal) + payload
-        total_len = 2 + 6 + 1 + payload_len
-        
-        # Check if we have complete message
-        if i + total_len > len(data):
-            break
-        
-        # Extract message
-        msg = data[i:i + total_len]
-        yield msg
-        
-        i += total_len
-
-
 def main():
-    logger.info('Starting adsb2mqtt...')
+    logger.info(f'Starting adsb2mqtt ({PUBLISH_MODE} mode)...')
     
     # Initialize MQTT sink
     sink = MqttDataSink()
-    sink.set_channel(MQTT_TOPIC)
+    if PUBLISH_MODE == 'binary':
+        sink.set_channel(f'{MQTT_TOPIC}/bin')
+    else:
+        sink.set_channel(MQTT_TOPIC)
     sink.connect()
     
+    decoder = BeastDecoder()
+    frame_filter = ModeSFilter(check_crc=FILTER_CRC, dedup_window=DEDUP_WINDOW,
+                               df_allow=DF_ALLOW, icao_allow=ICAO_ALLOW)
+    counters = {'publishes': 0, 'bytes_out': 0}
+    batch = []
+    batch_t0 = 0.0
+
+    def publish(payload):
+        sink.write(payload)
+        counters['publishes'] += 1
+        counters['bytes_out'] += len(payload)
+
+    def flush_batch():
+        nonlocal batch
+        for i in range(0, len(batch), BATCH_MAX_FRAMES):
+            chunk = batch[i:i + BATCH_MAX_FRAMES]
+            publish(pack_batch(STATION_ID, chunk, batch_t0))
+            logger.debug(f'Published batch: {len(chunk)} frames')
+        batch = []
+
+    last_stats_log = time.time()
     while True:
         sock = connect_beast()
+        if PUBLISH_MODE == 'binary':
+            # wake up to close the batch window even if the feed pauses
+            sock.settimeout(BATCH_WINDOW)
+        # a partial frame of the previous connection must not be joined to the new stream
+        decoder.reset()
         
         try:
             while True:
-                data = sock.recv(4096)
-                if not data:
+                try:
+                    n = decoder.recv_into(sock)
+                except socket.timeout:
+                    flush_batch()
+                    continue
+                if not n:
                     logger.warning('Connection closed by server')
                     break
                 
-                # Parse and publish individual messages
-                for msg in parse_beast_messages(data):
-                    hex_data = msg.hex().upper()
-                    
-                    payload = json.dumps({
-                        'station': STATION_ID,
-                        'data': hex_data
-                    })
-                    
-                    sink.write(payload)
-                    logger.debug(f'Published message: {hex_data[:20]}...')
+                # Parse and publish individual messages, an incomplete frame stays buffered
+                now = time.time()
+                frames = frame_filter.filter(decoder.decode(), now)
+                if PUBLISH_MODE == 'binary':
+                    if frames and not batch:
+                        batch_t0 = now
+                    batch += frames
+                    if batch and (now - batch_t0 >= BATCH_WINDOW or len(batch) >= BATCH_MAX_FRAMES):
+                        flush_batch()
+                else:
+                    for msg in frames:
+                        hex_data = msg.hex().upper()
+                        
+                        payload = json.dumps({
+                            'station': STATION_ID,
+                            'data': hex_data
+                        })
+                        
+                        publish(payload)
+                        logger.debug(f'Published message: {hex_data[:20]}...')
+
+                if time.time() - last_stats_log > STATS_INTERVAL:
+                    stats = decoder.stats()
+                    fs = frame_filter.stats()
+                    logger.info(f"Stats: frames={stats['frames']}, bytes_in={stats['bytes_in']}, "
+                                f"resyncs={stats['resyncs']}, dropped_bytes={stats['dropped_bytes']}, "
+                                f"passed={fs['passed']}, crc_failed={fs['crc_failed']}, duplicates={fs['duplicates']}, "
+                                f"df_filtered={fs['df_filtered']}, icao_filtered={fs['icao_filtered']}, "
+                                f"publishes={counters['publishes']}, bytes_out={counters['bytes_out']}")
+                    last_stats_log = time.time()
                 
         except Exception as e:
             logger.error(f'Error: {e}')
         finally:
+            flush_batch()
             sock.close()
             logger.info('Reconnecting in 5s...')
             time.sleep(5)
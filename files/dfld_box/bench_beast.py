@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+"""
+bench_beast.py - Throughput of the Beast stream decoder (dfld.Beast.BeastDecoder)
+
+Usage:
+    python bench_beast.py [capture.bin] [chunk_size]
+
+capture.bin is a raw Beast Binary recording, e.g.
+    nc ultrafeeder 30005 | head -c 20000000 > capture.bin
+Without a capture a synthetic stream with typical message mix is used.
+The stream is fed in chunk_size pieces (default 4096, like sock.recv).
+"""
+import os
+import sys
+import time
+import json
+import random
+
+from dfld.Beast import BeastDecoder, escape_frame, pack_batch
+
+
+def synthetic_capture(n=200000, seed=1):
+    rnd = random.Random(seed)
+    lengths = [(0x33, 14)] * 6 + [(0x32, 7)] * 3 + [(0x31, 2)]
+    out = bytearray()
+    for _ in range(n):
+        msg_type, length = rnd.choice(lengths)
+        body = bytes(rnd.getrandbits(8) for _ in range(7 + length))
+        out += escape_frame(bytes([0x1a, msg_type]) + body)
+    return bytes(out)
+
+
+def main():
+    if len(sys.argv) > 1 and os.path.exists(sys.argv[1]):
+        with open(sys.argv[1], 'rb') as f:
+            data = f.read()
+        source = sys.argv[1]
+    else:
+        data = synthetic_capture()
+        source = 'synthetic'
+    chunk_size = int(sys.argv[2]) if len(sys.argv) > 2 else 4096
+
+    decoder = BeastDecoder()
+    t_start = time.perf_counter()
+    decoded = []
+    for i in range(0, len(data), chunk_size):
+        decoded += decoder.feed(data[i:i + chunk_size])
+    elapsed = time.perf_counter() - t_start
+    frames = len(decoded)
+
+    # publish volume of both adsb2mqtt modes, binary batches of ~100 ms at 1000 frames/s
+    json_bytes = sum(len(json.dumps({'station': 'FRA-0815', 'data': f.hex().upper()})) for f in decoded)
+    binary = [pack_batch('FRA-0815', decoded[i:i + 100], 0.0) for i in range(0, frames, 100)]
+    binary_bytes = sum(len(b) for b in binary)
+
+    print(f'{source}: {len(data)} bytes, chunk {chunk_size}')
+    print(f'  frames={frames}, resyncs={decoder.resyncs}, dropped_bytes={decoder.dropped_bytes}')
+    print(f'  {frames / elapsed:,.0f} frames/s, {len(data) / elapsed / 1e6:.1f} MB/s')
+    print(f'  json:   {frames} publishes, {json_bytes} bytes')
+    print(f'  binary: {len(binary)} publishes, {binary_bytes} bytes ({binary_bytes / max(json_bytes, 1):.2f})')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
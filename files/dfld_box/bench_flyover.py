@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""
+bench_flyover.py - Per-message cost of TrajectoryPool.update over the pool size
+
+Usage:
+    python bench_flyover.py [messages]
+
+Feeds synthetic dump1090 lines for pools of 100 .. 10000 aircraft with a
+virtual clock (10 ms per message) and compares the expiry heap against the
+former full pool scan on every message.
+"""
+import sys
+import time
+import random
+import logging
+
+from detect_flyover import TrajectoryPool, Trajectory
+
+HOME = [8.5, 50.0, 100.0]
+
+
+class ScanPool(TrajectoryPool):
+    """Former expiry: scan the whole pool on every message."""
+
+    def update(self, data):
+        adsb_id = data['hex']
+        if adsb_id not in self.pool:
+            self.pool[adsb_id] = Trajectory(self)
+        self.pool[adsb_id].update(data)
+        now = self.clock()
+        for k in list(self.pool.keys()):
+            if self.pool[k].last_active:
+                if (now - self.pool[k].last_active) > self.TIMEOUT_TRAJ:
+                    self.pool[k].reset()
+                if (now - self.pool[k].last_active) > self.TIMEOUT_CACHE:
+                    del self.pool[k]
+
+
+def run(pool_cls, aircraft, messages, seed=1):
+    rnd = random.Random(seed)
+    t = [1.7e9]
+    pool = pool_cls(HOME)
+    pool.clock = lambda: t[0]
+    ids = [f'{i:06x}' for i in range(aircraft)]
+    # aircraft spread outside the active range, like a busy day around FRA
+    positions = {i: (8.0 + rnd.random(), 49.5 + rnd.random()) for i in ids}
+    lines = []
+    for _ in range(messages):
+        i = rnd.choice(ids)
+        lon, lat = positions[i]
+        lines.append({'hex': i, 'lon': lon + rnd.random() * 1e-3, 'lat': lat, 'alt_baro': 10000, 'rssi': -20.0})
+    for i in ids:
+        pool.update({'hex': i, 'lon': positions[i][0], 'lat': positions[i][1], 'alt_baro': 10000,
+                     'now': t[0], 'rssi': -20.0})
+    t_start = time.perf_counter()
+    for data in lines:
+        t[0] += 0.01
+        data['now'] = t[0]
+        pool.update(data)
+    return (time.perf_counter() - t_start) / messages * 1e6
+
+
+def main():
+    logging.basicConfig(level=logging.WARNING)
+    messages = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    print(f'{"aircraft":>8}  {"heap us/msg":>12}  {"scan us/msg":>12}')
+    for aircraft in (100, 1000, 3000, 10000):
+        heap = run(TrajectoryPool, aircraft, messages)
+        scan = run(ScanPool, aircraft, max(1000, messages // (aircraft // 100)))
+        print(f'{aircraft:>8}  {heap:>12.1f}  {scan:>12.1f}')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
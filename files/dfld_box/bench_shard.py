@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""
+bench_shard.py - Throughput of detect_flyover with FLYOVER_WORKERS = 1, 2, 4
+
+Usage:
+    python bench_shard.py [lines] [aircraft]
+
+Feeds synthetic dump1090 lines (compact JSON as written by readsb) once
+through a single TrajectoryPool in the reader process and once through a
+ShardRouter with 2 and 4 worker processes, and prints lines/s including the
+time to hand the last batch to the workers and stop them.
+"""
+import sys
+import time
+import json
+import random
+import logging
+
+from detect_flyover import TrajectoryPool, ShardRouter
+
+HOME = [8.5, 50.0, 100.0]
+
+
+class NullWriter:
+    def write(self, point):
+        pass
+
+
+def make_lines(n_lines, aircraft, seed=1):
+    rnd = random.Random(seed)
+    now = time.time()
+    ids = [f'{i:06x}' for i in range(aircraft)]
+    positions = {i: (8.0 + rnd.random(), 49.5 + rnd.random()) for i in ids}
+    lines = []
+    for k in range(n_lines):
+        i = rnd.choice(ids)
+        lon, lat = positions[i]
+        lines.append(json.dumps({'now': now + k * 1e-4, 'hex': i, 'lon': lon + rnd.random() * 1e-3, 'lat': lat,
+                                 'alt_baro': 10000, 'gs': 250.0, 'track': 90.0, 'rssi': -20.0},
+                                separators=(',', ':')))
+    return lines
+
+
+def run_single(lines):
+    pool = TrajectoryPool(HOME)
+    pool.set_writer(NullWriter())
+    t_start = time.perf_counter()
+    for line in lines:
+        try:
+            data = json.loads(line)
+        except ValueError:
+            continue
+        pool.update(data)
+    return time.perf_counter() - t_start
+
+
+def run_sharded(lines, workers):
+    router = ShardRouter(workers, HOME, NullWriter(), log_level=logging.WARNING)
+    time.sleep(1.0)  # let the spawned workers import detect_flyover
+    t_start = time.perf_counter()
+    for line in lines:
+        router.feed(line)
+    router.close()
+    return time.perf_counter() - t_start
+
+
+def main():
+    logging.basicConfig(level=logging.WARNING)
+    n_lines = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    aircraft = int(sys.argv[2]) if len(sys.argv) > 2 else 1000
+    lines = make_lines(n_lines, aircraft)
+    print(f'{"workers":>7}  {"lines/s":>10}')
+    print(f'{1:>7}  {n_lines / run_single(lines):>10,.0f}')
+    for workers in (2, 4):
+        print(f'{workers:>7}  {n_lines / run_sharded(lines, workers):>10,.0f}')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
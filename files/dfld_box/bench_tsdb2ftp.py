@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+"""
+bench_tsdb2ftp.py - map_one_day: vectorized resampler vs. the former Python loop
+
+Usage:
+    python bench_tsdb2ftp.py [repeat]
+
+Maps one synthetic full day (about 86400 samples with jitter and gaps) with
+the NumPy implementation of tsdb2ftp and with the former per-bin loop kept
+as reference in test_tsdb2ftp.py, and checks that both give the same bytes.
+"""
+import sys
+import time
+import datetime
+
+import pytz
+
+# test_tsdb2ftp stubs influxdb / dfld and sets the environment tsdb2ftp expects
+from test_tsdb2ftp import make_results, map_one_day_reference
+from tsdb2ftp import map_one_day
+
+
+def best_of(repeat, func):
+    best = None
+    for _ in range(repeat):
+        t_start = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - t_start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def main():
+    repeat = int(sys.argv[1]) if len(sys.argv) > 1 else 3
+    tz = pytz.timezone('Europe/Berlin')
+    day_start = tz.localize(datetime.datetime(2026, 4, 4)).astimezone(pytz.utc)
+    res_ns, res_iso = make_results(day_start, 86400)
+    n = len(res_ns.raw['series'][0]['values'])
+
+    t_ref, expected = best_of(repeat, lambda: map_one_day_reference(day_start, res_iso, True))
+    t_vec, data = best_of(repeat, lambda: map_one_day(day_start, res_ns, True))
+    assert data.tobytes() == bytes(expected), 'results differ'
+
+    print(f'{n} samples -> 86400 bins')
+    print(f'python loop: {t_ref * 1e3:8.1f} ms')
+    print(f'numpy:       {t_vec * 1e3:8.1f} ms  ({t_ref / t_vec:.0f}x)')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
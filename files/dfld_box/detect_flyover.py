@@ -2,73 +2,334 @@ import os
 import json
 import math
 import time
+import heapq
+import queue
 import socket
 import logging
-import datetime
+import signal
+import threading
 import traceback
-import numpy as np
-from influxdb import InfluxDBClient
+import zlib
+import multiprocessing
+from array import array
+from collections import deque
+from datetime import datetime
+from dfld.Geometry import LocalFrame, norm, closest_approach
 
 class TrajectoryPool:
     TIMEOUT_CACHE = 3600 # seconds of non reception before purge from cache
     TIMEOUT_TRAJ = 600 # seconds of non reception before trajectory is dumped and reset
+    PURGE_INTERVAL = 1.0 # seconds between expiry runs
     EARTH_RADIUS = 6371000 # earth radius in meters
+    # counters summed over the shards by ShardRouter.stats()
+    COUNTERS = ('positions', 'box_rejected', 'predicted', 'pred_reconciled', 'pred_false',
+                'pred_t0_err_sum', 'pred_dist_xy_err_sum', 'pred_dist_z_err_sum',
+                'zone_rejected', 'zone_events')
 
-    def __init__(self, home):
+    def __init__(self, home, name=None, active_range=None, event_range=None, zones=None):
         self.home = home
-        self.home_xyz = self.xyz(*home)
+        # ZoneIndex: only aircraft inside a zone get a Trajectory, entry / exit /
+        # closest approach per zone are written as event_zone
+        self.zones = zones
+        self.name = name # home tag of the events, None for a single STATION_POSITION
+        self.active_range = active_range or Trajectory.ACTIVE_RANGE
+        self.event_range = event_range or Trajectory.EVENT_RANGE
+        # station-centred east-north-up frame, replaces xyz() differences
+        self.frame = LocalFrame(*home, earth_radius=self.EARTH_RADIUS)
         self.pool = {}
+        self.clock = time.time
+        # Min-Heap (deadline, adsb_id) mit hoechstens einem Eintrag pro
+        # Trajectory. Die Deadline wird beim Update nicht angepasst: ist sie
+        # erreicht, wird mit dem aktuellen last_active neu entschieden und
+        # ggf. neu eingeplant. purge() kostet so O(abgelaufene Eintraege)
+        # statt O(Pool-Groesse).
+        self._expiry = []
+        self._next_purge = 0.0
+        # lat/lon box around the station, everything outside is out of ACTIVE_RANGE
+        self.box = self.bounding_box(self.active_range)
+        self.positions = 0     # position messages
+        self.box_rejected = 0  # positions rejected by the box without 3D math
+        # predicted closest approach: approaching events and their error
+        # against the measured minimum (absolute values summed)
+        self.predicted = 0
+        self.pred_reconciled = 0
+        self.pred_false = 0    # predicted, but passed outside EVENT_RANGE
+        self.pred_t0_err_sum = 0.0
+        self.pred_dist_xy_err_sum = 0.0
+        self.pred_dist_z_err_sum = 0.0
+        self.zone_rejected = 0 # positions of unknown aircraft outside every zone
+        self.zone_events = 0
 
     def __getitem__(self, key):
         return self.pool[key]
 
-    def set_influx_client(self, client, database):
-        self.influx_client = client
-        self.influx_database = database
+    def set_writer(self, writer):
+        # events are handed to a background writer (BatchedInfluxWriter), the
+        # dump1090 reader never waits for InfluxDB
+        self.writer = writer
 
-    def xyz(self, lon, lat, alt):
-        lon = lon * 3.141592653589793 / 180.0
-        lat = lat * 3.141592653589793 / 180.0
-        x = (self.EARTH_RADIUS + alt) * math.cos(lat) * math.cos(lon)
-        y = (self.EARTH_RADIUS + alt) * math.cos(lat) * math.sin(lon)
-        z = (self.EARTH_RADIUS + alt) * math.sin(lat)
-        return np.array([x, y, z])
+    def bounding_box(self, range_m):
+        """
+        lon/lat box containing all points with dist_xy <= range_m
+        :return: (lon_min, lon_max, lat_min, lat_max) in degrees
+        """
+        lon, lat, alt = self.home
+        r = self.EARTH_RADIUS + alt
+        # dist_xy is a chord at station altitude; 1% margin against rounding
+        dlat = math.degrees(2 * math.asin(min(1.0, range_m / (2 * r)))) * 1.01
+        lat_max = min(90.0, abs(lat) + dlat)
+        if lat_max >= 89.0:
+            dlon = 180.0
+        else:
+            dlon = dlat / math.cos(math.radians(lat_max))
+        return lon - dlon, lon + dlon, lat - dlat, lat + dlat
+
+    def stats(self):
+        res = {'aircraft': len(self.pool)}
+        for k in self.COUNTERS:
+            res[k] = getattr(self, k)
+        return self.derive_stats(res)
+
+    @staticmethod
+    def derive_stats(res):
+        """add ratios / averages to summed counters"""
+        res['reject_ratio'] = res['box_rejected'] / res['positions'] if res['positions'] else 0.0
+        n = res['pred_reconciled']
+        for k in ('t0', 'dist_xy', 'dist_z'):
+            res[f'pred_{k}_err_avg'] = res[f'pred_{k}_err_sum'] / n if n else 0.0
+        return res
 
     def update(self, data):
         adsb_id = data['hex']
-        if adsb_id not in self.pool:
-            self.pool[adsb_id] = Trajectory(self)
-        self.pool[adsb_id].update(data)
-        self.purge()
+        traj = self.pool.get(adsb_id)
+        if traj is None and self.zones is not None and not self.admit(data):
+            # not tracked, but the expiry of the others still has to run
+            self.zone_rejected += 1
+        else:
+            if traj is None:
+                traj = self.pool[adsb_id] = Trajectory(self)
+            traj.update(data)
+            if traj.last_active and not traj.expiry_scheduled:
+                traj.expiry_scheduled = True
+                heapq.heappush(self._expiry, (traj.last_active + self.TIMEOUT_TRAJ, adsb_id))
+
+        now = self.clock()
+        if now >= self._next_purge:
+            self._next_purge = now + self.PURGE_INTERVAL
+            self.purge(now)
+
+    def admit(self, data):
+        """True if the position lies inside any zone"""
+        try:
+            return bool(self.zones.lookup(data['lon'], data['lat'], data['alt_baro'] * 0.3048))
+        except (KeyError, TypeError):
+            return False
+
+    def purge(self, now=None):
+        # reset / remove timed out entries
+        if now is None:
+            now = self.clock()
+        expiry = self._expiry
+        while expiry and expiry[0][0] < now:
+            _, adsb_id = heapq.heappop(expiry)
+            traj = self.pool.get(adsb_id)
+            if traj is None:
+                continue
+            idle = now - traj.last_active
+            if idle > self.TIMEOUT_CACHE:
+                del self.pool[adsb_id]
+                continue
+            if idle > self.TIMEOUT_TRAJ:
+                traj.reset()
+                traj.leave_zones()
+                # a resumed trajectory must time out after TIMEOUT_TRAJ again,
+                # not only at the cache deadline; waking up idle costs nothing
+                deadline = min(traj.last_active + self.TIMEOUT_CACHE, now + self.TIMEOUT_TRAJ)
+            else:
+                # updated since scheduling
+                deadline = traj.last_active + self.TIMEOUT_TRAJ
+            heapq.heappush(expiry, (deadline, adsb_id))
+
+class MultiHomePool:
+    """
+    Mehrere benannte Stationen (Mikrofone) an einem ADS-B-Empfaenger.
+
+    Pro Home ein TrajectoryPool mit eigener Reichweite und eigenem ENU-Frame.
+    Ein Gitter-Index (CELL_DEG Grad) ordnet jeder Zelle die Homes zu, deren
+    Bounding-Box die Zelle oder eine Nachbarzelle beruehrt; eine Position
+    geht nur an diese Pools. Durch den Rand von einer Zelle sieht ein Pool
+    das Flugzeug noch ausserhalb seiner Box und setzt die Trajektorie beim
+    Verlassen der Zone zurueck wie bisher. Zellen um die Bounding-Box einer
+    Zone gehen an alle Homes, Zonen werden so auch weit weg von jedem Home
+    ausgewertet. purge() laeuft fuer alle Pools nach der Uhr, auch wenn
+    lange keine Position an einen Pool geht.
+    """
+    CELL_DEG = 0.1
+
+    def __init__(self, homes, zones=None):
+        """
+        :param homes: list of (name, [lon, lat, alt], active_range, event_range), see parse_homes()
+        :param zones: ZoneIndex shared by all homes, zone events are written per home
+        """
+        self.pools = [TrajectoryPool(home, name=name, active_range=active_range, event_range=event_range,
+                                     zones=zones)
+                      for name, home, active_range, event_range in homes]
+        self.index = {}
+        c = self.CELL_DEG
+        for pool in self.pools:
+            lon_min, lon_max, lat_min, lat_max = pool.box
+            for i in range(math.floor(lat_min / c) - 1, math.floor(lat_max / c) + 2):
+                for j in range(math.floor(lon_min / c) - 1, math.floor(lon_max / c) + 2):
+                    self.index[(i, j)] = self.index.get((i, j), ()) + (pool,)
+        if zones is not None:
+            for zone in zones.zones:
+                lon_min, lon_max, lat_min, lat_max = zone.box
+                for i in range(math.floor(lat_min / c) - 1, math.floor(lat_max / c) + 2):
+                    for j in range(math.floor(lon_min / c) - 1, math.floor(lon_max / c) + 2):
+                        self.index[(i, j)] = tuple(self.pools)
+        self.unindexed = 0  # positions without any home or zone nearby
+        self._next_purge = 0.0
+
+    @property
+    def clock(self):
+        return self.pools[0].clock
+
+    @clock.setter
+    def clock(self, clock):
+        for pool in self.pools:
+            pool.clock = clock
+
+    def set_writer(self, writer):
+        for pool in self.pools:
+            pool.set_writer(writer)
+
+    def update(self, data):
+        try:
+            cell = (math.floor(data['lat'] / self.CELL_DEG), math.floor(data['lon'] / self.CELL_DEG))
+        except KeyError:
+            cell = None  # no position, nothing to evaluate for any home
+        if cell is not None:
+            pools = self.index.get(cell)
+            if pools is None:
+                self.unindexed += 1
+            else:
+                for pool in pools:
+                    pool.update(data)
 
-    def purge(self):
-        # remove timed out entries
-        timeout_keys = []
-        now = time.time()
-        for k in self.pool.keys():
-            if self.pool[k].last_active:
-                if (now-self.pool[k].last_active) > self.TIMEOUT_TRAJ:
-                    self.pool[k].reset()
+        # a home without traffic nearby still has to time out its trajectories
+        now = self.clock()
+        if now >= self._next_purge:
+            self._next_purge = now + TrajectoryPool.PURGE_INTERVAL
+            for pool in self.pools:
+                pool.purge(now)
 
-                if (now-self.pool[k].last_active) > self.TIMEOUT_CACHE:
-                    timeout_keys.append(k)
-        for adsb_id in timeout_keys:
-            del self.pool[adsb_id]
+    def stats(self):
+        """counters summed over the homes, aircraft = trajectories of all homes"""
+        res = dict.fromkeys(('aircraft',) + TrajectoryPool.COUNTERS, 0)
+        for pool in self.pools:
+            for k, v in pool.stats().items():
+                if k in res:
+                    res[k] += v
+        return TrajectoryPool.derive_stats(res)
 
 
+def parse_homes(spec):
+    """
+    STATION_POSITIONS: comma separated homes name=lon:lat:alt[:active_range[:event_range]]
+    e.g. "garten=8.57:50.03:111,dach=8.61:50.05:140:6000:3500"
+    :return: list of (name, [lon, lat, alt], active_range or None, event_range or None)
+    """
+    homes = []
+    for item in spec.split(','):
+        item = item.strip()
+        if not item:
+            continue
+        name, sep, position = item.partition('=')
+        values = [float(x) for x in position.split(':')]
+        if not sep or not name or not 3 <= len(values) <= 5:
+            raise ValueError(f'invalid home "{item}", expected name=lon:lat:alt[:active_range[:event_range]]')
+        values += [None] * (5 - len(values))
+        homes.append((name.strip(), values[:3], values[3], values[4]))
+    names = [h[0] for h in homes]
+    if len(set(names)) != len(names):
+        raise ValueError(f'duplicate home names in "{spec}"')
+    return homes
+
+
+def make_pool(station, zones=None):
+    """
+    :param station: [lon, lat, alt] or list of homes from parse_homes()
+    :param zones: optional ZoneIndex
+    """
+    if isinstance(station[0], (int, float)):
+        return TrajectoryPool(station, zones=zones)
+    return MultiHomePool(station, zones=zones)
+
 
 class Trajectory:
     ACTIVE_RANGE = 5000 # meters
     EVENT_RANGE = 3000 # meters
+    MAX_POINTS = 512 # stored points per trajectory, downsampled by 2 when full
+    POINT_SIZE = 6 # lon, lat, alt_baro [m], now, rssi, alt_geom [m] (nan if missing)
+    INFO_KEYS = ('hex', 'flight', 'r', 't', 'desc')
+    # predicted closest approach (CPA) from gs / track / vertical rate
+    PREDICT_HORIZON = 120 # seconds, predictions further ahead are ignored
+    PREDICT_STABLE = 3 # consecutive consistent predictions before the approaching event
+    PREDICT_T_TOL = 2.0 # seconds, max change of the predicted t0 between updates
+    PREDICT_DIST_TOL = 150 # meters, max change of the predicted dist_xy between updates
+    PREDICT_MIN_GS = 30 # knots, no prediction for taxiing / hovering aircraft
+
+    # bei einigen hundert gleichzeitig getrackten Flugzeugen auf dem Pi:
+    # kein __dict__ pro Trajectory, Punkte flach in einem array('d')
+    __slots__ = ('pool', 'info', 'last_active', 'expiry_scheduled', 'zone_visits',
+                 'traj', '_stride', '_skip',
+                 'min_dist', 'min_dist_xy', 'min_alt_baro', 'min_alt_geom', 'min_rssi',
+                 'lambda_', 'v0', 't0', 'dist', 'dist_0', 'dist_xy',
+                 'flyover_detected', 'in_zone',
+                 'pred_t0', 'pred_dist_xy', 'pred_dist_z', 'pred_stable', 'pred_time')
 
     def __init__(self, pool):
         self.pool = pool
         self.info = {}
         self.last_active = None
+        self.expiry_scheduled = False
+        # zone name -> [entry time, min dist, dist_xy, alt_baro, rssi at min, closest written,
+        #               dist_xy, alt_baro, rssi last seen in the zone];
+        # not cleared by reset(), leaving the station range is not leaving a zone
+        self.zone_visits = {}
         self.reset()
 
+    @property
+    def n_points(self):
+        return len(self.traj) // self.POINT_SIZE
+
+    def points(self):
+        """stored points as tuples (lon, lat, alt_baro, now, rssi, alt_geom)"""
+        traj = self.traj
+        n = self.POINT_SIZE
+        return [tuple(traj[i:i + n]) for i in range(0, len(traj), n)]
+
+    def add_point(self, lon, lat, alt, now, rssi, alt_geom):
+        # after downsampling only every _stride-th point is stored, so the
+        # stored points stay evenly spaced over the whole trajectory
+        self._skip -= 1
+        if self._skip > 0:
+            return
+        traj = self.traj
+        if len(traj) >= self.MAX_POINTS * self.POINT_SIZE:
+            n = self.POINT_SIZE
+            kept = array('d')
+            for i in range(0, len(traj), 2 * n):
+                kept.extend(traj[i:i + n])
+            self.traj = traj = kept
+            self._stride *= 2
+        self._skip = self._stride
+        traj.extend((lon, lat, alt, now, rssi, alt_geom))
+
     def reset(self):
-        self.traj = []
+        self.traj = array('d')
+        self._stride = 1
+        self._skip = 0
         self.min_dist = 1e9
         # Snapshot der Geometrie am closest-point-Sample. Frueher nur
         # min_dist als Skalar — jetzt halten wir alle Komponenten fest,
@@ -86,6 +347,11 @@ class Trajectory:
         self.dist_xy = None
         self.flyover_detected = False
         self.in_zone = False
+        self.pred_t0 = None         # predicted time of closest approach
+        self.pred_dist_xy = None    # predicted horizontal distance at pred_t0
+        self.pred_dist_z = None     # predicted height above station at pred_t0
+        self.pred_stable = 0        # consecutive consistent predictions
+        self.pred_time = None       # time of the approaching event, None if not written
 
     def update(self, data):
         # check for required fields
@@ -93,27 +359,44 @@ class Trajectory:
         if len(missing)>0:
             logging.debug(f"data set rejected, missing key(s): {missing}")
             return
+        # readsb writes "alt_baro":"ground" for aircraft on the ground
+        if not isinstance(data['alt_baro'], (int, float)):
+            logging.debug(f"data set rejected, alt_baro={data['alt_baro']!r}")
+            return
 
         self.last_active = data['now']
-        coords = [data['lon'], data['lat'], data['alt_baro'] * 0.3048, data['now'], data['rssi'],
-                           data['alt_geom'] * 0.3048 if 'alt_geom' in data else None]
-        v1 = self.pool.xyz(*coords[:3]) - self.pool.home_xyz
-        dist_xy = np.linalg.norm(self.pool.xyz(coords[0], coords[1], self.pool.home[2])-self.pool.home_xyz)
 
-        logging.debug(f"distances: dist={np.linalg.norm(v1)}, dist_xy={dist_xy}")
+        pool = self.pool
+        if pool.zones is not None:
+            self.update_zones(data)
+
+        # cheap pre-filter: two comparisons per axis instead of the 3D geometry
+        pool.positions += 1
+        lon_min, lon_max, lat_min, lat_max = pool.box
+        if not (lat_min <= data['lat'] <= lat_max and lon_min <= data['lon'] <= lon_max):
+            pool.box_rejected += 1
+            # when leaving zone, reset
+            if self.in_zone and self.n_points>1:
+                self.in_zone = False
+                self.reset()
+            return
 
-        if dist_xy <= self.ACTIVE_RANGE:
+        alt = data['alt_baro'] * 0.3048
+        v1, dist_xy = pool.frame.project(data['lon'], data['lat'], alt)
+        dist = norm(v1)
+
+        logging.debug(f"distances: dist={dist}, dist_xy={dist_xy}")
+
+        if dist_xy <= pool.active_range:
             self.dist_xy = dist_xy
             self.in_zone = True
-            self.dist = np.linalg.norm(v1)
+            self.dist = dist
 
             # calculate lambda and closest point on trajectory
             self.lambda_ = 1e9
             self.dist_0 = 1e9
-            if len(self.traj) > 1:
-                d = v1 - self.v0
-                self.lambda_ = -np.dot(self.v0, d) / np.dot(d, d)
-                self.dist_0 = np.linalg.norm(self.v0 + self.lambda_ * d)
+            if self.n_points > 1:
+                self.lambda_, self.dist_0 = closest_approach(self.v0, v1)
             self.v0 = v1
 
             # update min distance — am neuen Minimum auch die geometrischen
@@ -122,23 +405,29 @@ class Trajectory:
             if self.min_dist > self.dist:
                 self.min_dist = self.dist
                 self.min_dist_xy = self.dist_xy
-                self.min_alt_baro = data['alt_baro'] * 0.3048
+                self.min_alt_baro = alt
                 self.min_alt_geom = (data['alt_geom'] * 0.3048
                                      if 'alt_geom' in data else None)
                 self.min_rssi = float(data['rssi'])
                 self.t0 = data['now']
 
-            self.traj.append(coords)
+            self.add_point(data['lon'], data['lat'], alt, data['now'], data['rssi'],
+                           data['alt_geom'] * 0.3048 if 'alt_geom' in data else math.nan)
 
-            # update info dict since we might have new data
-            self.info = { k: v for k, v in data.items() if k in ['hex', 'flight', 'r', 't', 'desc'] }
-            self.info['rssi'] = float(data['rssi'])
+            self.update_info(data)
+
+            # predict the closest approach until the approaching event is written
+            if not self.flyover_detected and self.pred_time is None:
+                self.predict(v1, alt, data)
 
             # check for flyover
             if self.dist > self.min_dist and self.lambda_ < 0 and not self.flyover_detected:
                 self.flyover_detected = True
-                if self.dist <= self.EVENT_RANGE:
-                    self.write_event()
+                errors = self.reconcile_prediction()
+                if self.dist <= pool.event_range:
+                    self.write_event(errors)
+                elif errors:
+                    pool.pred_false += 1
 
             logging.debug(f"{self.info['hex']}:    "
                           f"dist={self.dist:6.1f}   "
@@ -147,15 +436,169 @@ class Trajectory:
                           f"lambda={self.lambda_:6.1f}    FOD={self.flyover_detected}")
         else:
             # when leaving zone, reset
-            if self.in_zone and len(self.traj)>1:
+            if self.in_zone and self.n_points>1:
                 self.in_zone = False
                 self.reset()
 
-    def write_event(self):
+    def update_info(self, data):
+        # update info dict only if callsign / registration / type changed
+        info = self.info
+        for k in self.INFO_KEYS:
+            if k in data and info.get(k) != data[k]:
+                info[k] = data[k]
+        info['rssi'] = float(data['rssi'])
+
+    def update_zones(self, data):
+        """entry / closest approach / exit per zone"""
+        pool = self.pool
+        alt = data['alt_baro'] * 0.3048
+        zones = pool.zones.lookup(data['lon'], data['lat'], alt)
+        visits = self.zone_visits
+        if not zones and not visits:
+            return
+        now = data['now']
+        rssi = float(data['rssi'])
+        inside = set()
+        if zones:
+            self.update_info(data)
+            enu, dist_xy = pool.frame.project(data['lon'], data['lat'], alt)
+            dist = norm(enu)
+            for zone in zones:
+                inside.add(zone.name)
+                visit = visits.get(zone.name)
+                if visit is None:
+                    visits[zone.name] = [now, dist, dist_xy, alt, rssi, False, dist_xy, alt, rssi]
+                    self.write_zone_event(zone.name, 'entry', dist_xy, alt, rssi)
+                    continue
+                visit[6:9] = [dist_xy, alt, rssi]
+                if dist < visit[1]:
+                    visit[1:5] = [dist, dist_xy, alt, rssi]
+                elif not visit[5] and dist > visit[1]:
+                    visit[5] = True
+                    self.write_zone_event(zone.name, 'closest', *visit[2:5])
+        for name in [name for name in visits if name not in inside]:
+            self.leave_zone(name, now, dist_xy if zones else None, alt, rssi)
+
+    def leave_zone(self, name, now, dist_xy, alt, rssi, **extra):
+        """closest (if not yet written) and exit event of a zone visit"""
+        visit = self.zone_visits.pop(name)
+        if not visit[5]:
+            self.write_zone_event(name, 'closest', *visit[2:5])
+        self.write_zone_event(name, 'exit', dist_xy, alt, rssi, duration=float(now - visit[0]), **extra)
+
+    def leave_zones(self):
+        """TRAJ timeout: close all open visits with the last position seen in the zone"""
+        for name in list(self.zone_visits):
+            visit = self.zone_visits[name]
+            self.leave_zone(name, self.last_active, *visit[6:9], timeout=True)
+
+    def write_zone_event(self, zone, event, dist_xy, alt, rssi, **extra):
+        tags = self.event_tags()
+        tags['zone'] = zone
+        tags['event'] = event
+        fields = {
+            'alt_baro': float(alt),
+            'dist_z': float(alt - self.pool.home[2]),
+            'rssi': rssi,
+        }
+        if dist_xy is not None:
+            fields['dist_xy'] = float(dist_xy)
+        fields.update(extra)
+        self.pool.zone_events += 1
+        self.pool.writer.write({
+            "measurement": "event_zone",
+            "tags": tags,
+            "fields": fields,
+            "time": int(self.pool.clock() * 1e9),
+        })
+        logging.info(f'influxdb zone event queued: tags={tags}, fields={fields}')
+
+    def predict(self, v1, alt, data):
+        """
+        Projiziert die Position mit gs / track / Steigrate linear bis zum
+        horizontal naechsten Punkt zur Station. Stimmen PREDICT_STABLE
+        aufeinanderfolgende Vorhersagen ueberein und liegt der Punkt in
+        EVENT_RANGE, wird sofort ein approaching-Event geschrieben.
+        """
+        gs = data.get('gs')
+        track = data.get('track')
+        if gs is None or track is None or gs < self.PREDICT_MIN_GS:
+            self.pred_stable = 0
+            return
+        v = gs * 0.514444  # knots -> m/s
+        ve = v * math.sin(math.radians(track))
+        vn = v * math.cos(math.radians(track))
+        rate = data.get('baro_rate', data.get('geom_rate'))
+        vu = rate * 0.00508 if rate is not None else 0.0  # ft/min -> m/s
+        t_cpa = -(v1[0] * ve + v1[1] * vn) / (v * v)
+        if not 0.0 < t_cpa <= self.PREDICT_HORIZON:
+            self.pred_stable = 0
+            return
+        t0 = data['now'] + t_cpa
+        dist_xy = math.hypot(v1[0] + ve * t_cpa, v1[1] + vn * t_cpa)
+        dist_z = alt + vu * t_cpa - self.pool.home[2]
+        if (self.pred_t0 is not None and abs(t0 - self.pred_t0) <= self.PREDICT_T_TOL
+                and abs(dist_xy - self.pred_dist_xy) <= self.PREDICT_DIST_TOL):
+            self.pred_stable += 1
+        else:
+            self.pred_stable = 1
+        self.pred_t0 = t0
+        self.pred_dist_xy = dist_xy
+        self.pred_dist_z = dist_z
+        if self.pred_stable >= self.PREDICT_STABLE and dist_xy <= self.pool.event_range:
+            self.pred_time = data['now']
+            self.write_prediction(t_cpa)
+
+    def reconcile_prediction(self):
+        """
+        error of the approaching event against the measured minimum
+        :return: fields for event_raw, empty if no approaching event was written
+        """
+        if self.pred_time is None or self.min_dist_xy is None:
+            return {}
+        errors = {
+            'pred_t0_err': float(self.pred_t0 - self.t0),
+            'pred_dist_xy_err': float(self.pred_dist_xy - self.min_dist_xy),
+            'pred_dist_z_err': float(self.pred_dist_z - (self.min_alt_baro - self.pool.home[2])),
+            'pred_lead': float(self.t0 - self.pred_time),
+        }
+        pool = self.pool
+        pool.pred_reconciled += 1
+        pool.pred_t0_err_sum += abs(errors['pred_t0_err'])
+        pool.pred_dist_xy_err_sum += abs(errors['pred_dist_xy_err'])
+        pool.pred_dist_z_err_sum += abs(errors['pred_dist_z_err'])
+        return errors
+
+    def event_tags(self):
         tags = {}
         for k in ['hex', 'flight', 'r', 't']:
             if k in self.info:
                 tags[k] = str(self.info[k]).strip()
+        if self.pool.name is not None:
+            tags['home'] = self.pool.name
+        return tags
+
+    def write_prediction(self, t_cpa):
+        tags = self.event_tags()
+        fields = {
+            't0': float(self.pred_t0),        # predicted time of closest approach, unix seconds
+            'lead': float(t_cpa),             # seconds from now until t0
+            'dist_xy': float(self.pred_dist_xy),
+            'dist_z': float(self.pred_dist_z),
+            'rssi': float(self.info['rssi']),
+        }
+        self.pool.predicted += 1
+        self.pool.writer.write({
+            "measurement": "event_pred",
+            "tags": tags,
+            "fields": fields,
+            "time": int(self.pool.clock() * 1e9),
+        })
+        logging.info(f'influxdb approaching event queued: tags={tags}, fields={fields}')
+
+    def write_event(self, prediction=None):
+        """:param prediction: error fields of reconcile_prediction()"""
+        tags = self.event_tags()
 
         # Pre-baked Strings als FIELDS (nicht tags) — sonst entstehen
         # neue Series bei Variationen (jeder label-Wert = neue Series).
@@ -192,81 +635,553 @@ class Trajectory:
             fields['alt_geom'] = float(self.min_alt_geom)
         if 'desc' in self.info:
             fields['descr'] = str(self.info['desc'])
+        if self.t0 is not None:
+            fields['t0'] = float(self.t0)  # time of the closest point, for the noise window
+        if prediction:
+            fields.update(prediction)
 
-        ts = datetime.datetime.utcfromtimestamp(time.time()).strftime('%Y-%m-%dT%H:%M:%SZ')
-
-        json_body = [{
+        self.pool.writer.write({
             "measurement": "event_raw",
             "tags": tags,
             "fields": fields,
-            "time": ts
-        }]
-        self.pool.influx_client.write_points(json_body, database=self.pool.influx_database)
-        logging.info(f'influxdb event written: tags={tags}, fields={fields}')
+            "time": int(self.pool.clock() * 1e9),
+        })
+        logging.info(f'influxdb event queued: tags={tags}, fields={fields}')
 
 
-# main loop
-level = os.environ['LOG_LEVEL'].upper() if 'LOG_LEVEL' in os.environ else logging.INFO
-logging.basicConfig(format='%(asctime)s - %(levelname)s:%(message)s', level=level)
-logging.info('starting...')
-logging.info(f'LOG_LEVEL={level}')
+def noise_sample(payload):
+    """
+    :param payload: spl message, e.g. {"dB_A_avg": 52.3, "ts": "2026-05-10T12:30:01.000000Z"}
+    :return: (unix time, level), time of arrival if ts is missing; None if no level
+    """
+    try:
+        data = json.loads(payload)
+        level = float(data['dB_A_avg'])
+    except (ValueError, KeyError, TypeError):
+        return None
+    try:
+        t = datetime.fromisoformat(data['ts'].replace('Z', '+00:00')).timestamp()
+    except (KeyError, AttributeError, ValueError):
+        t = time.time()
+    return t, level
+
+
+class NoiseEnricher:
+    """
+    Writer-Wrapper: haelt event_raw-Punkte bis `after` Sekunden nach t0
+    zurueck, damit der Ringpuffer den ganzen Ueberflug enthaelt, und
+    schreibt sie dann mit LAmax, SEL und t10 aus dem NoiseBuffer. Alle
+    anderen Punkte gehen sofort durch. Ein Thread gibt faellige Events
+    auch dann frei, wenn keine dump1090-Zeilen mehr kommen.
+
+    Mehrere Homes: ein NoiseBuffer pro Mikrofon, ausgewaehlt ueber den
+    home-Tag des Events, damit sich die Pegel nicht mischen. Die Haltezeit
+    wird als eigene Stufe gezaehlt (hold_ms_* in stats()), die
+    event_latency des Writers beginnt erst mit der Freigabe.
+    """
+
+    def __init__(self, writer, buffers, before=60, after=30, clock=time.time):
+        """
+        :param buffers: dict home name -> NoiseBuffer, or a single NoiseBuffer for events without home tag
+        """
+        self.writer = writer
+        self.buffers = buffers if isinstance(buffers, dict) else {None: buffers}
+        self.before = before
+        self.after = after
+        self.clock = clock
+        self._pending = deque()  # (due, point), in order of t0
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self.enriched = 0
+        self.no_noise = 0
+        self.hold_count = 0
+        self.hold_total = 0.0
+        self.hold_max = 0.0
+
+    def write(self, point):
+        t0 = point['fields'].get('t0')
+        if point['measurement'] != 'event_raw' or t0 is None:
+            self.writer.write(point)
+            return
+        with self._lock:
+            self._pending.append((t0 + self.after, self.clock(), point))
+
+    def poll(self, now=None):
+        """write the events whose noise window is complete"""
+        if now is None:
+            now = self.clock()
+        while True:
+            with self._lock:
+                if not self._pending or self._pending[0][0] > now:
+                    return
+                _, t_in, point = self._pending.popleft()
+            hold = max(0.0, self.clock() - t_in)
+            self.hold_count += 1
+            self.hold_total += hold
+            self.hold_max = max(self.hold_max, hold)
+            fields = point['fields']
+            buffer = self.buffers.get(point['tags'].get('home'))
+            noise = buffer.metrics(fields['t0'], before=self.before, after=self.after) if buffer else None
+            if noise is None:
+                self.no_noise += 1
+            else:
+                self.enriched += 1
+                fields['LAmax'] = noise['LAmax']
+                fields['SEL'] = noise['SEL']
+                fields['t10'] = noise['t10']
+                fields['LAmax_offset'] = noise['t_max'] - fields['t0']
+            self.writer.write(point)
+
+    def _run(self):
+        while not self._stop.wait(1.0):
+            self.poll()
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='noise-enricher', daemon=True)
+        self._thread.start()
+
+    def close(self, timeout=None):
+        """stop the thread and write the pending events with the noise seen so far"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        self.poll(now=math.inf)
+
+    def stats(self, reset=False):
+        res = {'enriched': self.enriched, 'no_noise': self.no_noise, 'pending': len(self._pending),
+               'noise_samples': sum(b.samples for b in self.buffers.values()),
+               'hold_ms_avg': 1000.0 * self.hold_total / self.hold_count if self.hold_count else 0.0,
+               'hold_ms_max': 1000.0 * self.hold_max}
+        if reset:
+            self.hold_max = 0.0
+        return res
+
+
+def parse_noise_topics(spec, homes):
+    """
+    NOISE_TOPICS: comma separated home=topic, e.g.
+    "garten=dfld/sensors/noise/spl/garten,dach=dfld/sensors/noise/spl/dach"
+    :param homes: home names of STATION_POSITIONS, every home needs its own microphone topic
+    :return: list of (home, topic filter)
+    """
+    routes = []
+    for item in spec.split(','):
+        item = item.strip()
+        if not item:
+            continue
+        home, sep, topic = item.partition('=')
+        home = home.strip()
+        if not sep or not topic.strip():
+            raise ValueError(f'invalid noise topic "{item}", expected home=topic')
+        if home not in homes:
+            raise ValueError(f'noise topic for unknown home "{home}"')
+        routes.append((home, topic.strip()))
+    if len({home for home, _ in routes}) != len(routes):
+        raise ValueError(f'duplicate homes in "{spec}"')
+    return routes
+
+
+def shard_of(line, n):
+    """
+    worker index for a dump1090 line, by crc32 of the ICAO hex id
+    :return: index in range(n), None if the line has no hex id
+    """
+    # cheap extraction without json.loads, readsb writes "hex":"3c4594"
+    i = line.find('"hex":"')
+    if i >= 0:
+        j = line.find('"', i + 7)
+        hex_id = line[i + 7:j]
+    else:
+        try:
+            hex_id = json.loads(line)['hex']
+        except (ValueError, KeyError, TypeError):
+            return None
+    return zlib.crc32(hex_id.encode('utf-8')) % n
+
+
+class _QueueWriter:
+    """event writer of a shard worker: hands points to the reader process"""
+
+    def __init__(self, events):
+        self.events = events
+
+    def write(self, point):
+        self.events.put(('event', point))
+
+
+def shard_worker(index, station, lines, events, log_level=logging.INFO, stats_every=10.0, zones=None):
+    """worker process: owns the trajectories of its share of ICAO ids"""
+    logging.basicConfig(format=f'%(asctime)s - %(levelname)s:[shard {index}] %(message)s', level=log_level)
+    # Ctrl+C / SIGTERM go to the reader, it stops the workers after the last batch
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    pool = make_pool(station, zones=zones)
+    pool.set_writer(_QueueWriter(events))
+    if index == 0:
+        # every shard has the same boxes, the reader builds no pool of its own
+        for home in getattr(pool, 'pools', [pool]):
+            logging.info(f'Active range bounding box lon/lat = {home.box}')
+    n_lines = 0
+    last_stats = time.monotonic()
+    while True:
+        batch = lines.get()
+        if batch is None:
+            break
+        for line in batch:
+            try:
+                data = json.loads(line)
+            except ValueError:
+                continue
+            try:
+                pool.update(data)
+            except Exception:
+                # one odd line must not take down the worker (and block the reader)
+                logging.exception(f'update failed for line: {line.strip()}')
+        n_lines += len(batch)
+        if time.monotonic() - last_stats > stats_every:
+            events.put(('stats', index, dict(pool.stats(), lines=n_lines)))
+            last_stats = time.monotonic()
+    events.put(('stats', index, dict(pool.stats(), lines=n_lines)))
+    events.put(('done', index))
+
+
+class ShardRouter:
+    """
+    Verteilt den dump1090-Zeilenstrom per crc32(hex) auf N Worker-Prozesse.
+
+    Jeder Worker besitzt eine Partition des TrajectoryPool (ein Flugzeug
+    landet immer beim selben Worker), der Reader extrahiert nur die hex-Id.
+    Zeilen gehen gebuendelt (batch_lines bzw. alle flush_interval Sekunden)
+    ueber je eine Queue pro Worker. Events aller Worker laufen ueber eine
+    gemeinsame Queue zurueck an einen einzigen Writer im Reader-Prozess.
+    Stirbt ein Worker trotzdem, wird er beim naechsten Flush bzw. bei
+    voller Queue neu gestartet (seine Trajektorien sind verloren), statt
+    den Reader auf put() haengen zu lassen.
+    """
+
+    def __init__(self, n_workers, station, writer, batch_lines=200, flush_interval=0.05,
+                 log_level=logging.INFO, zones=None):
+        self.n = n_workers
+        self.writer = writer
+        self.batch_lines = batch_lines
+        self.flush_interval = flush_interval
+        self._station = station
+        self._log_level = log_level
+        self._zones = zones
+        self._ctx = ctx = multiprocessing.get_context('spawn')
+        self._lines = [ctx.Queue(maxsize=1000) for _ in range(n_workers)]
+        self._events = ctx.Queue()
+        self._batches = [[] for _ in range(n_workers)]
+        self._last_flush = time.monotonic()
+        self._stats = {}
+        self._done = 0
+        self.lines = 0
+        self.unrouted = 0
+        self.restarts = 0
+        self._workers = [self._start_worker(i) for i in range(n_workers)]
+        self._drain_thread = threading.Thread(target=self._drain, name='shard-events', daemon=True)
+        self._drain_thread.start()
+
+    def _start_worker(self, i):
+        w = self._ctx.Process(target=shard_worker, name=f'flyover-shard-{i}',
+                              args=(i, self._station, self._lines[i], self._events, self._log_level),
+                              kwargs={'zones': self._zones}, daemon=True)
+        w.start()
+        return w
+
+    def check_workers(self):
+        """restart dead worker processes"""
+        for i, w in enumerate(self._workers):
+            if not w.is_alive():
+                logging.error(f'shard worker {i} died (exitcode {w.exitcode}), restarting, its trajectories are lost')
+                self.restarts += 1
+                self._workers[i] = self._start_worker(i)
 
-required_env = "DUMP1090_SERVER INFLUXDB_SERVER INFLUXDB_USERNAME INFLUXDB_PASSWORD INFLUXDB_DATABASE STATION_POSITION".split()
-missing_env = []
-for k in required_env:
-    if k not in os.environ:
-        missing_env.append(k)
-if len(missing_env)>0:
-    logging.error(f'following environment variables not set: {missing_env}')
-    exit(1)
+    def _put(self, shard, batch):
+        while True:
+            try:
+                self._lines[shard].put(batch, timeout=1.0)
+                return
+            except queue.Full:
+                self.check_workers()
 
-args = { k: os.environ[k] for k in required_env}
-logging.info(f'all environment variables set: {args}')
+    def feed(self, line):
+        shard = shard_of(line, self.n)
+        if shard is None:
+            self.unrouted += 1
+            return
+        self.lines += 1
+        batch = self._batches[shard]
+        batch.append(line)
+        if len(batch) >= self.batch_lines:
+            self._put(shard, batch)
+            self._batches[shard] = []
+        if time.monotonic() - self._last_flush >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        self.check_workers()
+        for i, batch in enumerate(self._batches):
+            if batch:
+                self._put(i, batch)
+                self._batches[i] = []
+        self._last_flush = time.monotonic()
+
+    def _drain(self):
+        while self._done < self.n:
+            msg = self._events.get()
+            if msg[0] == 'event':
+                self.writer.write(msg[1])
+            elif msg[0] == 'stats':
+                self._stats[msg[1]] = msg[2]
+            elif msg[0] == 'done':
+                self._done += 1
+
+    def stats(self):
+        keys = ('aircraft',) + TrajectoryPool.COUNTERS
+        res = dict.fromkeys(keys, 0)
+        for st in list(self._stats.values()):
+            for k in keys:
+                res[k] += st[k]
+        TrajectoryPool.derive_stats(res)
+        res['lines'] = self.lines
+        res['unrouted'] = self.unrouted
+        res['restarts'] = self.restarts
+        res['shard_lines'] = [self._stats.get(i, {}).get('lines', 0) for i in range(self.n)]
+        return res
+
+    def close(self, timeout=30):
+        """Send the pending lines, stop the workers and forward their last events."""
+        self.flush()
+        for i in range(self.n):
+            self._put(i, None)
+        for w in self._workers:
+            w.join(timeout)
+        self._drain_thread.join(timeout)
+
+
+def main():
+    from influxdb import InfluxDBClient
+    from dfld import BatchedInfluxWriter, SegmentSpool, ZoneIndex, NoiseBuffer
+
+    level = os.environ['LOG_LEVEL'].upper() if 'LOG_LEVEL' in os.environ else logging.INFO
+    logging.basicConfig(format='%(asctime)s - %(levelname)s:%(message)s', level=level)
+    logging.info('starting...')
+    logging.info(f'LOG_LEVEL={level}')
+
+    required_env = "DUMP1090_SERVER INFLUXDB_SERVER INFLUXDB_USERNAME INFLUXDB_PASSWORD INFLUXDB_DATABASE".split()
+    missing_env = []
+    for k in required_env:
+        if k not in os.environ:
+            missing_env.append(k)
+    if 'STATION_POSITION' not in os.environ and 'STATION_POSITIONS' not in os.environ:
+        missing_env.append('STATION_POSITION')
+    if len(missing_env)>0:
+        logging.error(f'following environment variables not set: {missing_env}')
+        exit(1)
+
+    args = { k: os.environ[k] for k in required_env}
+    logging.info(f'all environment variables set: {args}')
+
+    # mehrere Mikrofone an einem Empfaenger: STATION_POSITIONS hat Vorrang
+    if os.environ.get('STATION_POSITIONS'):
+        station = parse_homes(os.environ['STATION_POSITIONS'])
+        for name, home, active_range, event_range in station:
+            logging.info(f'Home {name}: lon, lat, alt = {home}, active_range={active_range}, event_range={event_range}')
+    else:
+        station = [float(x) for x in os.environ['STATION_POSITION'].split(':')]
+        logging.info(f'Station Position lon, lat, alt = {station}')
+
+    # Anflugkorridore / Polygone statt nur der Kreise um die Station
+    zones = None
+    zones_file = os.environ.get('ZONES_FILE')
+    if zones_file:
+        try:
+            zones = ZoneIndex.load(zones_file)
+        except (OSError, ValueError, KeyError) as e:
+            logging.error(f'cannot load zones from {zones_file}: {e}')
+            exit(1)
+        logging.info(f'{len(zones.zones)} zones from {zones_file}: {[z.name for z in zones.zones]}')
+
+    stats_interval = int(os.environ.get('STATS_INTERVAL', 600))
+    spool_dir = os.environ.get('EVENT_SPOOL_DIR', '/var/lib/detect_flyover/spool')
+    spool_max_mb = float(os.environ.get('EVENT_SPOOL_MAX_MB', 4))
+    write_retries = int(os.environ.get('EVENT_WRITE_RETRIES', 3))
+    quarantine = os.environ.get('EVENT_QUARANTINE_FILE', '/var/lib/detect_flyover/rejected.lp')
+    workers = int(os.environ.get('FLYOVER_WORKERS', 1))
+
+    # Events gehen an einen Writer-Thread: ein langsames oder neu startendes
+    # InfluxDB haelt das Einlesen von dump1090 nicht mehr an. Fehlgeschlagene
+    # Writes werden write_retries mal mit Backoff wiederholt und landen dann
+    # im Spool auf Disk, von dort nach erfolgreichem ping() nachgeschrieben.
+    # Ein von InfluxDB abgelehntes Event (4xx) ist kein Ausfall: es geht nach
+    # EVENT_QUARANTINE_FILE und haelt die folgenden Events nicht auf.
+    influx_host, influx_port = args['INFLUXDB_SERVER'].split(':')
+    influx_client = InfluxDBClient(host=influx_host, port=int(influx_port),
+                                   username=args['INFLUXDB_USERNAME'], password=args['INFLUXDB_PASSWORD'])
+    influx_client.switch_database(args['INFLUXDB_DATABASE'])
+    spool = None
+    if spool_dir:
+        try:
+            spool = SegmentSpool(spool_dir, segment_bytes=256 * 1024,
+                                 max_bytes=int(spool_max_mb * 1024 * 1024))
+        except OSError as e:
+            logging.error(f'cannot open event spool {spool_dir}, spooling disabled: {e}')
+    writer = BatchedInfluxWriter(influx_client, batch_size=50, flush_interval=1.0,
+                                 database=args['INFLUXDB_DATABASE'], spool=spool,
+                                 retries=write_retries, track_latency=True,
+                                 quarantine=quarantine or None)
+    writer.start()
+    logging.info(f'influxdb event writer for database "{args["INFLUXDB_DATABASE"]}" ({args["INFLUXDB_SERVER"]})')
 
-lon_lat_alt = [float(x) for x in args['STATION_POSITION'].split(':')]
-logging.info(f'Station Position lon, lat, alt = {lon_lat_alt}')
+    # Pegel aus dem Noise-Topic: event_raw bekommt LAmax / SEL / t10 direkt
+    # aus dem Ringpuffer, Grafana muss nicht mehr mit spl joinen
+    enricher = None
+    noise_client = None
+    if os.environ.get('MQTT_SERVER'):
+        from paho.mqtt import client as mqtt
+        # ein Mikrofon pro Home: NOISE_TOPICS ordnet jedem Home sein Topic zu,
+        # Pegel verschiedener Mikrofone duerfen nicht im selben Puffer landen
+        if isinstance(station[0], (int, float)):
+            noise_routes = [(None, os.environ.get('NOISE_TOPIC', 'dfld/sensors/noise/spl/#'))]
+        else:
+            homes = [name for name, _, _, _ in station]
+            spec = os.environ.get('NOISE_TOPICS') or ','.join(f'{h}=dfld/sensors/noise/spl/{h}' for h in homes)
+            try:
+                noise_routes = parse_noise_topics(spec, homes)
+            except ValueError as e:
+                logging.error(f'NOISE_TOPICS: {e}')
+                exit(1)
+        seconds = int(float(os.environ.get('NOISE_BUFFER_MINUTES', 10)) * 60)
+        noise_buffers = {home: NoiseBuffer(seconds=seconds) for home, _ in noise_routes}
+        enricher = NoiseEnricher(writer, noise_buffers,
+                                 before=float(os.environ.get('NOISE_WINDOW_BEFORE', 60)),
+                                 after=float(os.environ.get('NOISE_WINDOW_AFTER', 30)))
+        enricher.start()
+
+        def on_connect(cli, userdata, flags, reason_code, properties):
+            rc = reason_code.value if hasattr(reason_code, 'value') else reason_code
+            logging.info(f"MQTT connected: {'ok' if rc == 0 else f'rc={rc}'}")
+            if rc == 0:
+                for _, topic in noise_routes:
+                    cli.subscribe(topic)
+
+        def on_message(cli, userdata, msg):
+            sample = noise_sample(msg.payload)
+            if sample is None:
+                return
+            for home, topic in noise_routes:
+                if mqtt.topic_matches_sub(topic, msg.topic):
+                    noise_buffers[home].add(*sample)
+                    return
+
+        noise_client = mqtt.Client(callback_api_version=mqtt.CallbackAPIVersion.VERSION2,
+                                   client_id=f'detect_flyover-{os.getpid()}', clean_session=True,
+                                   protocol=mqtt.MQTTv311)
+        noise_client.reconnect_delay_set(min_delay=1, max_delay=30)
+        noise_client.on_connect = on_connect
+        noise_client.on_message = on_message
+        mqtt_host, _, mqtt_port = os.environ['MQTT_SERVER'].partition(':')
+        noise_client.connect_async(mqtt_host, int(mqtt_port or 1883))
+        noise_client.loop_start()
+        logging.info(f'noise enrichment from {noise_routes} ({os.environ["MQTT_SERVER"]}), '
+                     f'{seconds} s ring buffer per home')
+    event_writer = enricher if enricher is not None else writer
 
-# active plane trajectories
-traj_pool = TrajectoryPool(lon_lat_alt)
+    # active plane trajectories
+    traj_pool = router = None
+    if workers > 1:
+        # multi-process mode: this process only reads and routes lines, the
+        # trajectories live in the workers
+        router = ShardRouter(workers, station, event_writer, log_level=level, zones=zones)
+        logging.info(f'{workers} worker processes, lines sharded by ICAO hex id, station {station}')
+    else:
+        traj_pool = make_pool(station, zones=zones)
+        traj_pool.set_writer(event_writer)
+        for pool in getattr(traj_pool, 'pools', [traj_pool]):
+            logging.info(f'Active range bounding box lon/lat = {pool.box}')
+    last_stats_log = time.time()
+
+    def log_stats():
+        st = router.stats() if router is not None else traj_pool.stats()
+        ws = writer.stats(reset=True)
+        shards = f", shard_lines={st['shard_lines']}, shard_restarts={st['restarts']}" if router is not None else ''
+        noise = ''
+        if enricher is not None:
+            es = enricher.stats(reset=True)
+            noise = (f", noise_enriched={es['enriched']}, noise_missing={es['no_noise']}, "
+                     f"noise_pending={es['pending']}, noise_samples={es['noise_samples']}, "
+                     f"noise_hold_ms_avg={es['hold_ms_avg']:.0f}, noise_hold_ms_max={es['hold_ms_max']:.0f}")
+        logging.info(f"Stats: aircraft={st['aircraft']}, positions={st['positions']}, "
+                     f"box_rejected={st['box_rejected']}, reject_ratio={st['reject_ratio']:.3f}, "
+                     f"events_written={ws['written']}, events_failed={ws['failed']}, events_rejected={ws['rejected']}, "
+                     f"events_spooled={ws.get('spooled', 0)}, retried={ws.get('retried', 0)}, "
+                     f"event_latency_ms_avg={ws['latency_ms_avg']:.0f}, event_latency_ms_max={ws['latency_ms_max']:.0f}, "
+                     f"predicted={st['predicted']}, pred_false={st['pred_false']}, "
+                     f"pred_t0_err_avg={st['pred_t0_err_avg']:.1f}, pred_dist_xy_err_avg={st['pred_dist_xy_err_avg']:.0f}, "
+                     f"pred_dist_z_err_avg={st['pred_dist_z_err_avg']:.0f}, "
+                     f"zone_rejected={st['zone_rejected']}, zone_events={st['zone_events']}{shards}{noise}")
+
+    # docker stop sends SIGTERM: flush / spool queued events before exiting
+    def handle_sigterm(*_):
+        raise KeyboardInterrupt
+    signal.signal(signal.SIGTERM, handle_sigterm)
 
-while True:
     try:
-        # create connection to influxdb
-        influx_host, influx_port = args['INFLUXDB_SERVER'].split(':')
-        logging.info(f'connecting to influxdb ({args["INFLUXDB_SERVER"]})...')
-        influx_client = InfluxDBClient(host=influx_host, port=int(influx_port),
-                                       username=args['INFLUXDB_USERNAME'], password=args['INFLUXDB_PASSWORD'])
-        influx_client.switch_database(args['INFLUXDB_DATABASE'])
-        traj_pool.set_influx_client(influx_client, args['INFLUXDB_DATABASE'])
-        logging.info(f'connected to influxdb database "{args["INFLUXDB_DATABASE"]}"')
-
-        # connect to dump1090 process and loop over lines
-        logging.info(f'connecting to dump1090 server ({args["DUMP1090_SERVER"]})...')
-        s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        dump1090_server = args['DUMP1090_SERVER'].split(':')
-        s.connect((dump1090_server[0], int(dump1090_server[1])))
-        logging.info(f'connection established.')
-
-        with s.makefile('r') as f:
-            for line in f:
-                # parse line as json
-                try:
-                    data = json.loads(line)
-                except:
-                    continue
-                # sample data: {"now" : 1742043492.321,"hex":"3c4594","type":"adsb_icao","flight":"BOX457  ","r":"D-AALT","t":"B77L",
-                #               "desc":"BOEING 777-200LR","alt_baro":3700,"alt_geom":3825,"gs":176.3,"ias":186,"tas":194,"mach":0.300,
-                #               "wd":78,"ws":18,"track":69.41,"roll":1.58,"mag_heading":65.21,"true_heading":68.67,"baro_rate":-1152,
-                #               "geom_rate":-1152,"squawk":"1162","emergency":"none","category":"A5","nav_qnh":1014.4,"nav_altitude_mcp":4992,
-                #               "nav_heading":66.09,"lat":49.982300,"lon":8.269290,"nic":8,"rc":186,"seen_pos":0.000,"r_dst":0.449,"r_dir":226.2,
-                #               "version":2,"nic_baro":1,"nac_p":10,"nac_v":2,"sil":3,"sil_type":"perhour","gva":2,"sda":2,"alert":0,"spi":0,
-                #               "mlat":[],"tisb":[],"messages":405,"seen":0.0,"rssi":-17.1}
-                logging.debug(f'data read: {data}')
-
-                # update trajectory pool
-                traj_pool.update(data)
-
-    except Exception as e:
-        logging.error(f'exception: {e}')
-        logging.error(f'traceback: {traceback.print_tb(e.__traceback__)}')
-    time.sleep(1.)
+        while True:
+            try:
+                # connect to dump1090 process and loop over lines
+                logging.info(f'connecting to dump1090 server ({args["DUMP1090_SERVER"]})...')
+                s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+                dump1090_server = args['DUMP1090_SERVER'].split(':')
+                s.connect((dump1090_server[0], int(dump1090_server[1])))
+                logging.info(f'connection established.')
+
+                with s.makefile('r') as f:
+                    for line in f:
+                        if router is not None:
+                            router.feed(line)
+                            if time.time() - last_stats_log > stats_interval:
+                                log_stats()
+                                last_stats_log = time.time()
+                            continue
+
+                        # parse line as json
+                        try:
+                            data = json.loads(line)
+                        except:
+                            continue
+                        # sample data: {"now" : 1742043492.321,"hex":"3c4594","type":"adsb_icao","flight":"BOX457  ","r":"D-AALT","t":"B77L",
+                        #               "desc":"BOEING 777-200LR","alt_baro":3700,"alt_geom":3825,"gs":176.3,"ias":186,"tas":194,"mach":0.300,
+                        #               "wd":78,"ws":18,"track":69.41,"roll":1.58,"mag_heading":65.21,"true_heading":68.67,"baro_rate":-1152,
+                        #               "geom_rate":-1152,"squawk":"1162","emergency":"none","category":"A5","nav_qnh":1014.4,"nav_altitude_mcp":4992,
+                        #               "nav_heading":66.09,"lat":49.982300,"lon":8.269290,"nic":8,"rc":186,"seen_pos":0.000,"r_dst":0.449,"r_dir":226.2,
+                        #               "version":2,"nic_baro":1,"nac_p":10,"nac_v":2,"sil":3,"sil_type":"perhour","gva":2,"sda":2,"alert":0,"spi":0,
+                        #               "mlat":[],"tisb":[],"messages":405,"seen":0.0,"rssi":-17.1}
+                        logging.debug(f'data read: {data}')
+
+                        # update trajectory pool
+                        traj_pool.update(data)
+
+                        if time.time() - last_stats_log > stats_interval:
+                            log_stats()
+                            last_stats_log = time.time()
+
+            except Exception as e:
+                logging.error(f'exception: {e}')
+                logging.error(f'traceback: {traceback.print_tb(e.__traceback__)}')
+            time.sleep(1.)
+    except KeyboardInterrupt:
+        logging.info('shutting down')
+    finally:
+        if router is not None:
+            router.close(timeout=10)
+        if enricher is not None:
+            noise_client.loop_stop()
+            enricher.close(timeout=10)
+        writer.close(timeout=10)
+
+
+if __name__ == '__main__':
+    main()
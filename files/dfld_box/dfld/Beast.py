@@ -0,0 +1,249 @@
+import sys
+import logging
+
+ESC = 0x1a
+
+# Beast message payload lengths by type (without 6 byte MLAT timestamp and signal level)
+BEAST_LENGTHS = {
+    0x31: 2,   # Mode-AC
+    0x32: 7,   # Mode-S Short
+    0x33: 14,  # Mode-S Long
+    0x34: 1    # Signal Level
+}
+
+
+class BeastDecoder(object):
+    """
+    Inkrementeller Decoder fuer den Beast-Binary-Stream (readsb/ultrafeeder Port 30005).
+
+    Der Socket schreibt per recv_into() direkt in einen wiederverwendeten
+    bytearray-Puffer; ein am Ende eines Reads abgeschnittener Frame bleibt
+    im Puffer und wird mit dem naechsten Read vervollstaendigt. Innerhalb
+    eines Frames ist 0x1a als 0x1a 0x1a escaped, geliefert wird der
+    unescapte Frame: 0x1a, Typ, 6 Byte Timestamp, Signal, Payload.
+
+    Frames ohne Escape im Body (der Normalfall) werden mit einer einzigen
+    Slice-Kopie erzeugt. Ein 0x1a mit nachfolgendem Nicht-0x1a im Body
+    bedeutet verlorene Synchronisation: der Frame wird verworfen und am
+    neuen Frame-Start weitergemacht (resyncs / dropped_bytes).
+    """
+
+    def __init__(self, buffer_size=65536):
+        self.client_name = sys.argv[0].split('/')[-1].replace('.py', '')
+        self.logger = logging.getLogger(self.client_name)
+
+        self._buf = bytearray(buffer_size)
+        self._view = memoryview(self._buf)
+        self._end = 0
+
+        # counters
+        self.bytes_in = 0
+        self.frames = 0
+        self.resyncs = 0
+        self.dropped_bytes = 0
+
+    def reset(self):
+        """Discard buffered bytes, e.g. after a reconnect (a partial frame must not be joined to the new stream)."""
+        self.dropped_bytes += self._end
+        self._end = 0
+
+    def recv_into(self, sock):
+        """
+        read from a socket into the free part of the buffer
+        :return: number of bytes read, 0 if the peer closed the connection
+        """
+        if self._end == len(self._buf):
+            # only garbage without any frame start can fill the buffer
+            self.reset()
+        n = sock.recv_into(self._view[self._end:])
+        self._end += n
+        self.bytes_in += n
+        return n
+
+    def feed(self, data):
+        """Append bytes (e.g. from a recorded capture) and return the decoded frames."""
+        frames = []
+        data = memoryview(data)
+        while len(data):
+            if self._end == len(self._buf):
+                self.reset()
+            n = min(len(data), len(self._buf) - self._end)
+            self._view[self._end:self._end + n] = data[:n]
+            self._end += n
+            self.bytes_in += n
+            data = data[n:]
+            frames += self.decode()
+        return frames
+
+    def decode(self):
+        """
+        decode all complete frames in the buffer
+        :return: list of unescaped frames (bytes); an incomplete tail stays buffered
+        """
+        buf = self._buf
+        view = self._view
+        end = self._end
+        frames = []
+        pos = 0
+        while True:
+            start = buf.find(ESC, pos, end)
+            if start < 0:
+                self.dropped_bytes += end - pos
+                pos = end
+                break
+            if start > pos:
+                self.dropped_bytes += start - pos
+                pos = start
+            if start + 1 >= end:
+                break  # need the type byte
+            body_len = BEAST_LENGTHS.get(buf[start + 1])
+            if body_len is None:
+                # 0x1a 0x1a outside a frame or unknown type: not a frame start
+                self.resyncs += 1
+                self.dropped_bytes += 1
+                pos = start + 1
+                continue
+            body_len += 7  # MLAT timestamp and signal level
+            body = start + 2
+            esc = buf.find(ESC, body, min(body + body_len, end))
+            if esc < 0:
+                # fast path, no escape inside the body
+                if body + body_len > end:
+                    break
+                frames.append(bytes(view[start:body + body_len]))
+                pos = body + body_len
+                continue
+            frame, pos = self._unescape(start, body_len)
+            if frame is None:
+                if pos == start:
+                    break  # incomplete
+                # lost sync: restart at the new frame start
+                self.resyncs += 1
+                self.dropped_bytes += pos - start
+                continue
+            frames.append(frame)
+
+        # keep the incomplete tail at the start of the buffer
+        rest = end - pos
+        if rest and pos:
+            view[:rest] = view[pos:end]
+        self._end = rest
+        self.frames += len(frames)
+        return frames
+
+    def _unescape(self, start, body_len):
+        """
+        slow path for a body containing 0x1a 0x1a
+        :return: (frame, next position), (None, start) if incomplete,
+                 (None, position of the new frame start) if out of sync
+        """
+        buf = self._buf
+        view = self._view
+        end = self._end
+        out = bytearray(view[start:start + 2])
+        i = start + 2
+        need = body_len
+        while need:
+            j = buf.find(ESC, i, min(i + need, end))
+            if j < 0:
+                if i + need > end:
+                    return None, start
+                out += view[i:i + need]
+                i += need
+                break
+            out += view[i:j]
+            need -= j - i
+            if j + 1 >= end:
+                return None, start
+            if buf[j + 1] != ESC:
+                return None, j
+            out.append(ESC)
+            need -= 1
+            i = j + 2
+        return bytes(out), i
+
+    def stats(self):
+        return {
+            'bytes_in': self.bytes_in,
+            'frames': self.frames,
+            'resyncs': self.resyncs,
+            'dropped_bytes': self.dropped_bytes,
+        }
+
+
+def escape_frame(frame):
+    """Re-escape an unescaped frame for the Beast wire format (0x1a in the body as 0x1a 0x1a)."""
+    return frame[:2] + frame[2:].replace(b'\x1a', b'\x1a\x1a')
+
+
+# Binary batch payload (adsb2mqtt ADSB_PUBLISH_MODE=binary):
+#
+#     offset  size  content
+#     0       3     magic b'DFB'
+#     3       1     version (1)
+#     4       1     station id length s
+#     5       s     station id, UTF-8
+#     5+s     2     frame count n (uint16, big endian)
+#     7+s     8     arrival time of the first frame, unix ms (uint64, big endian)
+#     15+s    ...   n frames: type byte, then the unescaped body
+#                   (6 byte MLAT timestamp, signal level, payload);
+#                   the body length follows from the type (BEAST_LENGTHS + 7)
+#
+# The 0x1a frame marker is not transmitted, unpack_batch() restores it.
+BATCH_MAGIC = b'DFB'
+BATCH_VERSION = 1
+BATCH_MAX_FRAMES = 0xffff
+
+
+def pack_batch(station, frames, t0):
+    """
+    pack unescaped frames into one binary payload
+    :param station: station id
+    :param frames: list of frames as returned by BeastDecoder.decode() (at most BATCH_MAX_FRAMES)
+    :param t0: arrival unix time of the first frame in seconds
+    :return: payload bytes
+    """
+    if len(frames) > BATCH_MAX_FRAMES:
+        raise ValueError(f'at most {BATCH_MAX_FRAMES} frames per batch, got {len(frames)}')
+    station = station.encode('utf-8')
+    out = bytearray(BATCH_MAGIC)
+    out.append(BATCH_VERSION)
+    out.append(len(station))
+    out += station
+    out += len(frames).to_bytes(2, 'big')
+    out += int(t0 * 1000).to_bytes(8, 'big')
+    for frame in frames:
+        out += memoryview(frame)[1:]
+    return bytes(out)
+
+
+def unpack_batch(data):
+    """
+    decode a binary batch payload (reference decoder)
+    :param data: payload bytes
+    :return: (station, t0 unix seconds, list of frames incl. leading 0x1a)
+    :raises ValueError: if data is not a valid batch
+    """
+    if len(data) < 5 or data[:3] != BATCH_MAGIC or data[3] != BATCH_VERSION:
+        raise ValueError('not a Beast batch payload')
+    s = data[4]
+    offset = 5 + s
+    if len(data) < offset + 10:
+        raise ValueError('Beast batch truncated')
+    station = bytes(data[5:offset]).decode('utf-8')
+    count = int.from_bytes(data[offset:offset + 2], 'big')
+    t0 = int.from_bytes(data[offset + 2:offset + 10], 'big') / 1000.0
+    offset += 10
+    frames = []
+    for _ in range(count):
+        body_len = BEAST_LENGTHS.get(data[offset]) if offset < len(data) else None
+        if body_len is None:
+            raise ValueError(f'invalid frame type at offset {offset}')
+        end = offset + 8 + body_len
+        if end > len(data):
+            raise ValueError('Beast batch truncated')
+        frames.append(b'\x1a' + bytes(data[offset:end]))
+        offset = end
+    if offset != len(data):
+        raise ValueError(f'{len(data) - offset} trailing bytes after {count} frames')
+    return station, t0, frames
@@ -0,0 +1,104 @@
+"""
+Envelope-Format fuer gebuendelte MQTT-Uplinks (mqtt2mqtt Envelope-Mode).
+
+Ein Envelope fasst alle Nachrichten eines Latenz-Fensters einer Mapping
+zu einem einzigen Remote-Publish zusammen:
+
+    offset  size  content
+    0       3     magic b'DFE'
+    3       1     version (1)
+    4       1     codec (0 = none, 1 = zlib, 2 = gzip)
+    5       2     header length n (uint16, big endian)
+    7       n     header, UTF-8 JSON (unkomprimiert):
+                  {"topics": [...], "counts": [...], "t0": <unix s>, "t1": <unix s>}
+    7+n     ...   body, mit codec komprimiert: pro Nachricht in
+                  Ankunftsreihenfolge  <uint16 topic index><uint32 length><payload>
+
+Der Header ist unkomprimiert, damit die Gegenseite Topics und Anzahl
+ohne Dekompression sieht. unpack_envelope() ist die Referenz-Implementierung
+fuer die Zentrale bzw. den lokalen Stand-in envelope2mqtt.py.
+"""
+import gzip
+import json
+import zlib
+import struct
+
+MAGIC = b'DFE'
+VERSION = 1
+CODECS = {'none': 0, 'zlib': 1, 'gzip': 2}
+
+_PREFIX = struct.Struct('>3sBBH')
+_RECORD = struct.Struct('>HI')
+
+
+def pack_envelope(messages, codec='zlib', level=6):
+    """
+    pack messages into one envelope
+    :param messages: list of (topic, payload bytes, arrival unix time)
+    :param codec: 'none', 'zlib' or 'gzip'
+    :param level: compression level
+    :return: envelope bytes
+    """
+    topic_index = {}
+    topics = []
+    counts = []
+    body = bytearray()
+    for topic, payload, _ in messages:
+        idx = topic_index.get(topic)
+        if idx is None:
+            idx = topic_index[topic] = len(topics)
+            topics.append(topic)
+            counts.append(0)
+        counts[idx] += 1
+        body += _RECORD.pack(idx, len(payload))
+        body += payload
+
+    if codec == 'zlib':
+        body = zlib.compress(bytes(body), level)
+    elif codec == 'gzip':
+        body = gzip.compress(bytes(body), compresslevel=level, mtime=0)
+    elif codec != 'none':
+        raise ValueError(f'unknown envelope codec "{codec}"')
+
+    header = json.dumps({
+        'topics': topics,
+        'counts': counts,
+        't0': messages[0][2] if messages else None,
+        't1': messages[-1][2] if messages else None,
+    }, separators=(',', ':')).encode('utf-8')
+    return _PREFIX.pack(MAGIC, VERSION, CODECS[codec], len(header)) + header + bytes(body)
+
+
+def unpack_envelope(data):
+    """
+    expand an envelope (reference unpacker)
+    :param data: envelope bytes
+    :return: (header dict, list of (topic, payload bytes) in arrival order)
+    :raises ValueError: if data is not a valid envelope
+    """
+    if len(data) < _PREFIX.size:
+        raise ValueError('envelope too short')
+    magic, version, codec, header_len = _PREFIX.unpack_from(data, 0)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError(f'not an envelope (magic={magic!r}, version={version})')
+    offset = _PREFIX.size
+    header = json.loads(bytes(data[offset:offset + header_len]).decode('utf-8'))
+    body = bytes(data[offset + header_len:])
+    if codec == CODECS['zlib']:
+        body = zlib.decompress(body)
+    elif codec == CODECS['gzip']:
+        body = gzip.decompress(body)
+    elif codec != CODECS['none']:
+        raise ValueError(f'unknown envelope codec {codec}')
+
+    topics = header['topics']
+    messages = []
+    offset = 0
+    while offset < len(body):
+        idx, length = _RECORD.unpack_from(body, offset)
+        offset += _RECORD.size
+        messages.append((topics[idx], body[offset:offset + length]))
+        offset += length
+    if len(messages) != sum(header['counts']):
+        raise ValueError(f'envelope holds {len(messages)} messages, header announces {sum(header["counts"])}')
+    return header, messages
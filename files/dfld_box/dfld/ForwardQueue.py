@@ -0,0 +1,129 @@
+import sys
+import logging
+import threading
+from collections import deque
+
+
+class ForwardQueue(object):
+    """
+    Begrenzte Store-and-Forward-Queue: zuerst im Speicher, bei vollem
+    Speicher wird der komplette Speicherinhalt an einen SegmentSpool auf
+    Disk angehaengt. Reihenfolge bleibt FIFO: Disk enthaelt immer die
+    aelteren Records, entleert wird deshalb erst der Spool, dann der
+    Speicher.
+
+    Ein einzelner Consumer holt Records mit take() und bestaetigt sie mit
+    done(); nicht zugestellte Records gehen dabei wieder an den Kopf.
+    Records aus dem Spool bleiben dort bis zum commit(), werden also nur
+    einmal gezaehlt; aus dem Speicher entnommene und noch nicht bestaetigte
+    Records schreibt ein Ueberlauf oder close() vor dem Speicherinhalt in
+    den Spool, done() bestaetigt sie dann dort. Ohne Spool wird bei vollem
+    Speicher der aelteste Record verworfen.
+    """
+
+    def __init__(self, max_memory=5000, spool=None):
+        self.max_memory = max_memory
+        self.spool = spool
+
+        self.client_name = sys.argv[0].split('/')[-1].replace('.py', '')
+        self.logger = logging.getLogger(self.client_name)
+
+        self._lock = threading.Lock()
+        self._memory = deque()
+        self._in_flight = []  # records of the last take() from memory, not yet acked
+        self._spilled = None  # the same list after a spill moved it to the head of the spool
+
+        # counters
+        self.queued = 0
+        self.dropped = 0
+        self.bytes_spooled = 0
+
+    def __len__(self):
+        with self._lock:
+            n = len(self._memory) + len(self._in_flight)
+            if self.spool is not None:
+                n += self.spool.records
+            return n
+
+    def put(self, record):
+        """Append a bytes record at the tail."""
+        with self._lock:
+            if len(self._memory) >= self.max_memory:
+                self._make_room()
+            self._memory.append(record)
+            self.queued += 1
+
+    def _make_room(self):
+        if self.spool is None:
+            self._memory.popleft()
+            self.dropped += 1
+            return
+        # a take() from memory implies an empty spool, records in flight are
+        # older than the memory and go first
+        records = self._in_flight + list(self._memory)
+        try:
+            self.spool.append(records)
+            self.bytes_spooled += sum(len(r) for r in records)
+            self.logger.debug(f"{len(records)} queued records spilled to disk")
+            if self._in_flight:
+                self._spilled, self._in_flight = self._in_flight, []
+        except OSError as e:
+            self.dropped += len(self._memory)
+            self.logger.error(f"Failed to spill {len(self._memory)} records to disk: {e}")
+        self._memory.clear()
+
+    def take(self, n):
+        """Return (records, source) with up to n records from the head."""
+        with self._lock:
+            if self.spool is not None and self.spool.records:
+                # stay in the spool until done(), counted there
+                records = self.spool.read(n)
+                source = 'spool'
+            else:
+                records = [self._memory.popleft() for _ in range(min(n, len(self._memory)))]
+                source = 'memory'
+                self._in_flight = records
+            return records, source
+
+    def done(self, records, source, delivered):
+        """Acknowledge the first `delivered` records of the last take()."""
+        with self._lock:
+            if source == 'spool':
+                self.spool.commit(delivered)
+            elif records is self._spilled:
+                # moved to the head of the spool while being published
+                self._spilled = None
+                self.spool.read(delivered)  # commit() works on the records read
+                self.spool.commit(delivered)
+            elif records is self._in_flight:
+                # otherwise close() has already persisted them
+                self._in_flight = []
+                for record in reversed(records[delivered:]):
+                    self._memory.appendleft(record)
+
+    def stats(self):
+        res = {
+            'queue': len(self),
+            'queue_memory': len(self._memory),
+            'queued': self.queued,
+            'dropped': self.dropped,
+            'bytes_spooled': self.bytes_spooled,
+        }
+        if self.spool is not None:
+            res['spool_records'] = self.spool.records
+            res['spool_bytes'] = self.spool.bytes
+            res['dropped'] += self.spool.dropped
+        return res
+
+    def close(self):
+        """Persist records still held in memory so they survive a restart."""
+        with self._lock:
+            if self.spool is None:
+                return
+            records = self._in_flight + list(self._memory)
+            if records:
+                self.spool.append(records)
+                self._memory.clear()
+            self._in_flight = []
+            self._spilled = None
+            self.spool.close()
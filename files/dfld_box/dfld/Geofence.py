@@ -0,0 +1,119 @@
+import json
+import math
+
+METERS_PER_DEG = 111195.0  # meters per degree latitude on the spherical earth (6371 km)
+
+
+class Zone(object):
+    """
+    Flugzone als Polygon in lon/lat mit Hoehenband (Meter ueber NN).
+
+    Fuer die Groesse von Anflugkorridoren (einige km) reicht der
+    Punkt-in-Polygon-Test direkt in Grad; Korridore werden beim Laden in
+    ein Rechteck um die Mittellinie umgerechnet.
+    """
+    __slots__ = ('name', 'polygon', 'alt_min', 'alt_max', 'box')
+
+    def __init__(self, name, polygon, alt_min=None, alt_max=None):
+        if len(polygon) < 3:
+            raise ValueError(f'zone {name}: polygon needs at least 3 points')
+        self.name = name
+        self.polygon = [(float(lon), float(lat)) for lon, lat in polygon]
+        self.alt_min = alt_min
+        self.alt_max = alt_max
+        lons = [p[0] for p in self.polygon]
+        lats = [p[1] for p in self.polygon]
+        self.box = (min(lons), max(lons), min(lats), max(lats))
+
+    @classmethod
+    def corridor(cls, name, start, end, width, alt_min=None, alt_max=None):
+        """
+        rectangle of +-width/2 meters around the centerline start -> end
+        :param start: (lon, lat), e.g. runway threshold
+        :param end: (lon, lat), e.g. end of the approach
+        """
+        lat_m = math.radians((start[1] + end[1]) / 2)
+        kx = METERS_PER_DEG * math.cos(lat_m)  # meters per degree longitude
+        dx = (end[0] - start[0]) * kx
+        dy = (end[1] - start[1]) * METERS_PER_DEG
+        length = math.hypot(dx, dy)
+        if length == 0:
+            raise ValueError(f'zone {name}: corridor start and end are identical')
+        # normal to the centerline, half width in degrees
+        nx = -dy / length * width / 2 / kx
+        ny = dx / length * width / 2 / METERS_PER_DEG
+        polygon = [(start[0] + nx, start[1] + ny), (end[0] + nx, end[1] + ny),
+                   (end[0] - nx, end[1] - ny), (start[0] - nx, start[1] - ny)]
+        return cls(name, polygon, alt_min=alt_min, alt_max=alt_max)
+
+    def contains(self, lon, lat, alt=None):
+        if alt is not None:
+            if self.alt_min is not None and alt < self.alt_min:
+                return False
+            if self.alt_max is not None and alt > self.alt_max:
+                return False
+        lon_min, lon_max, lat_min, lat_max = self.box
+        if not (lon_min <= lon <= lon_max and lat_min <= lat <= lat_max):
+            return False
+        # ray casting
+        inside = False
+        polygon = self.polygon
+        x1, y1 = polygon[-1]
+        for x2, y2 in polygon:
+            if (y1 > lat) != (y2 > lat) and lon < x1 + (lat - y1) * (x2 - x1) / (y2 - y1):
+                inside = not inside
+            x1, y1 = x2, y2
+        return inside
+
+
+class ZoneIndex(object):
+    """
+    Gitter-Index ueber die Zonen: jede Zelle (cell_deg Grad) kennt die
+    Zonen, deren Bounding-Box sie beruehrt. Ein Punkt wird nur gegen die
+    Zonen seiner Zelle getestet, unabhaengig von der Gesamtzahl der Zonen.
+    """
+
+    def __init__(self, zones, cell_deg=0.05):
+        self.zones = list(zones)
+        names = [z.name for z in self.zones]
+        if len(set(names)) != len(names):
+            raise ValueError('duplicate zone names')
+        self.cell_deg = cell_deg
+        self.cells = {}
+        for zone in self.zones:
+            lon_min, lon_max, lat_min, lat_max = zone.box
+            for i in range(math.floor(lat_min / cell_deg), math.floor(lat_max / cell_deg) + 1):
+                for j in range(math.floor(lon_min / cell_deg), math.floor(lon_max / cell_deg) + 1):
+                    self.cells[(i, j)] = self.cells.get((i, j), ()) + (zone,)
+
+    def lookup(self, lon, lat, alt=None):
+        """:return: zones containing the point, empty tuple if none"""
+        candidates = self.cells.get((math.floor(lat / self.cell_deg), math.floor(lon / self.cell_deg)))
+        if not candidates:
+            return ()
+        return tuple(z for z in candidates if z.contains(lon, lat, alt))
+
+    @classmethod
+    def from_config(cls, config):
+        """
+        :param config: list of zones, altitudes in meters above sea level, width in meters:
+            {"name": "...", "polygon": [[lon, lat], ...], "alt_min": 0, "alt_max": 1500}
+            {"name": "...", "corridor": [[lon, lat], [lon, lat]], "width": 1000, "alt_max": 1200}
+        """
+        zones = []
+        for item in config:
+            name = item['name']
+            if 'corridor' in item:
+                start, end = item['corridor']
+                zones.append(Zone.corridor(name, start, end, float(item['width']),
+                                           alt_min=item.get('alt_min'), alt_max=item.get('alt_max')))
+            elif 'polygon' in item:
+                zones.append(Zone(name, item['polygon'], alt_min=item.get('alt_min'), alt_max=item.get('alt_max')))
+            else:
+                raise ValueError(f'zone {name}: neither polygon nor corridor')
+        return cls(zones)
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as f:
+            return cls.from_config(json.load(f))
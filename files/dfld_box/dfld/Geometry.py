@@ -0,0 +1,74 @@
+import math
+
+EARTH_RADIUS = 6371000  # earth radius in meters (spherical earth, as in detect_flyover)
+
+
+class LocalFrame(object):
+    """
+    Stations-zentriertes East-North-Up-Koordinatensystem auf der Kugelerde.
+
+    Das ENU-System ist nur eine Drehung des erdfesten XYZ-Systems um die
+    Station, Abstaende sind also identisch zur bisherigen Rechnung mit
+    xyz()-Differenzen. sin/cos der Stationsbreite werden einmal berechnet,
+    pro Punkt bleiben vier Trig-Aufrufe und reine Float-Arithmetik ohne
+    numpy-Arrays.
+    """
+    __slots__ = ('lon0', 'lat0', 'alt0', 'r0', 'earth_radius', '_lon0', '_sin_lat0', '_cos_lat0')
+
+    def __init__(self, lon, lat, alt, earth_radius=EARTH_RADIUS):
+        self.lon0 = lon
+        self.lat0 = lat
+        self.alt0 = alt
+        self.earth_radius = earth_radius
+        self.r0 = earth_radius + alt
+        self._lon0 = math.radians(lon)
+        lat0 = math.radians(lat)
+        self._sin_lat0 = math.sin(lat0)
+        self._cos_lat0 = math.cos(lat0)
+
+    def unit(self, lon, lat):
+        """direction of (lon, lat) from the earth centre, in ENU axes of the station"""
+        lat = math.radians(lat)
+        dlon = math.radians(lon) - self._lon0
+        sin_lat = math.sin(lat)
+        cos_lat = math.cos(lat)
+        cos_dlon = math.cos(dlon)
+        return (cos_lat * math.sin(dlon),
+                sin_lat * self._cos_lat0 - cos_lat * self._sin_lat0 * cos_dlon,
+                sin_lat * self._sin_lat0 + cos_lat * self._cos_lat0 * cos_dlon)
+
+    def enu(self, lon, lat, alt):
+        """position relative to the station in meters (east, north, up)"""
+        ue, un, uu = self.unit(lon, lat)
+        r = self.earth_radius + alt
+        return r * ue, r * un, r * uu - self.r0
+
+    def project(self, lon, lat, alt):
+        """
+        :return: (enu position, dist_xy) where dist_xy is the distance of (lon, lat) at
+                 station altitude, i.e. the horizontal distance used for the active range
+        """
+        ue, un, uu = self.unit(lon, lat)
+        r = self.earth_radius + alt
+        dist_xy = self.r0 * math.sqrt(ue * ue + un * un + (uu - 1.0) * (uu - 1.0))
+        return (r * ue, r * un, r * uu - self.r0), dist_xy
+
+
+def norm(v):
+    return math.sqrt(v[0] * v[0] + v[1] * v[1] + v[2] * v[2])
+
+
+def closest_approach(v0, v1):
+    """
+    closest point to the station (origin) on the line through v0 and v1
+    :return: (lambda_, dist_0) with v0 + lambda_ * (v1 - v0) the closest point;
+             (1e9, 1e9) if v0 == v1
+    """
+    dx = v1[0] - v0[0]
+    dy = v1[1] - v0[1]
+    dz = v1[2] - v0[2]
+    dd = dx * dx + dy * dy + dz * dz
+    if dd == 0.0:
+        return 1e9, 1e9
+    lambda_ = -(v0[0] * dx + v0[1] * dy + v0[2] * dz) / dd
+    return lambda_, norm((v0[0] + lambda_ * dx, v0[1] + lambda_ * dy, v0[2] + lambda_ * dz))
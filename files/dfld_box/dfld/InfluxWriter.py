@@ -0,0 +1,395 @@
+import os
+import sys
+import time
+import logging
+import threading
+
+
+def _escape_key(s):
+    """Escape measurement names, tag keys/values and field keys for line protocol."""
+    return str(s).replace('\\', '\\\\').replace(',', '\\,').replace('=', '\\=').replace(' ', '\\ ').replace('\n', '\\n')
+
+
+def _escape_measurement(s):
+    return str(s).replace('\\', '\\\\').replace(',', '\\,').replace(' ', '\\ ').replace('\n', '\\n')
+
+
+def _field_value(v):
+    # bool zuerst pruefen — bool ist eine Subklasse von int
+    if isinstance(v, bool):
+        return 'true' if v else 'false'
+    if isinstance(v, int):
+        return f'{v}i'
+    if isinstance(v, float):
+        return repr(v)
+    s = str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+    return f'"{s}"'
+
+
+def make_line(point):
+    """
+    convert a point dict (same layout as for InfluxDBClient.write_points with
+    protocol='json') into a single line protocol string.
+    :param point: dict with keys measurement, tags (optional), fields and time (int ns)
+    :return: line protocol string, or None if the point has no usable fields
+    """
+    fields = ','.join(f'{_escape_key(k)}={_field_value(v)}'
+                      for k, v in sorted(point['fields'].items()) if v is not None)
+    if not fields:
+        return None
+    key = _escape_measurement(point['measurement'])
+    tags = point.get('tags')
+    if tags:
+        key += ''.join(f',{_escape_key(k)}={_escape_key(v)}'
+                       for k, v in sorted(tags.items()) if v is not None and v != '')
+    ts = point.get('time')
+    if ts is None:
+        return f'{key} {fields}'
+    return f'{key} {fields} {int(ts)}'
+
+
+def _line_time(line):
+    # timestamp is the last token of a line protocol string
+    try:
+        return int(line.rsplit(' ', 1)[1])
+    except (IndexError, ValueError):
+        return 0
+
+
+def _client_code(e):
+    # HTTP-Status eines InfluxDBClientError, None bei Verbindungsfehlern u.ae.
+    code = getattr(e, 'code', None)
+    return code if isinstance(code, int) else None
+
+
+class BatchedInfluxWriter(object):
+    """
+    Sammelt Punkte und schreibt sie gebuendelt als Line-Protocol in InfluxDB.
+
+    Ein Flush passiert, sobald batch_size Punkte gepuffert sind oder der
+    aelteste Punkt flush_interval Sekunden im Puffer liegt. Geschrieben
+    wird ausschliesslich im Writer-Thread, write() blockiert also nie auf
+    HTTP. Punkt-Zeitstempel muessen in Nanosekunden vorliegen.
+
+    Optional mit SegmentSpool: fehlgeschlagene Batches landen auf Disk
+    statt verloren zu gehen. Waehrend des Ausfalls werden neue Batches
+    direkt gespoolt (kein HTTP-Timeout pro Batch), alle replay_interval
+    Sekunden prueft ein ping() ob InfluxDB wieder da ist. Danach wird der
+    Spool in Blöcken von replay_batch Punkten zeitlich sortiert nachgeschrieben.
+
+    retries: Anzahl Wiederholungen eines fehlgeschlagenen Batches (mit
+    exponentiellem Backoff ab retry_delay Sekunden) bevor er gespoolt bzw.
+    verworfen wird. track_latency: Abstand zwischen write() und
+    erfolgreichem Write mitzaehlen (latency_ms_* in stats()), also ohne
+    die Zeit bevor der Punkt an den Writer ging; Spool-Replays zaehlen
+    nicht mit.
+
+    Lehnt InfluxDB einen Batch mit 400 ab (Feldtyp-Konflikt, partial write,
+    Syntax), wird er halbiert und erneut geschrieben, bis nur die
+    abgelehnten Zeilen uebrig sind; diese werden verworfen (rejected in
+    stats()), der Rest des Batches bleibt erhalten. 413 (Body zu gross)
+    wird ebenso halbiert, eine einzelne zu grosse Zeile wird ohne
+    Quarantaene verworfen. Alle anderen Fehler, auch 401/403/404 (Login,
+    Datenbank), loesen den Ausfall-Modus (Spool) aus; ein abgelehnter
+    Punkt im Spool blockiert den Replay also nicht. Mit
+    quarantine werden abgelehnte Zeilen an diese Datei angehaengt (bis
+    quarantine_max_bytes), um sie spaeter von Hand nachzutragen.
+    """
+
+    def __init__(self, client, batch_size=500, flush_interval=2.0, database=None,
+                 spool=None, replay_interval=10.0, replay_batch=5000,
+                 retries=0, retry_delay=0.5, track_latency=False,
+                 quarantine=None, quarantine_max_bytes=1024 * 1024):
+        self.client = client
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.database = database
+        self.spool = spool
+        self.replay_interval = replay_interval
+        self.replay_batch = replay_batch
+        self.retries = retries
+        self.retry_delay = retry_delay
+        self.track_latency = track_latency
+        self.quarantine = quarantine
+        self.quarantine_max_bytes = quarantine_max_bytes
+        self._quarantine_full = False
+        self._outage = False
+        self._last_replay_check = 0.0
+
+        self.client_name = sys.argv[0].split('/')[-1].replace('.py', '')
+        self.logger = logging.getLogger(self.client_name)
+
+        self._buffer = []
+        self._enqueued = []  # time.time() of write() per buffered line, with track_latency
+        self._first_ts = None
+        self._cond = threading.Condition()
+        self._stopping = False
+        self._thread = None
+
+        # counters (cumulative), *_max is reset by stats(reset=True)
+        self.points_written = 0
+        self.points_failed = 0
+        self.points_rejected = 0
+        self.batches = 0
+        self.batch_size_max = 0
+        self.flush_time_total = 0.0
+        self.flush_time_max = 0.0
+        self.points_spooled = 0
+        self.points_replayed = 0
+        self.retried = 0
+        self.latency_count = 0
+        self.latency_total = 0.0
+        self.latency_max = 0.0
+
+    def get_logger(self) -> logging.Logger:
+        return self.logger
+
+    def set_logger(self, logger: logging.Logger):
+        self.logger = logger
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='influx-writer', daemon=True)
+        self._thread.start()
+        self.logger.info(f"InfluxDB writer started (batch_size={self.batch_size}, flush_interval={self.flush_interval}s)")
+
+    def write(self, point):
+        """Queue a single point dict for the next batch."""
+        line = make_line(point)
+        if line is None:
+            self.logger.debug(f"point without fields skipped: {point}")
+            return
+        with self._cond:
+            self._buffer.append(line)
+            if self.track_latency:
+                self._enqueued.append(time.time())
+            if len(self._buffer) == 1:
+                # Writer-Thread wartet ohne Timeout auf den ersten Punkt
+                self._first_ts = time.monotonic()
+                self._cond.notify()
+            elif len(self._buffer) >= self.batch_size:
+                self._cond.notify()
+
+    def pending(self):
+        with self._cond:
+            return len(self._buffer)
+
+    def close(self, timeout=30):
+        """Flush all buffered points and stop the writer thread."""
+        with self._cond:
+            self._stopping = True
+            self._cond.notify()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+        else:
+            self._flush_buffer()
+        if self.spool is not None:
+            self.spool.close()
+        self.logger.info(f"InfluxDB writer stopped ({self.points_written} points written, {self.points_failed} failed)")
+
+    def stats(self, reset=False):
+        """Return a snapshot of the writer counters."""
+        with self._cond:
+            pending = len(self._buffer)
+        res = {
+            'written': self.points_written,
+            'failed': self.points_failed,
+            'rejected': self.points_rejected,
+            'batches': self.batches,
+            'pending': pending,
+            'batch_avg': self.points_written / self.batches if self.batches else 0.0,
+            'batch_max': self.batch_size_max,
+            'flush_ms_avg': 1000.0 * self.flush_time_total / self.batches if self.batches else 0.0,
+            'flush_ms_max': 1000.0 * self.flush_time_max,
+        }
+        if self.retries:
+            res['retried'] = self.retried
+        if self.track_latency:
+            res['latency_ms_avg'] = 1000.0 * self.latency_total / self.latency_count if self.latency_count else 0.0
+            res['latency_ms_max'] = 1000.0 * self.latency_max
+        if self.spool is not None:
+            res.update({
+                'spooled': self.points_spooled,
+                'replayed': self.points_replayed,
+                'spool_records': self.spool.records,
+                'spool_bytes': self.spool.bytes,
+                'spool_dropped': self.spool.dropped,
+                'outage': self._outage,
+            })
+        if reset:
+            self.batch_size_max = 0
+            self.flush_time_max = 0.0
+            self.latency_max = 0.0
+        return res
+
+    def _take_batch(self):
+        # wait until a batch is due (or a spool replay check), caller holds no lock
+        with self._cond:
+            while not self._stopping and len(self._buffer) < self.batch_size:
+                if self._buffer:
+                    remaining = self._first_ts + self.flush_interval - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                elif self.spool is not None and self.spool.records:
+                    if not self._cond.wait(self.replay_interval):
+                        break
+                else:
+                    self._cond.wait()
+            batch = self._buffer[:self.batch_size]
+            del self._buffer[:self.batch_size]
+            enqueued = self._enqueued[:self.batch_size]
+            del self._enqueued[:self.batch_size]
+            if self._buffer:
+                self._first_ts = time.monotonic()
+            return batch, enqueued, self._stopping and not self._buffer
+
+    def _run(self):
+        while True:
+            batch, enqueued, done = self._take_batch()
+            if batch:
+                self._write_batch(batch, enqueued)
+            if done:
+                return
+            if self.spool is not None and self.spool.records:
+                self._replay()
+
+    def _flush_buffer(self):
+        with self._cond:
+            batch, self._buffer = self._buffer, []
+            enqueued, self._enqueued = self._enqueued, []
+        if batch:
+            self._write_batch(batch, enqueued)
+
+    def _write_batch(self, lines, enqueued=()):
+        if self._outage:
+            self._spool_lines(lines)
+            return False
+        t_start = time.monotonic()
+        attempt = 0
+        while True:
+            try:
+                rejected = self._write_lines(lines)
+                break
+            except Exception as e:
+                if attempt < self.retries:
+                    delay = self.retry_delay * 2 ** attempt
+                    attempt += 1
+                    self.retried += 1
+                    self.logger.warning(f"Failed to write {len(lines)} points to InfluxDB, retry {attempt}/{self.retries} in {delay:g}s: {e}")
+                    time.sleep(delay)
+                    continue
+                self.logger.error(f"Failed to write {len(lines)} points to InfluxDB: {e}")
+                if self.spool is None:
+                    self.points_failed += len(lines)
+                else:
+                    self._outage = True
+                    self._last_replay_check = time.monotonic()
+                    self._spool_lines(lines)
+                return False
+        elapsed = time.monotonic() - t_start
+        self.points_written += len(lines) - rejected
+        self.batches += 1
+        self.batch_size_max = max(self.batch_size_max, len(lines))
+        self.flush_time_total += elapsed
+        self.flush_time_max = max(self.flush_time_max, elapsed)
+        if self.track_latency:
+            self._add_latency(enqueued)
+        self.logger.debug(f"{len(lines)} points written to InfluxDB in {1000 * elapsed:.1f} ms")
+        return True
+
+    def _write_lines(self, lines):
+        """
+        write lines, on a 400 / 413 answer retry in halves so only the offending lines are lost
+        :return: number of rejected lines, other errors (connection, 401/403/404, 5xx) are raised
+        """
+        try:
+            self.client.write_points(lines, time_precision='n', database=self.database, protocol='line')
+            return 0
+        except Exception as e:
+            code = _client_code(e)
+            if code not in (400, 413):
+                raise
+            if len(lines) == 1:
+                if code == 413:
+                    self.points_rejected += 1
+                    self.logger.error(f"Point larger than the InfluxDB request limit, dropped: {lines[0][:200]}")
+                else:
+                    self._reject(lines[0], e)
+                return 1
+        mid = len(lines) // 2
+        return self._write_lines(lines[:mid]) + self._write_lines(lines[mid:])
+
+    def _reject(self, line, error):
+        self.points_rejected += 1
+        self.logger.error(f"InfluxDB rejected point, dropped: {line} ({error})")
+        if self.quarantine is None:
+            return
+        try:
+            if os.path.exists(self.quarantine) and os.path.getsize(self.quarantine) >= self.quarantine_max_bytes:
+                if not self._quarantine_full:
+                    self._quarantine_full = True
+                    self.logger.error(f"Quarantine file {self.quarantine} reached {self.quarantine_max_bytes} bytes, "
+                                      f"further rejected points are only logged")
+                return
+            with open(self.quarantine, 'a', encoding='utf-8') as f:
+                f.write(line + '\n')
+        except OSError as e:
+            self.logger.error(f"Failed to write rejected point to {self.quarantine}: {e}")
+
+    def _add_latency(self, enqueued):
+        now = time.time()
+        for t in enqueued:
+            latency = max(0.0, now - t)
+            self.latency_count += 1
+            self.latency_total += latency
+            self.latency_max = max(self.latency_max, latency)
+
+    def _spool_lines(self, lines):
+        try:
+            self.spool.append([line.encode('utf-8') for line in lines])
+            self.points_spooled += len(lines)
+        except OSError as e:
+            self.points_failed += len(lines)
+            self.logger.error(f"Failed to spool {len(lines)} points: {e}")
+
+    def _replay(self):
+        """Write spooled points back once InfluxDB answers ping() again."""
+        now = time.monotonic()
+        if now - self._last_replay_check < self.replay_interval:
+            return
+        self._last_replay_check = now
+        try:
+            self.client.ping()
+        except Exception as e:
+            self.logger.debug(f"InfluxDB still unreachable, {self.spool.records} points spooled: {e}")
+            return
+        if self._outage:
+            self.logger.info(f"InfluxDB reachable again, replaying {self.spool.records} spooled points")
+            self._outage = False
+        t_start = time.monotonic()
+        n_replayed = 0
+        while not self._stopping:
+            records = self.spool.read(self.replay_batch)
+            if not records:
+                break
+            lines = sorted((r.decode('utf-8') for r in records), key=_line_time)
+            try:
+                # mit 400 abgelehnte Zeilen werden dabei verworfen, der Spool kommt
+                # weiter; ping() prueft weder Login noch Datenbank, 401/403/404
+                # brechen den Replay ab und der Spool bleibt erhalten
+                rejected = self._write_lines(lines)
+            except Exception as e:
+                self.logger.error(f"Replay of {len(lines)} spooled points failed, spool kept: {e}")
+                self._outage = True
+                break
+            self.spool.commit(len(records))
+            n_replayed += len(records) - rejected
+            self.points_replayed += len(records) - rejected
+            # live points must not starve while a long backlog is replayed
+            if self.pending() >= self.batch_size:
+                self._last_replay_check = 0.0
+                break
+        if n_replayed:
+            self.logger.info(f"{n_replayed} spooled points replayed in {time.monotonic() - t_start:.1f}s, "
+                             f"{self.spool.records} left")
@@ -0,0 +1,139 @@
+import sys
+import logging
+from collections import deque
+
+# Mode-S parity: CRC-24, generator polynomial 0x1FFF409
+CRC24_GENERATOR = 0xfff409
+
+
+def _crc24_table():
+    table = []
+    for i in range(256):
+        crc = i << 16
+        for _ in range(8):
+            crc = (crc << 1) ^ CRC24_GENERATOR if crc & 0x800000 else crc << 1
+        table.append(crc & 0xffffff)
+    return tuple(table)
+
+
+_CRC24_TABLE = _crc24_table()
+
+
+def crc24_remainder(msg):
+    """
+    Mode-S parity check
+    :param msg: complete Mode-S message (7 or 14 bytes) incl. the 24 bit parity field
+    :return: CRC of the data bits XOR parity field; 0 for an intact DF17/DF18,
+             the interrogator id for DF11, the ICAO address for address/parity DFs
+    """
+    crc = 0
+    table = _CRC24_TABLE
+    for b in msg[:-3]:
+        crc = ((crc << 8) & 0xffffff) ^ table[(crc >> 16) ^ b]
+    return crc ^ int.from_bytes(msg[-3:], 'big')
+
+
+class ModeSFilter(object):
+    """
+    Filter fuer dekodierte Beast-Frames (siehe BeastDecoder) vor dem Publish.
+
+    Reihenfolge: CRC-Pruefung fuer DF11/17/18, DF-Allow-List, ICAO-Allow-List,
+    Duplikat-Unterdrueckung. Mode-AC- und Signal-Frames haben keine
+    Mode-S-Nachricht und werden nur von den Allow-Lists verworfen.
+
+    Duplikate: identische Mode-S-Nachrichten (ohne MLAT-Timestamp und
+    Signal) innerhalb von dedup_window Sekunden. Die gesehenen Nachrichten
+    liegen in Hash-Sets pro Zeit-Bucket (dedup_window / buckets breit),
+    abgelaufene Buckets werden als Ganzes verworfen.
+    """
+
+    def __init__(self, check_crc=True, dedup_window=1.0, df_allow=None, icao_allow=None, buckets=4):
+        self.client_name = sys.argv[0].split('/')[-1].replace('.py', '')
+        self.logger = logging.getLogger(self.client_name)
+
+        self.check_crc = check_crc
+        self.dedup_window = dedup_window
+        self.df_allow = frozenset(df_allow) if df_allow else None
+        self.icao_allow = frozenset(icao_allow) if icao_allow else None
+        self._bucket_width = dedup_window / buckets if dedup_window > 0 else 0
+        self._buckets = deque()  # (bucket number, set of messages), oldest first
+
+        # counters
+        self.frames_in = 0
+        self.passed = 0
+        self.crc_failed = 0
+        self.df_filtered = 0
+        self.icao_filtered = 0
+        self.duplicates = 0
+
+    def _seen(self, msg, now):
+        """Return True if msg was seen within dedup_window, remember it otherwise."""
+        bucket = int(now / self._bucket_width)
+        buckets = self._buckets
+        oldest = bucket - int(round(self.dedup_window / self._bucket_width))
+        while buckets and buckets[0][0] < oldest:
+            buckets.popleft()
+        for _, seen in buckets:
+            if msg in seen:
+                return True
+        if not buckets or buckets[-1][0] != bucket:
+            buckets.append((bucket, set()))
+        buckets[-1][1].add(msg)
+        return False
+
+    def filter(self, frames, now):
+        """
+        :param frames: unescaped Beast frames (0x1a, type, 6 byte timestamp, signal, message)
+        :param now: arrival unix time
+        :return: frames to publish
+        """
+        out = []
+        self.frames_in += len(frames)
+        for frame in frames:
+            msg = frame[9:]
+            if frame[1] not in (0x32, 0x33):
+                # Mode-AC / signal level: no DF, no address
+                if self.df_allow is not None or self.icao_allow is not None:
+                    self.df_filtered += 1
+                    continue
+                out.append(frame)
+                continue
+
+            df = msg[0] >> 3
+            if df in (11, 17, 18):
+                icao = int.from_bytes(msg[1:4], 'big')
+                if self.check_crc:
+                    remainder = crc24_remainder(msg)
+                    # DF11: parity may be overlaid with the interrogator id (II/SI < 0x80)
+                    corrupt = remainder >= 0x80 if df == 11 else remainder != 0
+                    if corrupt:
+                        self.crc_failed += 1
+                        continue
+            else:
+                # address/parity: the ICAO address is overlaid on the parity
+                icao = None
+            if self.df_allow is not None and df not in self.df_allow:
+                self.df_filtered += 1
+                continue
+            if self.icao_allow is not None:
+                if icao is None:
+                    icao = crc24_remainder(msg)
+                if icao not in self.icao_allow:
+                    self.icao_filtered += 1
+                    continue
+            if self._bucket_width and self._seen(msg, now):
+                self.duplicates += 1
+                continue
+            out.append(frame)
+        self.passed += len(out)
+        return out
+
+    def stats(self):
+        return {
+            'frames_in': self.frames_in,
+            'passed': self.passed,
+            'crc_failed': self.crc_failed,
+            'df_filtered': self.df_filtered,
+            'icao_filtered': self.icao_filtered,
+            'duplicates': self.duplicates,
+        }
@@ -0,0 +1,68 @@
+import math
+import threading
+from array import array
+
+
+class NoiseBuffer(object):
+    """
+    Ringpuffer der letzten `seconds` Sekunden 1-Hz-Pegel (dB_A_avg).
+
+    Ein Slot pro Sekunde (Index = Sekunde mod Groesse), dazu die Sekunde
+    selbst, damit ueberschriebene oder fehlende Slots erkannt werden.
+    Feste Groesse, kein Wachstum, add() ist O(1). Geschrieben wird aus dem
+    MQTT-Thread, gelesen beim Event, daher ein Lock.
+    """
+
+    def __init__(self, seconds=600):
+        self.size = int(seconds)
+        self._levels = array('d', [0.0] * self.size)
+        self._stamps = array('q', [-1] * self.size)
+        self._lock = threading.Lock()
+        self.samples = 0
+
+    def add(self, t, level):
+        """:param t: unix time of the 1 s value, :param level: dB(A)"""
+        sec = int(t)
+        i = sec % self.size
+        with self._lock:
+            self._stamps[i] = sec
+            self._levels[i] = level
+        self.samples += 1
+
+    def window(self, t_start, t_end):
+        """:return: list of (second, level) in [t_start, t_end], gaps skipped"""
+        first = int(math.floor(t_start))
+        last = int(t_end)
+        res = []
+        with self._lock:
+            for sec in range(max(first, last - self.size + 1), last + 1):
+                i = sec % self.size
+                if self._stamps[i] == sec:
+                    res.append((sec, self._levels[i]))
+        return res
+
+    def metrics(self, t0, before=60, after=60):
+        """
+        Pegel des Ueberflugs um t0
+        :return: dict with LAmax, t_max, t10 (seconds within 10 dB of LAmax, contiguous
+                 around the maximum) and SEL (energy over t10, 1 s reference); None if no data
+        """
+        values = self.window(t0 - before, t0 + after)
+        if not values:
+            return None
+        k_max = max(range(len(values)), key=lambda k: values[k][1])
+        t_max, la_max = values[k_max]
+        threshold = la_max - 10.0
+        lo = hi = k_max
+        # contiguous: stop at the first value below the threshold or a gap
+        while lo > 0 and values[lo - 1][1] >= threshold and values[lo - 1][0] == values[lo][0] - 1:
+            lo -= 1
+        while hi < len(values) - 1 and values[hi + 1][1] >= threshold and values[hi + 1][0] == values[hi][0] + 1:
+            hi += 1
+        energy = sum(10.0 ** (level / 10.0) for _, level in values[lo:hi + 1])
+        return {
+            'LAmax': la_max,
+            't_max': float(t_max),
+            't10': float(hi - lo + 1),
+            'SEL': 10.0 * math.log10(energy),
+        }
@@ -0,0 +1,209 @@
+import os
+import sys
+import time
+import zlib
+import struct
+import logging
+import threading
+from collections import deque
+
+
+class SegmentSpool(object):
+    """
+    Append-only Record-Log auf Disk, aufgeteilt in nummerierte Segment-Files.
+
+    Jeder Record wird mit Laenge und CRC32 geschrieben, ein beim Stromausfall
+    abgeschnittenes Segment-Ende wird beim Lesen erkannt und verworfen.
+    Gelesen wird strikt in Schreib-Reihenfolge: read() liefert Records vom
+    Kopf ohne sie zu entfernen, commit() gibt sie frei. Ein vollstaendig
+    commitetes Segment wird geloescht.
+
+    SD-Karten-schonend: fsync hoechstens alle fsync_interval Sekunden (und
+    beim Rotieren/Schliessen), bei Ueberschreiten von max_bytes werden die
+    aeltesten Segmente verworfen statt die Karte vollzuschreiben.
+    """
+
+    HEADER = struct.Struct('<II')  # record length, crc32
+    SUFFIX = '.seg'
+
+    def __init__(self, directory, segment_bytes=4 * 1024 * 1024, max_bytes=64 * 1024 * 1024,
+                 fsync_interval=5.0):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.max_bytes = max_bytes
+        self.fsync_interval = fsync_interval
+
+        self.client_name = sys.argv[0].split('/')[-1].replace('.py', '')
+        self.logger = logging.getLogger(self.client_name)
+
+        self._lock = threading.RLock()
+        self._segments = deque()  # [seq, bytes, records] oldest first, last one is active
+        self._fh = None
+        self._dirty = False
+        self._last_fsync = time.monotonic()
+        self._head = deque()      # records of the oldest segment not yet committed
+        self._head_seq = None
+
+        # counters
+        self.appended = 0
+        self.committed = 0
+        self.dropped = 0
+
+        os.makedirs(directory, exist_ok=True)
+        self._load()
+
+    def _path(self, seq):
+        return os.path.join(self.directory, f'{seq:010d}{self.SUFFIX}')
+
+    def _load(self):
+        seqs = sorted(int(f[:-len(self.SUFFIX)]) for f in os.listdir(self.directory)
+                      if f.endswith(self.SUFFIX) and f[:-len(self.SUFFIX)].isdigit())
+        for seq in seqs:
+            n_records, n_bytes = self._scan(seq)
+            if n_records == 0:
+                os.remove(self._path(seq))
+                continue
+            self._segments.append([seq, n_bytes, n_records])
+        if self._segments:
+            self.logger.info(f"Spool {self.directory}: {self.records} records "
+                             f"({self.bytes} bytes) in {len(self._segments)} segment(s) found")
+        # never append to a segment from a previous run, its tail may be torn
+        next_seq = self._segments[-1][0] + 1 if self._segments else 1
+        self._segments.append([next_seq, 0, 0])
+
+    def _scan(self, seq):
+        """Count valid records of a segment by walking the headers."""
+        n_records = 0
+        offset = 0
+        size = os.path.getsize(self._path(seq))
+        with open(self._path(seq), 'rb') as f:
+            while offset + self.HEADER.size <= size:
+                length, _ = self.HEADER.unpack(f.read(self.HEADER.size))
+                if offset + self.HEADER.size + length > size:
+                    break
+                f.seek(length, os.SEEK_CUR)
+                offset += self.HEADER.size + length
+                n_records += 1
+        return n_records, offset
+
+    def _read_segment(self, seq):
+        records = deque()
+        with open(self._path(seq), 'rb') as f:
+            data = f.read()
+        offset = 0
+        view = memoryview(data)
+        while offset + self.HEADER.size <= len(data):
+            length, crc = self.HEADER.unpack_from(data, offset)
+            start = offset + self.HEADER.size
+            record = bytes(view[start:start + length])
+            if len(record) < length or zlib.crc32(record) != crc:
+                self.logger.warning(f"Spool segment {seq}: corrupt record at offset {offset}, rest of segment skipped")
+                break
+            records.append(record)
+            offset = start + length
+        return records
+
+    @property
+    def records(self):
+        with self._lock:
+            return sum(s[2] for s in self._segments) - self._head_consumed()
+
+    @property
+    def bytes(self):
+        with self._lock:
+            return sum(s[1] for s in self._segments)
+
+    def _head_consumed(self):
+        # records of the head segment already committed but not yet deleted
+        if self._head_seq is None:
+            return 0
+        return self._segments[0][2] - len(self._head)
+
+    def __len__(self):
+        return self.records
+
+    def append(self, records):
+        """Append a list of bytes records."""
+        with self._lock:
+            for record in records:
+                seg = self._segments[-1]
+                if seg[1] >= self.segment_bytes:
+                    self._rotate()
+                    seg = self._segments[-1]
+                if self._fh is None:
+                    self._fh = open(self._path(seg[0]), 'ab')
+                self._fh.write(self.HEADER.pack(len(record), zlib.crc32(record)))
+                self._fh.write(record)
+                seg[1] += self.HEADER.size + len(record)
+                seg[2] += 1
+                self.appended += 1
+            self._dirty = True
+            self._enforce_cap()
+            if time.monotonic() - self._last_fsync >= self.fsync_interval:
+                self.sync()
+
+    def sync(self):
+        """Flush and fsync the active segment."""
+        with self._lock:
+            if self._fh is not None and self._dirty:
+                self._fh.flush()
+                os.fsync(self._fh.fileno())
+            self._dirty = False
+            self._last_fsync = time.monotonic()
+
+    def _rotate(self):
+        if self._fh is not None:
+            self.sync()
+            self._fh.close()
+            self._fh = None
+        self._segments.append([self._segments[-1][0] + 1, 0, 0])
+
+    def _enforce_cap(self):
+        while self.bytes > self.max_bytes and len(self._segments) > 1:
+            seq, _, n_records = self._segments.popleft()
+            lost = len(self._head) if self._head_seq == seq else n_records
+            if self._head_seq == seq:
+                self._head.clear()
+                self._head_seq = None
+            os.remove(self._path(seq))
+            self.dropped += lost
+            self.logger.warning(f"Spool size cap {self.max_bytes} bytes reached, dropped segment {seq} ({lost} records)")
+
+    def read(self, n):
+        """Return up to n records from the head without removing them."""
+        with self._lock:
+            while not self._head:
+                if self._head_seq is not None:
+                    # head segment exhausted (or only corrupt records left)
+                    self._drop_head()
+                if self.records == 0:
+                    return []
+                if len(self._segments) == 1:
+                    # only the active segment holds data: close it for reading
+                    self._rotate()
+                self._head_seq = self._segments[0][0]
+                self._head = self._read_segment(self._head_seq)
+                # records behind a corrupt one are lost
+                self._segments[0][2] = len(self._head)
+            return [self._head[i] for i in range(min(n, len(self._head)))]
+
+    def commit(self, n):
+        """Remove n records (previously returned by read()) from the head."""
+        with self._lock:
+            for _ in range(min(n, len(self._head))):
+                self._head.popleft()
+                self.committed += 1
+            if self._head_seq is not None and not self._head:
+                self._drop_head()
+
+    def _drop_head(self):
+        seq, _, _ = self._segments.popleft()
+        os.remove(self._path(seq))
+        self._head_seq = None
+
+    def close(self):
+        with self._lock:
+            if self._fh is not None:
+                self.sync()
+                self._fh.close()
+                self._fh = None
@@ -0,0 +1,147 @@
+import json
+
+
+class Route(object):
+    """
+    One MQTT_BRIDGED_RENAME mapping: prefix rewrite plus optional rules.
+
+    fields: forward only these JSON payload keys (projection)
+    every:  forward only every Nth message per topic (sampling)
+    """
+    __slots__ = ('index', 'local_prefix', 'remote_prefix', 'fields', 'every',
+                 '_seen', 'matched', 'forwarded', 'sampled_out', 'projection_errors',
+                 'bytes_in', 'bytes_out')
+
+    def __init__(self, index, local_prefix, remote_prefix, fields=None, every=1):
+        self.index = index
+        # Remove trailing slashes for consistent matching
+        self.local_prefix = local_prefix.rstrip('/')
+        self.remote_prefix = remote_prefix.rstrip('/')
+        self.fields = tuple(fields) if fields else None
+        self.every = max(1, int(every))
+        self._seen = {}  # per-topic message counter for sampling
+        self.matched = 0
+        self.forwarded = 0
+        self.sampled_out = 0
+        self.projection_errors = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+
+    def __repr__(self):
+        rules = ''
+        if self.fields:
+            rules += f' fields={",".join(self.fields)}'
+        if self.every > 1:
+            rules += f' every={self.every}'
+        return f'"{self.local_prefix}" -> "{self.remote_prefix}"{rules}'
+
+    def apply(self, suffix, topic, payload):
+        """
+        apply sampling and projection to one message
+        :param suffix: topic remainder after the local prefix, incl. leading '/'
+        :return: (remote_topic, payload) or None if sampled out
+        """
+        self.matched += 1
+        self.bytes_in += len(payload)
+        if self.every > 1:
+            n = self._seen.get(topic, 0)
+            self._seen[topic] = n + 1
+            if n % self.every:
+                self.sampled_out += 1
+                return None
+        if self.fields is not None:
+            payload = self.project(payload)
+        self.forwarded += 1
+        self.bytes_out += len(payload)
+        return self.remote_prefix + suffix, payload
+
+    def project(self, payload):
+        try:
+            data = json.loads(payload)
+        except ValueError:
+            data = None
+        if not isinstance(data, dict):
+            # not a JSON object: forward unchanged
+            self.projection_errors += 1
+            return payload
+        return json.dumps({k: data[k] for k in self.fields if k in data},
+                          separators=(',', ':')).encode('utf-8')
+
+    def stats(self):
+        return (f'matched={self.matched}, forwarded={self.forwarded}, sampled_out={self.sampled_out}, '
+                f'projection_errors={self.projection_errors}, bytes_in={self.bytes_in}, bytes_out={self.bytes_out}')
+
+
+class TopicRouter(object):
+    """
+    Prefix-Trie ueber die Topic-Level aller Routen.
+
+    Ein Lookup kostet O(Topic-Tiefe) statt O(Anzahl Mappings) startswith-
+    Vergleiche. Bei ueberlappenden Prefixen gewinnt wie bisher das zuerst
+    konfigurierte Mapping.
+    """
+
+    _ROUTE = '\0'  # key for the route stored at a trie node, no valid topic level
+
+    def __init__(self, routes):
+        self.routes = list(routes)
+        self._trie = {}
+        for route in self.routes:
+            node = self._trie
+            for level in route.local_prefix.split('/'):
+                node = node.setdefault(level, {})
+            node.setdefault(self._ROUTE, route)
+
+    @classmethod
+    def parse(cls, spec):
+        """
+        parse MQTT_BRIDGED_RENAME
+        format: "local_prefix remote_prefix [fields=a,b] [every=N][:local_prefix2 remote_prefix2 ...]"
+        :raises ValueError: on syntax errors
+        """
+        routes = []
+        for mapping in spec.split(':'):
+            parts = mapping.strip().split()
+            if len(parts) < 2:
+                raise ValueError(f'Expected at least 2 parts in mapping "{mapping}", got {len(parts)}')
+            rules = {}
+            for rule in parts[2:]:
+                key, sep, value = rule.partition('=')
+                if not sep or key not in ('fields', 'every'):
+                    raise ValueError(f'Unknown rule "{rule}" in mapping "{mapping}"')
+                rules[key] = value
+            fields = [f for f in rules.get('fields', '').split(',') if f] or None
+            routes.append(Route(len(routes), parts[0], parts[1],
+                                fields=fields, every=int(rules.get('every', 1))))
+        if not routes:
+            raise ValueError('No mappings found')
+        return cls(routes)
+
+    def match(self, topic):
+        """Return (route, suffix) for the first configured route matching topic, or (None, None)."""
+        best = None
+        best_depth = 0
+        node = self._trie
+        levels = topic.split('/')
+        for depth, level in enumerate(levels, 1):
+            node = node.get(level)
+            if node is None:
+                break
+            route = node.get(self._ROUTE)
+            if route is not None and (best is None or route.index < best.index):
+                best = route
+                best_depth = depth
+        if best is None:
+            return None, None
+        suffix = '/' + '/'.join(levels[best_depth:]) if best_depth < len(levels) else ''
+        return best, suffix
+
+    def route(self, topic, payload):
+        """Return (route, remote_topic, payload); remote_topic is None if unmatched or sampled out."""
+        route, suffix = self.match(topic)
+        if route is None:
+            return None, None, payload
+        res = route.apply(suffix, topic, payload)
+        if res is None:
+            return route, None, payload
+        return route, res[0], res[1]
@@ -1,5 +1,12 @@
 from .DataSink import DataSink, MqttDataSink, SSD1306DataSink
 from .DataSource import DataSource, AkModulDataSource, Bme280DataSource, DNMSDataSource, DNMSi2cDataSource, UdpDataSource, MqttDataSource
 from .EventLoop import EventLoop
+from .ForwardQueue import ForwardQueue
+from .Geofence import Zone, ZoneIndex
+from .Geometry import LocalFrame
+from .InfluxWriter import BatchedInfluxWriter, make_line
 from .LiveView import LiveView
+from .NoiseBuffer import NoiseBuffer
+from .Spool import SegmentSpool
+from .TopicRouter import TopicRouter, Route
 from .util import calc_crc, obfuscate_string, deobfuscate_string
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+envelope2mqtt.py - Reference unpacker for mqtt2mqtt envelopes
+
+Subscribes to envelope topics (see MQTT_BRIDGED_ENVELOPE in mqtt2mqtt.py),
+expands every envelope with dfld.Envelope.unpack_envelope and republishes
+the contained messages under their original remote topics. Runs as local
+stand-in for the central side, or as template for the server implementation.
+
+Environment Variables:
+    MQTT_SERVER: broker carrying the envelopes (default: mqtt:1883)
+    MQTT_TOPIC: subscription carrying the envelopes (default: #). Remote prefixes
+        of mqtt2mqtt may have any depth, only messages whose last topic level is
+        MQTT_BRIDGED_ENVELOPE_TOPIC are unpacked
+    MQTT_BRIDGED_ENVELOPE_TOPIC: same value as in mqtt2mqtt.py (default: envelope)
+    MQTT_TARGET_SERVER: broker for the expanded messages (default: MQTT_SERVER)
+    MQTT_QOS: QoS for subscribe and publish (default: 1)
+    LOG_LEVEL: Logging level (default: INFO)
+"""
+import os
+import sys
+import time
+import signal
+import logging
+from types import SimpleNamespace
+from paho.mqtt import client as mqtt
+from dfld.Envelope import unpack_envelope
+
+# Derive module name for MQTT client ID base
+MODULE_NAME = os.path.basename(__file__).replace('.py', '')
+
+
+def main():
+    config = SimpleNamespace(**{
+        "log_level": os.getenv("LOG_LEVEL", "INFO").upper(),
+        "mqtt_server": os.getenv("MQTT_SERVER", "mqtt:1883"),
+        "topic": os.getenv("MQTT_TOPIC", "#"),
+        "envelope_topic": os.getenv("MQTT_BRIDGED_ENVELOPE_TOPIC", "envelope"),
+        "target_server": os.getenv("MQTT_TARGET_SERVER", "") or os.getenv("MQTT_SERVER", "mqtt:1883"),
+        "qos": int(os.getenv("MQTT_QOS", 1)),
+        "client_id": f"{MODULE_NAME}-{os.getpid()}",
+    })
+
+    logging.basicConfig(format='%(asctime)s - %(levelname)s:%(message)s', level=config.log_level)
+    logging.info(f"Configuration: {config}")
+
+    counters = {"envelopes": 0, "messages": 0, "errors": 0, "skipped": 0}
+
+    source = mqtt.Client(callback_api_version=mqtt.CallbackAPIVersion.VERSION2,
+                         client_id=config.client_id, clean_session=True, protocol=mqtt.MQTTv311)
+    if config.target_server == config.mqtt_server:
+        target = source
+    else:
+        target = mqtt.Client(callback_api_version=mqtt.CallbackAPIVersion.VERSION2,
+                             client_id=f"{config.client_id}-out", clean_session=True, protocol=mqtt.MQTTv311)
+    for cli in {source, target}:
+        cli.reconnect_delay_set(min_delay=1, max_delay=30)
+
+    def on_connect(cli, userdata, flags, reason_code, properties):
+        rc = reason_code.value if hasattr(reason_code, 'value') else reason_code
+        logging.info(f"Connected: {'ok' if rc == 0 else f'rc={rc}'}")
+        if rc == 0:
+            res = cli.subscribe(config.topic, qos=config.qos)
+            logging.info(f"Subscribe {config.topic} QoS={config.qos}: {res}")
+
+    def on_message(cli, userdata, msg):
+        if msg.topic.rpartition('/')[2] != config.envelope_topic:
+            # other traffic on the broker, including our own republished messages
+            counters["skipped"] += 1
+            return
+        try:
+            header, messages = unpack_envelope(msg.payload)
+        except Exception as e:
+            counters["errors"] += 1
+            logging.warning(f"Invalid envelope on {msg.topic} ({len(msg.payload)} bytes): {e}")
+            return
+        counters["envelopes"] += 1
+        counters["messages"] += len(messages)
+        logging.debug(f"Envelope on {msg.topic}: {dict(zip(header['topics'], header['counts']))}")
+        for topic, payload in messages:
+            target.publish(topic, payload, qos=config.qos, retain=False)
+
+    source.on_connect = on_connect
+    source.on_message = on_message
+
+    stop = {"flag": False}
+    def handle_sig(*_):
+        stop["flag"] = True
+        logging.info("Stopping…")
+
+    signal.signal(signal.SIGINT, handle_sig)
+    signal.signal(signal.SIGTERM, handle_sig)
+
+    clients = [(target, config.target_server)] if target is not source else []
+    clients.append((source, config.mqtt_server))
+    for cli, server in clients:
+        host, port = server.split(":")
+        cli.connect_async(host, int(port), keepalive=60)
+        cli.loop_start()
+    try:
+        last_stats_log = time.time()
+        while not stop["flag"]:
+            time.sleep(0.2)
+            if time.time() - last_stats_log > 600:
+                logging.info(f"Stats: envelopes={counters['envelopes']}, messages={counters['messages']}, errors={counters['errors']}, skipped={counters['skipped']}")
+                last_stats_log = time.time()
+    finally:
+        for cli, _ in clients:
+            cli.disconnect()
+            cli.loop_stop()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -8,7 +8,11 @@ import sys
 import time
 import logging
 import ssl
+import signal
+import threading
 from paho.mqtt import client as mqtt
+from dfld import ForwardQueue, SegmentSpool, TopicRouter
+from dfld.Envelope import pack_envelope, CODECS
 
 # Derive module name for MQTT client ID base
 MODULE_NAME = os.path.basename(__file__).replace('.py', '')
@@ -20,6 +24,17 @@ TOPIC_REWRITE = os.getenv('MQTT_BRIDGED_RENAME', '')  # e.g. "dfld/sensors/noise
 USE_TLS = os.getenv('MQTT_BRIDGED_TLS', 'false').lower() in ['true', 'yes', '1']
 STATION_ID = os.getenv('DFLD_STATION_ID', 'unknown')
 LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO').upper()
+# Store-and-forward while the remote broker is unreachable
+QUEUE_MEMORY = int(os.getenv('MQTT_BRIDGED_QUEUE_MEMORY', 5000))  # messages held in RAM before spilling to disk
+SPOOL_DIR = os.getenv('MQTT_BRIDGED_SPOOL_DIR', '/var/lib/mqtt2mqtt/spool')  # empty: no disk spool
+SPOOL_MAX_MB = float(os.getenv('MQTT_BRIDGED_SPOOL_MAX_MB', 32))
+REPLAY_RATE = float(os.getenv('MQTT_BRIDGED_REPLAY_RATE', 20))  # messages/s on top of the live rate when draining after reconnect
+STATS_INTERVAL = int(os.getenv('STATS_INTERVAL', 600))
+# Envelope mode: pack all messages of a mapping within a latency window into one compressed publish
+ENVELOPE = os.getenv('MQTT_BRIDGED_ENVELOPE', 'off').lower()  # off, zlib, gzip
+ENVELOPE_WINDOW = float(os.getenv('MQTT_BRIDGED_ENVELOPE_WINDOW', 5))  # seconds
+ENVELOPE_MAX = int(os.getenv('MQTT_BRIDGED_ENVELOPE_MAX', 1000))  # messages per envelope
+ENVELOPE_TOPIC = os.getenv('MQTT_BRIDGED_ENVELOPE_TOPIC', 'envelope')  # below the remote prefix
 
 logging.basicConfig(format='%(asctime)s - %(levelname)s:%(message)s', level=LOG_LEVEL)
 
@@ -31,26 +46,22 @@ if not TOPIC_REWRITE:
     logging.error('MQTT_BRIDGED_RENAME not set, exiting')
     sys.exit(1)
 
-# Parse topic rewrites: "local_prefix1 remote_prefix1:local_prefix2 remote_prefix2"
-# Multiple mappings separated by colon
+if ENVELOPE != 'off' and ENVELOPE not in CODECS:
+    logging.error(f'Invalid MQTT_BRIDGED_ENVELOPE "{ENVELOPE}" (expected: off, none, zlib, gzip)')
+    sys.exit(1)
+
+# Parse topic rewrites: "local_prefix1 remote_prefix1 [fields=a,b] [every=N]:local_prefix2 remote_prefix2"
+# Multiple mappings separated by colon; optional rules per mapping:
+#   fields=ts,dB_A_avg  forward only these keys of a JSON payload
+#   every=N             forward only every Nth message per topic
 try:
-    mappings = []
-    for mapping in TOPIC_REWRITE.split(':'):
-        parts = mapping.strip().split()
-        if len(parts) != 2:
-            raise ValueError(f'Expected 2 parts in mapping "{mapping}", got {len(parts)}')
-        local_prefix, remote_prefix = parts
-        # Remove trailing slashes for consistent matching
-        local_prefix = local_prefix.rstrip('/')
-        remote_prefix = remote_prefix.rstrip('/')
-        mappings.append((local_prefix, remote_prefix))
-        logging.info(f'Topic rewrite: "{local_prefix}" -> "{remote_prefix}"')
-    
-    if not mappings:
-        raise ValueError('No mappings found')
+    router = TopicRouter.parse(TOPIC_REWRITE)
+    for route in router.routes:
+        logging.info(f'Topic rewrite: {route}')
 except (ValueError, IndexError) as e:
-    logging.error(f'Invalid MQTT_BRIDGED_RENAME format: "{TOPIC_REWRITE}" (expected: "local_prefix remote_prefix[:local_prefix2 remote_prefix2...]", error: {e})')
+    logging.error(f'Invalid MQTT_BRIDGED_RENAME format: "{TOPIC_REWRITE}" (expected: "local_prefix remote_prefix [fields=a,b] [every=N][:local_prefix2 remote_prefix2...]", error: {e})')
     sys.exit(1)
+mappings = [(route.local_prefix, route.remote_prefix) for route in router.routes]
 
 # Parse remote MQTT
 try:
@@ -136,18 +147,35 @@ if USE_TLS:
         traceback.print_exc()
         sys.exit(1)
 
+# Store-and-forward queue: while the remote is disconnected (or older
+# messages are still queued) local messages are queued instead of dropped.
+# RAM first, spilled to a segment log on disk when RAM is full.
+spool = None
+if SPOOL_DIR:
+    try:
+        spool = SegmentSpool(SPOOL_DIR, segment_bytes=1024 * 1024,
+                             max_bytes=int(SPOOL_MAX_MB * 1024 * 1024))
+    except OSError as e:
+        logging.error(f'Cannot open spool directory {SPOOL_DIR}, queueing in memory only: {e}')
+forward_queue = ForwardQueue(max_memory=QUEUE_MEMORY, spool=spool)
+
 remote_connected = False
 dropped_messages = 0
 forwarded_messages = 0
+replayed_messages = 0
 last_stats_log = time.time()
 
+# Envelope accumulators per remote prefix: list of (remote_topic, payload, arrival time)
+envelope_lock = threading.Lock()
+envelope_buffers = {remote_prefix: [] for _, remote_prefix in mappings}
+envelope_stats = {'envelopes': 0, 'packed': 0, 'bytes_in': 0, 'bytes_out': 0}
+
 def on_remote_connect(cli, userdata, flags, reason_code, properties):
-    global remote_connected, dropped_messages
+    global remote_connected
     rc = reason_code.value if hasattr(reason_code, 'value') else reason_code
     remote_connected = (rc == 0)
     if remote_connected:
-        logging.info(f'Remote MQTT connected to {remote_host}:{remote_port} (dropped {dropped_messages} messages while disconnected)')
-        dropped_messages = 0
+        logging.info(f'Remote MQTT connected to {remote_host}:{remote_port} ({len(forward_queue)} messages queued, replaying at {REPLAY_RATE:g} msg/s above the live rate)')
     else:
         # MQTT error codes: https://github.com/eclipse/paho.mqtt.python/blob/master/src/paho/mqtt/client.py
         error_messages = {
@@ -183,45 +211,124 @@ remote_client.on_disconnect = on_remote_disconnect
 remote_client.on_log = on_remote_log
 remote_client.enable_logger()
 
-def on_local_message(cli, userdata, msg):
+def publish_remote(remote_topic, payload):
+    """Publish to the remote broker, returns True on success."""
+    # Match mosquitto bridge: out direction, qos 1, no retain
+    result = remote_client.publish(remote_topic, payload, qos=1, retain=False)
+    if result.rc != mqtt.MQTT_ERR_SUCCESS:
+        logging.warning(f'Publish failed with rc={result.rc}: {remote_topic}')
+        return False
+    return True
+
+def encode_record(remote_topic, payload):
+    # MQTT topics must not contain U+0000, so NUL separates topic and payload
+    return remote_topic.encode('utf-8') + b'\0' + payload
+
+def decode_record(record):
+    topic, _, payload = record.partition(b'\0')
+    return topic.decode('utf-8'), payload
+
+def replay_loop():
+    """Drain the store-and-forward queue in order, rate limited."""
+    global forwarded_messages, replayed_messages
+    batch = max(1, int(REPLAY_RATE / 10))
+    live = 0
+    queued_seen = forward_queue.queued
+    while True:
+        if not remote_connected or len(forward_queue) == 0:
+            # everything queued up to here is backlog
+            queued_seen = forward_queue.queued
+            live = 0
+            time.sleep(0.2)
+            continue
+        t_start = time.monotonic()
+        records, source = forward_queue.take(batch + live)
+        delivered = 0
+        try:
+            for record in records:
+                if not remote_connected or not publish_remote(*decode_record(record)):
+                    break
+                delivered += 1
+        except Exception as e:
+            logging.warning(f'Failed to replay queued message: {e}')
+        finally:
+            forward_queue.done(records, source, delivered)
+        forwarded_messages += delivered
+        replayed_messages += delivered
+        if delivered < len(records):
+            time.sleep(1)
+            continue
+        # Messages queued since the last batch arrived live (queued behind the
+        # backlog to keep the order). They are not paced, so the backlog
+        # shrinks by REPLAY_RATE msg/s even if the live rate is higher.
+        live = forward_queue.queued - queued_seen
+        queued_seen += live
+        # pace to REPLAY_RATE so a long outage does not flood the central broker
+        paced = max(0, delivered - live)
+        time.sleep(max(0.0, paced / REPLAY_RATE - (time.monotonic() - t_start)))
+
+def forward(remote_topic, payload):
+    """Publish directly, or queue while disconnected / while a backlog is pending."""
     global dropped_messages, forwarded_messages
-    
-    if not remote_connected:
-        dropped_messages += 1
-        logging.debug(f'Remote not connected, dropped message on {msg.topic}')
-        return
-    
-    # Try to match topic against all mappings
-    remote_topic = None
-    for local_prefix, remote_prefix in mappings:
-        # Check if topic matches prefix
-        if msg.topic == local_prefix:
-            # Exact match
-            remote_topic = remote_prefix
-            break
-        elif msg.topic.startswith(local_prefix + '/'):
-            # Has suffix after prefix
-            suffix = msg.topic[len(local_prefix):]  # Keep the leading /
-            remote_topic = remote_prefix + suffix
-            break
-    
-    if not remote_topic:
-        logging.debug(f'Topic {msg.topic} does not match any mapping, ignoring')
+    # Queue while disconnected or while older messages are still waiting,
+    # otherwise newer messages would overtake the backlog.
+    if not remote_connected or len(forward_queue) > 0:
+        forward_queue.put(encode_record(remote_topic, payload))
+        logging.debug(f'Remote not connected or backlog pending, queued message for {remote_topic}')
         return
-    
+
     try:
-        # Match mosquitto bridge: out direction, qos 1, no retain
-        result = remote_client.publish(remote_topic, msg.payload, qos=1, retain=False)
-        if result.rc == mqtt.MQTT_ERR_SUCCESS:
+        if publish_remote(remote_topic, payload):
             forwarded_messages += 1
-            logging.debug(f'Forwarded: {msg.topic} -> {remote_topic}')
+            logging.debug(f'Forwarded: {remote_topic}')
         else:
-            logging.warning(f'Publish failed with rc={result.rc}: {msg.topic} -> {remote_topic}')
-            dropped_messages += 1
+            forward_queue.put(encode_record(remote_topic, payload))
     except Exception as e:
         logging.warning(f'Failed to forward message: {e}')
         dropped_messages += 1
 
+def flush_envelopes():
+    """Pack and forward the accumulated messages of every mapping."""
+    with envelope_lock:
+        pending = [(prefix, msgs) for prefix, msgs in envelope_buffers.items() if msgs]
+        for prefix, _ in pending:
+            envelope_buffers[prefix] = []
+    for remote_prefix, messages in pending:
+        for i in range(0, len(messages), ENVELOPE_MAX):
+            chunk = messages[i:i + ENVELOPE_MAX]
+            envelope = pack_envelope(chunk, codec=ENVELOPE)
+            envelope_stats['envelopes'] += 1
+            envelope_stats['packed'] += len(chunk)
+            envelope_stats['bytes_in'] += sum(len(p) for _, p, _ in chunk)
+            envelope_stats['bytes_out'] += len(envelope)
+            logging.debug(f'Envelope for {remote_prefix}: {len(chunk)} messages, {len(envelope)} bytes')
+            forward(f'{remote_prefix}/{ENVELOPE_TOPIC}', envelope)
+
+def envelope_loop():
+    while True:
+        time.sleep(ENVELOPE_WINDOW)
+        try:
+            flush_envelopes()
+        except Exception as e:
+            logging.error(f'Failed to pack envelope: {e}')
+
+def on_local_message(cli, userdata, msg):
+
+    # Match against the compiled mappings, apply projection / sampling of the route
+    route, remote_topic, payload = router.route(msg.topic, msg.payload)
+    if route is None:
+        logging.debug(f'Topic {msg.topic} does not match any mapping, ignoring')
+        return
+    if remote_topic is None:
+        return  # sampled out
+
+    if ENVELOPE != 'off':
+        with envelope_lock:
+            envelope_buffers[route.remote_prefix].append((remote_topic, payload, time.time()))
+        return
+
+    forward(remote_topic, payload)
+
 def on_local_connect(cli, userdata, flags, reason_code, properties):
     rc = reason_code.value if hasattr(reason_code, 'value') else reason_code
     if rc == 0:
@@ -254,16 +361,43 @@ except Exception as e:
     traceback.print_exc()
     sys.exit(1)
 
+threading.Thread(target=replay_loop, name='replay', daemon=True).start()
+if ENVELOPE != 'off':
+    logging.info(f'Envelope mode {ENVELOPE}: window={ENVELOPE_WINDOW:g}s, max {ENVELOPE_MAX} messages, topic <remote_prefix>/{ENVELOPE_TOPIC}')
+    threading.Thread(target=envelope_loop, name='envelope', daemon=True).start()
+
+# docker stop sends SIGTERM: shut down like Ctrl+C so queued messages are persisted
+def handle_sigterm(*_):
+    raise KeyboardInterrupt
+
+signal.signal(signal.SIGTERM, handle_sigterm)
+
 # Keep alive with periodic stats logging
+last_replayed = 0
 try:
     while True:
         time.sleep(60)
         
         # Periodic stats logging (every 10 minutes)
-        if time.time() - last_stats_log > 600:
-            logging.info(f'Stats: forwarded={forwarded_messages}, dropped={dropped_messages}, connected={remote_connected}')
+        if time.time() - last_stats_log > STATS_INTERVAL:
+            qs = forward_queue.stats()
+            replay_rate = (replayed_messages - last_replayed) / (time.time() - last_stats_log)
+            # keep "forwarded=, dropped=, connected=" first, dfld-status parses them
+            logging.info(f'Stats: forwarded={forwarded_messages}, dropped={dropped_messages + qs["dropped"]}, connected={remote_connected}, '
+                         f'queue={qs["queue"]}, queued={qs["queued"]}, bytes_spooled={qs["bytes_spooled"]}, '
+                         f'replayed={replayed_messages}, replay_rate={replay_rate:.1f}/s')
+            if ENVELOPE != 'off':
+                ratio = envelope_stats['bytes_out'] / envelope_stats['bytes_in'] if envelope_stats['bytes_in'] else 0.0
+                logging.info(f'Envelopes: count={envelope_stats["envelopes"]}, packed={envelope_stats["packed"]}, '
+                             f'bytes_in={envelope_stats["bytes_in"]}, bytes_out={envelope_stats["bytes_out"]}, ratio={ratio:.2f}')
+            for route in router.routes:
+                logging.info(f'Route {route.local_prefix} -> {route.remote_prefix}: {route.stats()}')
+            last_replayed = replayed_messages
             last_stats_log = time.time()
 except KeyboardInterrupt:
     logging.info('Shutting down')
     local_client.loop_stop()
+    if ENVELOPE != 'off':
+        flush_envelopes()
     remote_client.loop_stop()
+    forward_queue.close()
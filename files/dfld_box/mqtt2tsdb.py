@@ -2,17 +2,100 @@
 import argparse
 import json
 import os
+import queue
 import signal
 import sys
 import time
 import logging
+import threading
+from datetime import datetime, timezone
 from types import SimpleNamespace
 from paho.mqtt import client as mqtt
 from influxdb import InfluxDBClient
+from dfld import BatchedInfluxWriter, SegmentSpool
 
 # Derive module name for MQTT client ID base
 MODULE_NAME = os.path.basename(__file__).replace('.py', '')
 
+# keys to transfer as tags
+TAG_KEYS = ["source"]
+
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+def decode_message(topic, payload):
+    """
+    decode one MQTT payload into an InfluxDB point dict
+    :param topic: MQTT topic, last level is used as measurement
+    :param payload: raw JSON payload
+    :return: point dict, or None if the payload is not a JSON object
+    :raises json.JSONDecodeError: if the payload is not valid JSON
+    """
+    data = json.loads(payload)
+    if not isinstance(data, dict):
+        logging.warning(f"Received JSON is not a dict: {data}")
+        return None
+
+    ts = int(time.time() * 1e9)  # Fallback: aktueller Zeitstempel in Nanosekunden
+    if "ts" in data:
+        raw_ts = data["ts"]
+        # FORMAT_A: ts ist ISO-8601-String mit μs-Praezision
+        # (z.B. "2026-05-10T12:30:00.779682Z"). Backwards-compat:
+        # falls noch jemand int-ns sendet, wird das ebenfalls
+        # akzeptiert (zum nahtlosen Roll-out).
+        if isinstance(raw_ts, str):
+            dt = datetime.fromisoformat(raw_ts.replace('Z', '+00:00'))
+            # Drift-frei via timedelta-int-arithmetik. Naiver
+            # int(dt.timestamp() * 1e9) verliert ca. 48% der μs-Werte
+            # um 1 μs nach unten (Float-mantissa-Quantisierung bei
+            # 1.7e18) — was Live/Backfill-Dedup im ReplacingMergeTree
+            # bricht.
+            delta = dt - EPOCH
+            ts = ((delta.days * 86400 + delta.seconds) * 1_000_000 + delta.microseconds) * 1000
+        else:
+            ts = int(raw_ts)
+        del data["ts"]
+    # move tag keys to separate dict
+    tags = {k: str(data[k]) for k in TAG_KEYS if k in data}
+    for k in tags.keys():
+        del data[k]
+
+    return {
+        "measurement": topic.split('/')[-1],  # letzter Teil des Topics als Messung
+        "tags": tags,
+        "fields": data,
+        "time": ts
+    }
+
+
+class StageTimer(object):
+    """Thread-safe latency counter for one pipeline stage (count, avg, max)."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, seconds):
+        with self.lock:
+            self.count += 1
+            self.total += seconds
+            if seconds > self.max:
+                self.max = seconds
+
+    def snapshot(self, reset=False):
+        """Return (avg_ms, max_ms); with reset=True the window starts anew."""
+        with self.lock:
+            avg = 1000.0 * self.total / self.count if self.count else 0.0
+            res = (avg, 1000.0 * self.max)
+            if reset:
+                self.count = 0
+                self.total = 0.0
+                self.max = 0.0
+        return res
+
+
 def main():
     # create config tuple from environment variables
     config = SimpleNamespace(**{
@@ -26,10 +109,25 @@ def main():
         "influxdb_username": os.getenv("INFLUXDB_USERNAME", None),
         "influxdb_password": os.getenv("INFLUXDB_PASSWORD", None),
         "influxdb_database": os.getenv("INFLUXDB_DATABASE", "dfld"),
+        "batch_size": int(os.getenv("INFLUXDB_BATCH_SIZE", 500)),
+        "flush_interval": float(os.getenv("INFLUXDB_FLUSH_INTERVAL", 2.0)),
+        "stats_interval": int(os.getenv("STATS_INTERVAL", 600)),
+        "queue_size": int(os.getenv("PIPELINE_QUEUE_SIZE", 10000)),
+        "workers": int(os.getenv("PIPELINE_WORKERS", 1)),
+        "overflow": os.getenv("PIPELINE_OVERFLOW", "drop").lower(),
+        "spool_dir": os.getenv("SPOOL_DIR", "/var/lib/mqtt2tsdb/spool"),
+        "spool_max_mb": float(os.getenv("SPOOL_MAX_MB", 64)),
+        "spool_segment_mb": float(os.getenv("SPOOL_SEGMENT_MB", 4)),
+        "spool_fsync_interval": float(os.getenv("SPOOL_FSYNC_INTERVAL", 5.0)),
+        "replay_batch": int(os.getenv("SPOOL_REPLAY_BATCH", 5000)),
+        "quarantine_file": os.getenv("QUARANTINE_FILE", "/var/lib/mqtt2tsdb/rejected.lp"),
     })
 
     logging.basicConfig(format='%(asctime)s - %(levelname)s:%(message)s', level=config.log_level)
     logging.info(f"Configuration: {config}")
+    if config.overflow not in ("drop", "block"):
+        logging.error(f"Invalid PIPELINE_OVERFLOW '{config.overflow}' (expected: drop, block)")
+        sys.exit(1)
     
     # create connection to influxdb v1 — Retry-Loop statt sys.exit:
     # bei parallelem `docker compose up` startet mqtt2tsdb haeufig
@@ -62,7 +160,76 @@ def main():
         influx_client.create_database(config.influxdb_database)
     influx_client.switch_database(config.influxdb_database)
     logging.info(f"Using InfluxDB database: {config.influxdb_database}")
-        
+
+    # Gepufferter Writer: on_message haengt nur noch an, geschrieben wird
+    # gebuendelt als Line-Protocol im Writer-Thread (batch_size Punkte
+    # oder flush_interval Sekunden, je nachdem was zuerst eintritt).
+    # Frueher: ein HTTP-Request pro MQTT-Nachricht im paho-Callback.
+    # Schlaegt ein Write fehl (InfluxDB-Restart nach Retention-Lauf oder
+    # OOM), gehen die Punkte in einen Spool auf Disk und werden nach
+    # erfolgreichem ping() zeitlich sortiert nachgeschrieben. Leeres
+    # SPOOL_DIR schaltet den Spool ab (altes Verhalten: Punkte verloren).
+    # Von InfluxDB abgelehnte Punkte (4xx, z.B. Feldtyp-Konflikt) sind kein
+    # Ausfall: sie landen in QUARANTINE_FILE, der Rest wird geschrieben.
+    spool = None
+    if config.spool_dir:
+        try:
+            spool = SegmentSpool(config.spool_dir,
+                                 segment_bytes=int(config.spool_segment_mb * 1024 * 1024),
+                                 max_bytes=int(config.spool_max_mb * 1024 * 1024),
+                                 fsync_interval=config.spool_fsync_interval)
+        except OSError as e:
+            logging.error(f"Cannot open spool directory {config.spool_dir}, spooling disabled: {e}")
+    writer = BatchedInfluxWriter(influx_client,
+                                 batch_size=config.batch_size,
+                                 flush_interval=config.flush_interval,
+                                 spool=spool,
+                                 replay_batch=config.replay_batch,
+                                 quarantine=config.quarantine_file or None)
+    writer.start()
+
+    # Pipeline: der paho-Callback legt nur (topic, payload, t_recv) in eine
+    # begrenzte Queue. Worker-Threads dekodieren JSON, rechnen den ts um und
+    # uebergeben an den Writer. So bleibt der paho-Netzwerk-Loop frei
+    # (Keepalives), auch wenn InfluxDB gerade kompaktiert.
+    # Overflow-Policy: "drop" verwirft neue Nachrichten bei voller Queue,
+    # "block" haelt den paho-Thread an (Backpressure bis zum Broker).
+    pipeline = queue.Queue(maxsize=config.queue_size)
+    # von den Workern und dem paho-Thread geschrieben
+    counters = {"received": 0, "dropped": 0, "decode_errors": 0, "queue_max": 0}
+    counters_lock = threading.Lock()
+    wait_timer = StageTimer()    # Zeit in der Queue
+    decode_timer = StageTimer()  # JSON + ts-Konvertierung + Line-Protocol
+
+    def worker():
+        while True:
+            item = pipeline.get()
+            if item is None:
+                return
+            topic, payload, t_recv = item
+            t_start = time.monotonic()
+            wait_timer.add(t_start - t_recv)
+            try:
+                point = decode_message(topic, payload)
+                if point is not None:
+                    writer.write(point)
+                    logging.debug(f"Data queued for InfluxDB: {point}")
+            except json.JSONDecodeError:
+                with counters_lock:
+                    counters["decode_errors"] += 1
+                logging.warning(f"Failed to decode JSON from payload: {payload}")
+            except Exception as e:
+                with counters_lock:
+                    counters["decode_errors"] += 1
+                logging.error(f"Error processing message: {e}")
+            decode_timer.add(time.monotonic() - t_start)
+
+    workers = [threading.Thread(target=worker, name=f"pipeline-{i}", daemon=True)
+               for i in range(config.workers)]
+    for w in workers:
+        w.start()
+    logging.info(f"Pipeline started: workers={config.workers}, queue_size={config.queue_size}, overflow={config.overflow}")
+
     # MQTT-Client für MQTT v3.1.1 über TCP, paho-mqtt 2.x callback-API V2.
     client = mqtt.Client(
         callback_api_version=mqtt.CallbackAPIVersion.VERSION2,
@@ -76,9 +243,6 @@ def main():
     # Automatisches Reconnect mit Backoff
     client.reconnect_delay_set(min_delay=1, max_delay=30)
 
-    # keys to transfer as tags
-    tag_keys = ["source"]
-
     # Callback: Verbindung hergestellt → Topic abonnieren
     def on_connect(cli, userdata, flags, reason_code, properties):
         rc = reason_code.value if hasattr(reason_code, 'value') else reason_code
@@ -88,57 +252,26 @@ def main():
             res = cli.subscribe(userdata.topic, qos=userdata.qos)
             logging.info(f"Subscribe {userdata.topic} QoS={userdata.qos}: {res}")
 
-    # Callback: Nachricht empfangen
+    # Callback: Nachricht empfangen → nur einreihen, keine Verarbeitung
     def on_message(cli, userdata, msg):
-        topic = msg.topic
-        payload = msg.payload
-        logging.debug(f"Message received on topic '{topic}': {payload}")
-
-        # Versuche JSON-Payload zu parsen
-        try:
-            data = json.loads(payload)
-            if isinstance(data, dict):
-                ts = int(time.time() * 1e9)  # Fallback: aktueller Zeitstempel in Nanosekunden
-                if "ts" in data:
-                    raw_ts = data["ts"]
-                    # FORMAT_A: ts ist ISO-8601-String mit μs-Praezision
-                    # (z.B. "2026-05-10T12:30:00.779682Z"). Backwards-compat:
-                    # falls noch jemand int-ns sendet, wird das ebenfalls
-                    # akzeptiert (zum nahtlosen Roll-out).
-                    if isinstance(raw_ts, str):
-                        from datetime import datetime, timezone
-                        dt = datetime.fromisoformat(raw_ts.replace('Z', '+00:00'))
-                        # Drift-frei via timedelta-int-arithmetik. Naiver
-                        # int(dt.timestamp() * 1e9) verliert ca. 48% der μs-Werte
-                        # um 1 μs nach unten (Float-mantissa-Quantisierung bei
-                        # 1.7e18) — was Live/Backfill-Dedup im ReplacingMergeTree
-                        # bricht.
-                        delta = dt - datetime(1970, 1, 1, tzinfo=timezone.utc)
-                        ts = ((delta.days * 86400 + delta.seconds) * 1_000_000 + delta.microseconds) * 1000
-                    else:
-                        ts = int(raw_ts)
-                    del data["ts"]
-                # move tag keys to separate dict
-                tags = {k: str(data[k]) for k in tag_keys if k in data}
-                for k in tags.keys():
-                    del data[k]
-               
-                json_body = [
-                    {
-                        "measurement": topic.split('/')[-1],  # letzter Teil des Topics als Messung
-                        "tags": tags,
-                        "fields": data,
-                        "time": ts
-                    }
-                ]
-                influx_client.write_points(json_body, time_precision='n', protocol='json')
-                logging.debug(f"Data written to InfluxDB: {json_body}")
-            else:
-                logging.warning(f"Received JSON is not a dict: {data}")
-        except json.JSONDecodeError:
-            logging.warning(f"Failed to decode JSON from payload: {payload}")
-        except Exception as e:
-            logging.error(f"Error processing message: {e}")
+        logging.debug(f"Message received on topic '{msg.topic}': {msg.payload}")
+        with counters_lock:
+            counters["received"] += 1
+        item = (msg.topic, msg.payload, time.monotonic())
+        if userdata.overflow == "block":
+            pipeline.put(item)
+        else:
+            try:
+                pipeline.put_nowait(item)
+            except queue.Full:
+                with counters_lock:
+                    counters["dropped"] += 1
+                logging.debug(f"Pipeline queue full, dropped message on {msg.topic}")
+                return
+        depth = pipeline.qsize()
+        with counters_lock:
+            if depth > counters["queue_max"]:
+                counters["queue_max"] = depth
 
     # Callback: Verbindung verloren/geschlossen
     def on_disconnect(cli, userdata, disconnect_flags, reason_code, properties):
@@ -169,12 +302,41 @@ def main():
         port = int(port)
         client.connect_async(host, port, keepalive=config.keepalive)
         client.loop_start()
-        # Hauptschleife: Warten bis Stop
+        # Hauptschleife: Warten bis Stop, periodische Stats-Zeile
+        last_stats_log = time.time()
         while not stop["flag"]:
             time.sleep(0.2)
+            if time.time() - last_stats_log > config.stats_interval:
+                st = writer.stats(reset=True)
+                wait_avg, wait_max = wait_timer.snapshot(reset=True)
+                decode_avg, decode_max = decode_timer.snapshot(reset=True)
+                with counters_lock:
+                    cnt = dict(counters)
+                    counters["queue_max"] = pipeline.qsize()
+                line = (f"Stats: received={cnt['received']}, dropped={cnt['dropped']}, "
+                        f"decode_errors={cnt['decode_errors']}, "
+                        f"queue={pipeline.qsize()}, queue_max={cnt['queue_max']}, "
+                        f"wait_ms_avg={wait_avg:.1f}, wait_ms_max={wait_max:.1f}, "
+                        f"decode_ms_avg={decode_avg:.2f}, decode_ms_max={decode_max:.2f}, "
+                        f"written={st['written']}, failed={st['failed']}, rejected={st['rejected']}, "
+                        f"batches={st['batches']}, pending={st['pending']}, "
+                        f"batch_avg={st['batch_avg']:.1f}, batch_max={st['batch_max']}, "
+                        f"flush_ms_avg={st['flush_ms_avg']:.1f}, flush_ms_max={st['flush_ms_max']:.1f}")
+                if spool is not None:
+                    line += (f", spooled={st['spooled']}, replayed={st['replayed']}, "
+                             f"spool_records={st['spool_records']}, spool_bytes={st['spool_bytes']}, "
+                             f"spool_dropped={st['spool_dropped']}, outage={st['outage']}")
+                logging.info(line)
+                last_stats_log = time.time()
     finally:
-        # Loop sauber stoppen
+        # Loop sauber stoppen, Queue abarbeiten, danach Restpuffer flushen
+        # (SIGTERM von docker stop)
         client.loop_stop()
+        for _ in workers:
+            pipeline.put(None)
+        for w in workers:
+            w.join(timeout=30)
+        writer.close()
     return 0
 
 if __name__ == "__main__":
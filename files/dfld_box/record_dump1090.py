@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+"""
+record_dump1090.py - Record the dump1090 JSON line stream for replay_flyover.py
+
+Connects to DUMP1090_SERVER (the same stream detect_flyover.py reads) and
+writes every line with its arrival unix time to a gzip file:
+
+    <arrival time>\\t<raw json line>
+
+Usage:
+    python record_dump1090.py capture.jsonl.gz [--server host:port] [--duration 3600]
+"""
+import os
+import sys
+import gzip
+import time
+import socket
+import logging
+import argparse
+
+
+def record(server, path, duration=None):
+    """record until duration seconds passed (or forever), return number of lines"""
+    host, port = server.split(':')
+    sock = socket.create_connection((host, int(port)))
+    logging.info(f'recording {server} to {path}...')
+    t_end = time.time() + duration if duration else None
+    n = 0
+    try:
+        with sock.makefile('r') as f, gzip.open(path, 'wt', encoding='utf-8') as out:
+            for line in f:
+                now = time.time()
+                line = line.rstrip('\n')
+                if line:
+                    out.write(f'{now:.6f}\t{line}\n')
+                    n += 1
+                    if n % 10000 == 0:
+                        logging.info(f'{n} lines recorded')
+                if t_end is not None and now >= t_end:
+                    break
+    finally:
+        sock.close()
+    return n
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Record the dump1090 line stream with arrival timestamps')
+    parser.add_argument('out', help='output file (gzip)')
+    parser.add_argument('--server', default=os.environ.get('DUMP1090_SERVER', 'ultrafeeder:30047'),
+                        help='dump1090 JSON server host:port (default: $DUMP1090_SERVER)')
+    parser.add_argument('--duration', type=float, default=None, help='seconds to record (default: until Ctrl+C)')
+    parser.add_argument('--log-level', default='INFO', choices=['DEBUG', 'INFO', 'WARNING', 'ERROR'])
+    args = parser.parse_args()
+    logging.basicConfig(format='%(asctime)s - %(levelname)s:%(message)s', level=args.log_level)
+
+    try:
+        n = record(args.server, args.out, args.duration)
+    except KeyboardInterrupt:
+        logging.info('stopped')
+        return 0
+    logging.info(f'{n} lines recorded to {args.out}')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+"""
+replay_flyover.py - Replay a dump1090 capture through detect_flyover.TrajectoryPool
+
+Feeds a capture of record_dump1090.py through TrajectoryPool with a virtual
+clock (arrival time of the current line replaces time.time() for expiry and
+event timestamps), reports lines/s and per-line latency percentiles, and
+compares the emitted event_raw points with a golden file.
+
+Usage:
+    python replay_flyover.py capture.jsonl.gz --station 8.57:50.03:111 [--speed 0]
+                             [--golden events.json | --write-golden events.json]
+
+--speed 1 replays in real time, N is N times faster, 0 (default) as fast as possible.
+"""
+import os
+import sys
+import gzip
+import json
+import time
+import math
+import logging
+import argparse
+
+from dfld import ZoneIndex
+from detect_flyover import make_pool, parse_homes
+
+
+class CollectingWriter:
+    """stands in for the InfluxDB event writer, keeps the points"""
+
+    def __init__(self):
+        self.points = []
+
+    def write(self, point):
+        self.points.append(point)
+
+
+def read_capture(path):
+    """yield (arrival time, raw line) from a record_dump1090.py capture"""
+    opener = gzip.open if path.endswith('.gz') else open
+    with opener(path, 'rt', encoding='utf-8') as f:
+        for line in f:
+            t, _, raw = line.rstrip('\n').partition('\t')
+            yield float(t), raw
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(p / 100.0 * len(sorted_values)))]
+
+
+def replay(capture, station, speed=0.0, pool_cls=make_pool, zones=None):
+    """
+    :param capture: iterable of (arrival time, raw line)
+    :param station: [lon, lat, alt] or list of homes from parse_homes()
+    :param speed: 0 = as fast as possible, 1 = real time, N = N times faster
+    :param zones: optional ZoneIndex
+    :return: (event points, stats dict)
+    """
+    vt = [0.0]
+    pool = pool_cls(station, zones=zones) if zones is not None else pool_cls(station)
+    pool.clock = lambda: vt[0]
+    writer = CollectingWriter()
+    pool.set_writer(writer)
+
+    latencies = []
+    t0 = wall0 = None
+    t_start = time.perf_counter()
+    for t, raw in capture:
+        if t0 is None:
+            t0, wall0 = t, time.perf_counter()
+        if speed > 0:
+            delay = (t - t0) / speed - (time.perf_counter() - wall0)
+            if delay > 0:
+                time.sleep(delay)
+        vt[0] = t
+        t_line = time.perf_counter()
+        # same handling as the detect_flyover main loop
+        try:
+            data = json.loads(raw)
+        except ValueError:
+            continue
+        pool.update(data)
+        latencies.append(time.perf_counter() - t_line)
+    elapsed = time.perf_counter() - t_start
+
+    latencies.sort()
+    stats = {
+        'lines': len(latencies),
+        'seconds': elapsed,
+        'lines_per_s': len(latencies) / elapsed if elapsed else 0.0,
+        'p50_us': 1e6 * percentile(latencies, 50),
+        'p90_us': 1e6 * percentile(latencies, 90),
+        'p99_us': 1e6 * percentile(latencies, 99),
+        'max_us': 1e6 * latencies[-1] if latencies else 0.0,
+        'events': len(writer.points),
+    }
+    stats.update(pool.stats())
+    return writer.points, stats
+
+
+def _same_value(a, b, rel_tol):
+    if isinstance(a, float) or isinstance(b, float):
+        try:
+            return math.isclose(float(a), float(b), rel_tol=rel_tol, abs_tol=rel_tol)
+        except (TypeError, ValueError):
+            return False
+    return a == b
+
+
+def compare_events(events, golden, rel_tol=1e-3):
+    """
+    compare event points with golden points (same order)
+    :return: list of difference descriptions, empty if equal
+    """
+    diffs = []
+    if len(events) != len(golden):
+        diffs.append(f'{len(events)} events, golden has {len(golden)}')
+    for i, (ev, gold) in enumerate(zip(events, golden)):
+        for key in ('measurement', 'tags', 'time'):
+            if ev.get(key) != gold.get(key):
+                diffs.append(f'event {i}: {key} {ev.get(key)!r} != {gold.get(key)!r}')
+        fields, gold_fields = ev['fields'], gold['fields']
+        for k in sorted(set(fields) | set(gold_fields)):
+            if k not in fields or k not in gold_fields or not _same_value(fields[k], gold_fields[k], rel_tol):
+                diffs.append(f'event {i}: field {k} {fields.get(k)!r} != {gold_fields.get(k)!r}')
+    return diffs
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Replay a dump1090 capture through TrajectoryPool',
+                                     formatter_class=argparse.RawDescriptionHelpFormatter, epilog=__doc__)
+    parser.add_argument('capture', help='capture file of record_dump1090.py')
+    parser.add_argument('--station', default=os.environ.get('STATION_POSITIONS') or os.environ.get('STATION_POSITION'),
+                        help='lon:lat:alt or homes name=lon:lat:alt[:active[:event]],... '
+                             '(default: $STATION_POSITIONS or $STATION_POSITION)')
+    parser.add_argument('--speed', type=float, default=0.0, help='0 = max, 1 = real time, N = N times faster')
+    parser.add_argument('--zones', default=os.environ.get('ZONES_FILE'), help='zones file (default: $ZONES_FILE)')
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument('--golden', help='compare events with this golden file')
+    group.add_argument('--write-golden', help='store the events as golden file')
+    parser.add_argument('--tolerance', type=float, default=1e-3, help='relative tolerance for float fields')
+    parser.add_argument('--log-level', default='WARNING', choices=['DEBUG', 'INFO', 'WARNING', 'ERROR'])
+    args = parser.parse_args()
+    logging.basicConfig(format='%(asctime)s - %(levelname)s:%(message)s', level=args.log_level)
+    if not args.station:
+        parser.error('--station or STATION_POSITION required')
+
+    if '=' in args.station:
+        station = parse_homes(args.station)
+    else:
+        station = [float(x) for x in args.station.split(':')]
+    zones = ZoneIndex.load(args.zones) if args.zones else None
+    events, stats = replay(read_capture(args.capture), station, speed=args.speed, zones=zones)
+    print(f"{stats['lines']} lines in {stats['seconds']:.2f}s: {stats['lines_per_s']:,.0f} lines/s, "
+          f"latency p50={stats['p50_us']:.1f}us p90={stats['p90_us']:.1f}us "
+          f"p99={stats['p99_us']:.1f}us max={stats['max_us']:.0f}us")
+    print(f"{stats['events']} events, {stats['aircraft']} aircraft cached, "
+          f"box reject ratio {stats['reject_ratio']:.3f}")
+    if stats['predicted']:
+        print(f"{stats['predicted']} approaching events, {stats['pred_reconciled']} reconciled, "
+              f"{stats['pred_false']} passed outside event range, mean abs error "
+              f"t0={stats['pred_t0_err_avg']:.1f}s dist_xy={stats['pred_dist_xy_err_avg']:.0f}m "
+              f"dist_z={stats['pred_dist_z_err_avg']:.0f}m")
+
+    if args.write_golden:
+        with open(args.write_golden, 'w') as f:
+            json.dump(events, f, indent=1)
+        print(f'golden file written: {args.write_golden}')
+    elif args.golden:
+        with open(args.golden) as f:
+            golden = json.load(f)
+        diffs = compare_events(events, golden, rel_tol=args.tolerance)
+        if diffs:
+            print(f'{len(diffs)} differences to {args.golden}:')
+            for d in diffs[:50]:
+                print(f'  {d}')
+            return 1
+        print(f'events match {args.golden}')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,66 @@
+from dfld.Beast import BeastDecoder, escape_frame, pack_batch, unpack_batch
+
+SHORT = bytes([0x1a, 0x32]) + bytes(range(1, 7)) + b'\x20' + bytes.fromhex('5d3c6614c3b1a9')
+LONG = bytes([0x1a, 0x33]) + bytes(range(1, 7)) + b'\x21' + bytes.fromhex('8d4ca2d158c901a0c0e47c2b5a1a')
+MODE_AC = bytes([0x1a, 0x31]) + bytes(6) + b'\x10' + b'\x1a\x05'
+
+
+def test_frames_across_chunk_boundaries():
+    stream = b''.join(escape_frame(f) for f in [SHORT, LONG, MODE_AC] * 20)
+    for chunk_size in (1, 3, 7, 64, 4096):
+        decoder = BeastDecoder(buffer_size=256)
+        frames = []
+        for i in range(0, len(stream), chunk_size):
+            frames += decoder.feed(stream[i:i + chunk_size])
+        assert frames == [SHORT, LONG, MODE_AC] * 20, chunk_size
+        assert decoder.resyncs == 0 and decoder.dropped_bytes == 0
+
+
+def test_escaped_bytes_are_unescaped():
+    assert escape_frame(LONG).count(b'\x1a\x1a') == 1
+    decoder = BeastDecoder()
+    assert decoder.feed(escape_frame(LONG) + escape_frame(MODE_AC)) == [LONG, MODE_AC]
+
+
+def test_resync_after_garbage_and_truncated_frame():
+    decoder = BeastDecoder()
+    # leading garbage, a frame cut off by a new frame start, unknown type
+    stream = b'\x00\x01' + escape_frame(SHORT)[:6] + escape_frame(LONG) + b'\x1a\x99' + escape_frame(SHORT)
+    assert decoder.feed(stream) == [LONG, SHORT]
+    assert decoder.resyncs == 2
+    assert decoder.dropped_bytes == 2 + 6 + 1 + 1
+
+
+def test_reset_discards_partial_frame():
+    decoder = BeastDecoder()
+    assert decoder.feed(escape_frame(LONG)[:10]) == []
+    decoder.reset()
+    assert decoder.feed(escape_frame(SHORT)) == [SHORT]
+
+
+def test_binary_batch_roundtrip():
+    frames = [SHORT, LONG, MODE_AC] * 10
+    payload = pack_batch('FRA-0815', frames, 1747000000.123)
+    assert unpack_batch(payload) == ('FRA-0815', 1747000000.123, frames)
+    assert len(payload) < sum(len(f) for f in frames) + 20
+    for bad in (b'{"station": "x"}', payload[:-1], payload + b'\x00'):
+        try:
+            unpack_batch(bad)
+        except ValueError:
+            pass
+        else:
+            assert False, 'expected ValueError'
+
+
+if __name__ == '__main__':
+    tests = [name for name in sorted(dir()) if name.startswith('test_')]
+    passed = failed = 0
+    for test in tests:
+        try:
+            globals()[test]()
+            print(f"  PASS  {test}")
+            passed += 1
+        except (AssertionError, Exception) as e:
+            print(f"  FAIL  {test}: {e}")
+            failed += 1
+    print(f"\n{passed} passed, {failed} failed")
@@ -0,0 +1,399 @@
+import json
+import math
+import time
+
+from dfld import NoiseBuffer, ZoneIndex
+from detect_flyover import (TrajectoryPool, Trajectory, MultiHomePool, NoiseEnricher, ShardRouter,
+                            noise_sample, parse_homes, parse_noise_topics, shard_of)
+
+HOME = [8.5, 50.0, 100.0]
+
+
+def point(hex_id, now, lon=8.5, lat=50.0):
+    return {'hex': hex_id, 'lon': lon, 'lat': lat, 'alt_baro': 3000, 'now': now, 'rssi': -20.0}
+
+
+class FakeWriter:
+    def __init__(self):
+        self.points = []
+
+    def write(self, point):
+        self.points.append(point)
+
+
+def make_pool(t):
+    pool = TrajectoryPool(HOME)
+    pool.clock = lambda: t[0]
+    pool.set_writer(FakeWriter())
+    return pool
+
+
+def test_expiry_reset_and_purge():
+    t = [1000.0]
+    pool = make_pool(t)
+    pool.update(point('a', 1000.0))
+    pool.update(point('a', 1001.0, lon=8.501))
+    assert pool['a'].n_points == 2
+
+    t[0] = 1001.0 + TrajectoryPool.TIMEOUT_TRAJ + 1
+    pool.update(point('b', t[0], lon=9.5))
+    assert pool['a'].n_points == 0  # dumped and reset, still cached
+
+    t[0] = 1001.0 + TrajectoryPool.TIMEOUT_CACHE + 1
+    pool.update(point('b', t[0], lon=9.5))
+    assert 'a' not in pool.pool and 'b' in pool.pool
+
+
+def test_update_postpones_expiry():
+    t = [1000.0]
+    pool = make_pool(t)
+    pool.update(point('a', 1000.0))
+    for i in range(1, 4):
+        t[0] = 1000.0 + i * (TrajectoryPool.TIMEOUT_TRAJ - 100)
+        pool.update(point('a', t[0], lon=8.5 + i * 0.001))
+    assert pool['a'].n_points == 4
+    assert len(pool._expiry) == 1
+
+
+def test_resumed_trajectory_times_out_again():
+    t = [1000.0]
+    pool = make_pool(t)
+    pool.update(point('a', 1000.0))
+    t[0] = 1000.0 + TrajectoryPool.TIMEOUT_TRAJ + 1
+    pool.update(point('b', t[0], lon=9.5))
+    assert pool['a'].n_points == 0
+    # 'a' comes back after the reset and goes idle again
+    t_resume = t[0] + 10
+    t[0] = t_resume
+    pool.update(point('a', t_resume))
+    pool.update(point('a', t_resume + 1, lon=8.501))
+    assert pool['a'].n_points == 2
+    t[0] = t_resume + 1 + TrajectoryPool.TIMEOUT_TRAJ + 2
+    pool.update(point('b', t[0], lon=9.5))
+    assert t[0] < 1000.0 + TrajectoryPool.TIMEOUT_CACHE
+    assert pool['a'].n_points == 0
+
+def test_purge_at_most_once_per_interval():
+    t = [1000.0]
+    pool = make_pool(t)
+    pool.update(point('a', 1000.0))
+    t[0] = 1000.5
+    pool.update(point('b', 1000.0 - TrajectoryPool.TIMEOUT_CACHE - 10))  # stale data
+    assert 'b' in pool.pool
+    t[0] = 1000.0 + TrajectoryPool.PURGE_INTERVAL
+    pool.update(point('c', t[0]))
+    assert 'b' not in pool.pool and 'a' in pool.pool
+
+
+def test_bounding_box_prefilter():
+    t = [1000.0]
+    pool = make_pool(t)
+    lon_min, lon_max, lat_min, lat_max = pool.box
+    # every point on the ACTIVE_RANGE circle lies inside the box
+    for deg in range(0, 360, 5):
+        a = math.radians(deg)
+        dlat = math.degrees(Trajectory.ACTIVE_RANGE * math.cos(a) / TrajectoryPool.EARTH_RADIUS)
+        dlon = math.degrees(Trajectory.ACTIVE_RANGE * math.sin(a) / TrajectoryPool.EARTH_RADIUS
+                            / math.cos(math.radians(HOME[1])))
+        assert lat_min < HOME[1] + dlat < lat_max and lon_min < HOME[0] + dlon < lon_max
+    pool.update(point('a', 1000.0, lon=8.56, lat=50.035))  # box corner: in box, out of range
+    pool.update(point('b', 1000.0, lon=10.0))
+    pool.update(point('c', 1000.0, lat=48.0))
+    assert (pool.positions, pool.box_rejected) == (3, 2)
+
+
+def test_leaving_box_resets_trajectory():
+    t = [1000.0]
+    pool = make_pool(t)
+    pool.update(point('a', 1000.0))
+    pool.update(point('a', 1001.0, lon=8.501))
+    assert pool['a'].in_zone
+    pool.update(point('a', 1002.0, lon=12.0))
+    assert not pool['a'].in_zone and pool['a'].n_points == 0
+
+
+def test_point_cap_and_downsampling():
+    t = [1000.0]
+    pool = make_pool(t)
+    pool.update(point('a', 1000.0))
+    traj = pool['a']
+    cap = Trajectory.MAX_POINTS
+    for i in range(1, 3 * cap):
+        traj.add_point(8.5, 50.0, 900.0, 1000.0 + i, -20.0, math.nan)
+    assert traj.n_points <= cap
+    times = [p[3] for p in traj.points()]
+    assert times == sorted(times) and times[-1] > 1000.0 + 2 * cap
+    # evenly spaced after downsampling
+    steps = {b - a for a, b in zip(times, times[1:])}
+    assert len(steps) == 1
+
+
+def test_info_keeps_last_known_values():
+    t = [1000.0]
+    pool = make_pool(t)
+    data = point('a', 1000.0)
+    data.update({'flight': 'DLH123  ', 't': 'A320'})
+    pool.update(data)
+    pool.update(point('a', 1001.0, lon=8.501))
+    assert pool['a'].info['flight'] == 'DLH123  ' and pool['a'].info['t'] == 'A320'
+
+
+def test_flyover_event_queued_to_writer():
+    t = [1000.0]
+    pool = make_pool(t)
+    for i in range(60):
+        t[0] = 1000.0 + i
+        data = point('3c4594', t[0], lon=8.47 + i * 0.001)
+        data.update({'flight': 'BOX457  ', 'alt_baro': 1000})
+        pool.update(data)
+    assert len(pool.writer.points) == 1
+    event = pool.writer.points[0]
+    assert event['measurement'] == 'event_raw' and event['tags']['flight'] == 'BOX457'
+    assert 1029 * 10**9 <= event['time'] <= 1032 * 10**9  # time of detection, ns
+    assert event['fields']['dist_xy'] < 100
+
+
+def test_predicted_closest_approach():
+    t = [1000.0]
+    pool = make_pool(t)
+    for i in range(60):
+        t[0] = 1000.0 + i
+        data = point('3c4594', t[0], lon=8.47 + i * 0.001, lat=50.002)
+        # 0.001 deg lon per second at 50 deg north: 71.6 m/s due east, descending 5 m/s
+        data.update({'flight': 'BOX457  ', 'alt_baro': 1000 - i * 16.4, 'gs': 139.1, 'track': 90.0,
+                     'baro_rate': -984})
+        pool.update(data)
+    pred, event = pool.writer.points
+    assert pred['measurement'] == 'event_pred' and event['measurement'] == 'event_raw'
+    assert pred['time'] < 1010 * 10**9  # written while approaching
+    assert abs(pred['fields']['t0'] - 1030.0) < 2.0
+    assert abs(pred['fields']['dist_xy'] - 222) < 30
+    fields = event['fields']
+    assert abs(fields['pred_t0_err']) < 2.0 and abs(fields['pred_dist_xy_err']) < 50
+    assert abs(fields['pred_dist_z_err']) < 20 and fields['pred_lead'] > 20
+    st = pool.stats()
+    assert (st['predicted'], st['pred_reconciled'], st['pred_false']) == (1, 1, 0)
+    assert st['pred_t0_err_avg'] == abs(fields['pred_t0_err'])
+
+
+def test_no_prediction_without_velocity():
+    t = [1000.0]
+    pool = make_pool(t)
+    for i in range(60):
+        t[0] = 1000.0 + i
+        data = point('3c4594', t[0], lon=8.47 + i * 0.001)
+        data.update({'alt_baro': 1000, 'gs': 139.1})  # no track
+        pool.update(data)
+    assert [p['measurement'] for p in pool.writer.points] == ['event_raw']
+    assert 'pred_t0_err' not in pool.writer.points[0]['fields']
+
+
+def test_parse_homes():
+    homes = parse_homes('garten=8.5:50.0:100, dach=8.7:50.1:140:6000:3500')
+    assert homes == [('garten', [8.5, 50.0, 100.0], None, None), ('dach', [8.7, 50.1, 140.0], 6000.0, 3500.0)]
+    for spec in ('8.5:50.0:100', 'a=8.5:50.0', 'a=8.5:50:1,a=8.6:50:1'):
+        try:
+            parse_homes(spec)
+            assert False, spec
+        except ValueError:
+            pass
+
+
+def test_multi_home_events_tagged_per_home():
+    t = [1000.0]
+    pool = MultiHomePool(parse_homes('a=8.5:50.0:100,b=8.7:50.0:100:5000:200,c=12.0:48.0:500'))
+    pool.clock = lambda: t[0]
+    writer = FakeWriter()
+    pool.set_writer(writer)
+    for i in range(300):
+        t[0] = 1000.0 + i
+        # due east over a (at i=30), 222 m north of b (at i=230)
+        pool.update(point('3c4594', t[0], lon=8.47 + i * 0.001, lat=50.0 if i < 130 else 50.002))
+    pool.update(point('3c6dd2', t[0], lon=10.0, lat=50.0))
+    assert [(p['measurement'], p['tags']['home']) for p in writer.points] == [('event_raw', 'a')]
+    a, b, c = pool.pools
+    assert (len(a.pool), len(b.pool), len(c.pool)) == (1, 1, 0)  # c far away, never updated
+    assert a['3c4594'].n_points == 0  # left a's zone, reset
+    assert b['3c4594'].flyover_detected  # passed b, but outside its 200 m event range
+    st = pool.stats()
+    assert pool.unindexed == 1 and st['aircraft'] == 2 and st['positions'] < 600
+
+
+def test_multi_home_far_zone_and_purge_without_traffic():
+    t = [1000.0]
+    # zone 100 km east of both homes
+    zones = ZoneIndex.from_config([{"name": "far", "corridor": [[9.98, 50.0], [10.02, 50.0]], "width": 500}])
+    pool = MultiHomePool(parse_homes('a=8.5:50.0:100,b=8.6:50.0:100'), zones=zones)
+    pool.clock = lambda: t[0]
+    writer = FakeWriter()
+    pool.set_writer(writer)
+    for i in range(5):
+        t[0] = 1000.0 + i
+        pool.update(point('3c4594', t[0], lon=9.99 + i * 0.001))
+    # signal lost inside the zone, only traffic far from every home and zone afterwards
+    t[0] = 1004.0 + TrajectoryPool.TIMEOUT_TRAJ + 1
+    pool.update(point('3c6dd2', t[0], lon=12.0, lat=48.0))
+    zone_events = [(p['tags']['home'], p['tags']['event']) for p in writer.points if p['measurement'] == 'event_zone']
+    assert sorted(zone_events) == sorted([(h, e) for h in 'ab' for e in ('entry', 'closest', 'exit')])
+    assert pool.unindexed == 1
+
+
+def test_zone_events_and_admission():
+    t = [1000.0]
+    zones = ZoneIndex.from_config([{"name": "07", "corridor": [[8.48, 50.0], [8.52, 50.0]], "width": 500,
+                                    "alt_max": 1000}])
+    pool = TrajectoryPool(HOME, zones=zones)
+    pool.clock = lambda: t[0]
+    pool.set_writer(FakeWriter())
+    for i in range(70):
+        t[0] = 1000.0 + i
+        data = point('3c4594', t[0], lon=8.47 + i * 0.001)
+        data.update({'flight': 'BOX457  ', 'alt_baro': 1000})
+        pool.update(data)
+        pool.update(point('3c6dd2', t[0], lon=8.47 + i * 0.001, lat=50.01))  # parallel, outside
+    zone_events = [p for p in pool.writer.points if p['measurement'] == 'event_zone']
+    assert [p['tags']['event'] for p in zone_events] == ['entry', 'closest', 'exit']
+    entry, closest, leave = zone_events
+    assert entry['tags']['zone'] == '07' and entry['tags']['flight'] == 'BOX457'
+    assert 1010 * 10**9 <= entry['time'] <= 1011 * 10**9
+    assert closest['fields']['dist_xy'] < 100 and 1030 * 10**9 <= closest['time'] <= 1032 * 10**9
+    assert 39.0 <= leave['fields']['duration'] <= 41.0
+    # station flyover detection unchanged for admitted aircraft, the other one has no state
+    assert [p['measurement'] for p in pool.writer.points].count('event_raw') == 1
+    assert list(pool.pool) == ['3c4594'] and pool.zone_rejected == 70 + entry['time'] // 10**9 - 1000
+
+
+def test_zone_exit_on_timeout():
+    t = [1000.0]
+    zones = ZoneIndex.from_config([{"name": "07", "corridor": [[8.48, 50.0], [8.52, 50.0]], "width": 500}])
+    pool = TrajectoryPool(HOME, zones=zones)
+    pool.clock = lambda: t[0]
+    pool.set_writer(FakeWriter())
+    for i in range(5):
+        t[0] = 1000.0 + i
+        pool.update(point('3c4594', t[0], lon=8.49 + i * 0.001))
+    # signal lost inside the zone
+    t[0] = 1004.0 + TrajectoryPool.TIMEOUT_TRAJ + 1
+    pool.update(point('3c6dd2', t[0], lon=8.49, lat=50.1))
+    zone_events = [p for p in pool.writer.points if p['measurement'] == 'event_zone']
+    assert [p['tags']['event'] for p in zone_events] == ['entry', 'closest', 'exit']
+    leave = zone_events[-1]
+    assert leave['fields']['duration'] == 4.0 and leave['fields']['timeout'] is True
+    assert pool['3c4594'].zone_visits == {}
+
+
+def test_noise_sample():
+    assert noise_sample(b'{"dB_A_avg": 52.5, "ts": "1970-01-01T00:16:40.000000Z"}') == (1000.0, 52.5)
+    assert noise_sample(b'{"ts": "1970-01-01T00:16:40.000000Z"}') is None
+    assert noise_sample(b'not json') is None
+
+
+def test_noise_enricher_waits_for_window():
+    buf = NoiseBuffer(seconds=300)
+    for t in range(900, 1100):
+        buf.add(t, 70.0 if 1025 <= t < 1035 else 40.0)
+    writer = FakeWriter()
+    enricher = NoiseEnricher(writer, buf, before=60, after=30)
+    t = [1000.0]
+    pool = make_pool(t)
+    pool.set_writer(enricher)
+    for i in range(60):
+        t[0] = 1000.0 + i
+        data = point('3c4594', t[0], lon=8.47 + i * 0.001)
+        data.update({'alt_baro': 1000, 'gs': 139.1, 'track': 90.0})
+        pool.update(data)
+    assert [p['measurement'] for p in writer.points] == ['event_pred']  # event_raw held back
+    enricher.poll(now=1059.0)
+    assert len(writer.points) == 1
+    enricher.poll(now=1061.0)
+    fields = writer.points[1]['fields']
+    assert fields['LAmax'] == 70.0 and fields['t10'] == 10.0 and fields['SEL'] == 80.0
+    assert -5.0 <= fields['LAmax_offset'] <= -4.0
+    assert enricher.stats()['enriched'] == 1
+
+
+def test_noise_per_home():
+    assert parse_noise_topics('a=dfld/sensors/noise/spl/a, b=mic2/spl', ['a', 'b']) == \
+        [('a', 'dfld/sensors/noise/spl/a'), ('b', 'mic2/spl')]
+    for spec in ('a', 'x=mic/spl', 'a=m1,a=m2'):
+        try:
+            parse_noise_topics(spec, ['a', 'b'])
+            assert False, spec
+        except ValueError:
+            pass
+    loud, quiet = NoiseBuffer(seconds=300), NoiseBuffer(seconds=300)
+    for t in range(900, 1100):
+        loud.add(t, 80.0 if t == 1000 else 40.0)
+        quiet.add(t, 50.0 if t == 1001 else 30.0)
+    writer = FakeWriter()
+    enricher = NoiseEnricher(writer, {'a': loud, 'b': quiet}, before=60, after=30)
+    for home in ('b', 'a', 'c'):
+        enricher.write({'measurement': 'event_raw', 'tags': {'home': home}, 'fields': {'t0': 1000.0}, 'time': 0})
+    enricher.poll(now=1031.0)
+    assert [p['fields'].get('LAmax') for p in writer.points] == [50.0, 80.0, None]
+    st = enricher.stats()
+    assert st['enriched'] == 2 and st['no_noise'] == 1 and st['noise_samples'] == 400
+    assert 0.0 <= st['hold_ms_max'] < 1000.0
+
+
+def test_shard_of_stable_per_aircraft():
+    line = json.dumps(point('3c4594', 1000.0))
+    assert shard_of(line, 4) == shard_of(line.replace('"hex": ', '"hex":'), 4)
+    assert shard_of('{"now":1000.0,"hex":"3c4594","lat":50.0}', 4) == shard_of(line, 4)
+    assert {shard_of(json.dumps(point(f'{i:06x}', 1000.0)), 4) for i in range(100)} == {0, 1, 2, 3}
+    assert shard_of('{"now":1000.0}', 4) is None
+
+
+def test_shard_router_forwards_events():
+    writer = FakeWriter()
+    router = ShardRouter(2, HOME, writer, batch_lines=10)
+    t0 = time.time() - 100
+    for i in range(60):
+        for hex_id, flight in (('3c4594', 'BOX457  '), ('3c6dd2', 'DLH9U   ')):
+            data = point(hex_id, t0 + i, lon=8.47 + i * 0.001)
+            data.update({'flight': flight, 'alt_baro': 1000})
+            router.feed(json.dumps(data))
+    router.feed('{"now":1000.0}')
+    router.close(timeout=30)
+    assert sorted(p['tags']['flight'] for p in writer.points) == ['BOX457', 'DLH9U']
+    st = router.stats()
+    assert st['lines'] == 120 and st['unrouted'] == 1 and sum(st['shard_lines']) == 120
+
+
+def test_ground_altitude_is_skipped():
+    t = [1000.0]
+    pool = make_pool(t)
+    data = point('3c4594', 1000.0)
+    data['alt_baro'] = 'ground'
+    pool.update(data)
+    assert pool['3c4594'].n_points == 0 and pool.positions == 0
+
+
+def test_shard_router_restarts_dead_worker():
+    writer = FakeWriter()
+    router = ShardRouter(2, HOME, writer, batch_lines=10, flush_interval=0.0)
+    router._workers[0].terminate()
+    router._workers[0].join()
+    t0 = time.time() - 100
+    for i in range(60):
+        for hex_id, flight in (('3c4594', 'BOX457  '), ('3c6dd2', 'DLH9U   ')):
+            data = point(hex_id, t0 + i, lon=8.47 + i * 0.001)
+            data.update({'flight': flight, 'alt_baro': 1000})
+            router.feed(json.dumps(data))
+    router.close(timeout=30)
+    assert sorted(p['tags']['flight'] for p in writer.points) == ['BOX457', 'DLH9U']
+    assert router.stats()['restarts'] == 1
+
+
+if __name__ == '__main__':
+    tests = [name for name in sorted(dir()) if name.startswith('test_')]
+    passed = failed = 0
+    for test in tests:
+        try:
+            globals()[test]()
+            print(f"  PASS  {test}")
+            passed += 1
+        except (AssertionError, Exception) as e:
+            print(f"  FAIL  {test}: {e}")
+            failed += 1
+    print(f"\n{passed} passed, {failed} failed")
@@ -0,0 +1,46 @@
+import json
+
+from dfld.Envelope import pack_envelope, unpack_envelope
+
+
+MESSAGES = [
+    ('sensebox/x/spl', json.dumps({'ts': f'2026-05-10T12:30:{i:02d}.000000Z', 'dB_A_avg': 40.0 + i}).encode(), 1000.0 + i)
+    for i in range(30)
+] + [('sensebox/x/bme', b'{"t": 21.5}', 1030.0), ('sensebox/x/spl', b'', 1031.0)]
+
+
+def test_roundtrip_all_codecs():
+    for codec in ('none', 'zlib', 'gzip'):
+        header, messages = unpack_envelope(pack_envelope(MESSAGES, codec=codec))
+        assert messages == [(t, p) for t, p, _ in MESSAGES], codec
+        assert header['topics'] == ['sensebox/x/spl', 'sensebox/x/bme']
+        assert header['counts'] == [31, 1]
+        assert header['t0'] == 1000.0 and header['t1'] == 1031.0
+
+
+def test_compression_shrinks_payload():
+    raw = sum(len(p) for _, p, _ in MESSAGES)
+    assert len(pack_envelope(MESSAGES, codec='zlib')) < raw / 2
+
+
+def test_invalid_envelope_rejected():
+    try:
+        unpack_envelope(b'{"ts": 1}')
+    except ValueError:
+        pass
+    else:
+        assert False, 'expected ValueError'
+
+
+if __name__ == '__main__':
+    tests = [name for name in sorted(dir()) if name.startswith('test_')]
+    passed = failed = 0
+    for test in tests:
+        try:
+            globals()[test]()
+            print(f"  PASS  {test}")
+            passed += 1
+        except (AssertionError, Exception) as e:
+            print(f"  FAIL  {test}: {e}")
+            failed += 1
+    print(f"\n{passed} passed, {failed} failed")
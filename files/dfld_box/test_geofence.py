@@ -0,0 +1,55 @@
+from dfld.Geofence import Zone, ZoneIndex
+
+# approach corridor 25R: threshold east of FRA, 10 km to the east
+CONFIG = [
+    {"name": "25R", "corridor": [[8.59, 50.04], [8.73, 50.04]], "width": 1000, "alt_max": 1200},
+    {"name": "nord", "polygon": [[8.5, 50.1], [8.6, 50.1], [8.55, 50.2]], "alt_min": 300},
+]
+
+
+def test_corridor_width_and_altitude():
+    zones = ZoneIndex.from_config(CONFIG)
+    corridor = zones.zones[0]
+    # 1000 m wide: +-0.0045 deg latitude
+    assert corridor.contains(8.65, 50.044, 800) and not corridor.contains(8.65, 50.0455, 800)
+    assert not corridor.contains(8.65, 50.04, 1300)
+    assert corridor.contains(8.65, 50.04)  # no altitude given
+    assert not corridor.contains(8.58, 50.04, 800)  # before the threshold
+
+
+def test_polygon():
+    zone = Zone('tri', [(0.0, 0.0), (1.0, 0.0), (0.5, 1.0)])
+    assert zone.contains(0.5, 0.5) and not zone.contains(0.1, 0.8) and not zone.contains(0.5, -0.1)
+
+
+def test_index_lookup():
+    zones = ZoneIndex.from_config(CONFIG)
+    assert [z.name for z in zones.lookup(8.65, 50.04, 800)] == ['25R']
+    assert [z.name for z in zones.lookup(8.55, 50.15, 800)] == ['nord']
+    assert zones.lookup(8.55, 50.15, 100) == ()
+    assert zones.lookup(9.5, 49.0, 800) == ()
+    # only the cells of the zone boxes are populated
+    assert all(len(v) == 1 for v in zones.cells.values())
+
+
+def test_invalid_config():
+    for config in ([{"name": "x"}], [{"name": "x", "polygon": [[0, 0], [1, 1]]}], CONFIG + CONFIG[:1]):
+        try:
+            ZoneIndex.from_config(config)
+            assert False, config
+        except ValueError:
+            pass
+
+
+if __name__ == '__main__':
+    tests = [name for name in sorted(dir()) if name.startswith('test_')]
+    passed = failed = 0
+    for test in tests:
+        try:
+            globals()[test]()
+            print(f"  PASS  {test}")
+            passed += 1
+        except (AssertionError, Exception) as e:
+            print(f"  FAIL  {test}: {e}")
+            failed += 1
+    print(f"\n{passed} passed, {failed} failed")
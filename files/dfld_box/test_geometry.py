@@ -0,0 +1,75 @@
+import math
+import random
+
+from dfld.Geometry import LocalFrame, norm, closest_approach
+
+R = 6371000
+HOME = (8.5706, 50.0333, 111.0)
+
+
+def xyz(lon, lat, alt):
+    # former detect_flyover TrajectoryPool.xyz (spherical earth, earth-fixed)
+    lon = lon * 3.141592653589793 / 180.0
+    lat = lat * 3.141592653589793 / 180.0
+    return ((R + alt) * math.cos(lat) * math.cos(lon),
+            (R + alt) * math.cos(lat) * math.sin(lon),
+            (R + alt) * math.sin(lat))
+
+
+def sub(a, b):
+    return tuple(x - y for x, y in zip(a, b))
+
+
+def reference(p0, p1):
+    """former dist, dist_xy, lambda_, dist_0 for the step p0 -> p1"""
+    home = xyz(*HOME)
+    v0 = sub(xyz(*p0), home)
+    v1 = sub(xyz(*p1), home)
+    dist_xy = norm(sub(xyz(p1[0], p1[1], HOME[2]), home))
+    d = sub(v1, v0)
+    lambda_ = -sum(a * b for a, b in zip(v0, d)) / sum(a * a for a in d)
+    dist_0 = norm(tuple(a + lambda_ * b for a, b in zip(v0, d)))
+    return norm(v1), dist_xy, lambda_, dist_0
+
+
+def test_matches_spherical_formula():
+    frame = LocalFrame(*HOME)
+    rnd = random.Random(1)
+    for _ in range(1000):
+        p0 = (HOME[0] + rnd.uniform(-0.1, 0.1), HOME[1] + rnd.uniform(-0.1, 0.1), rnd.uniform(0, 3000))
+        p1 = (p0[0] + rnd.uniform(-0.003, 0.003), p0[1] + rnd.uniform(-0.003, 0.003), p0[2] + rnd.uniform(-30, 30))
+        dist, dist_xy, lambda_, dist_0 = reference(p0, p1)
+        v1, new_dist_xy = frame.project(*p1)
+        new_lambda, new_dist_0 = closest_approach(frame.enu(*p0), v1)
+        # reference loses ~1e-9 relative to the earth radius in the xyz differences
+        assert abs(norm(v1) - dist) < 0.01
+        assert abs(new_dist_xy - dist_xy) < 0.01
+        assert abs(new_dist_0 - dist_0) < 0.05
+        assert abs(new_lambda - lambda_) < 1e-3 * max(1.0, abs(lambda_))
+
+
+def test_station_is_origin():
+    frame = LocalFrame(*HOME)
+    assert norm(frame.enu(*HOME)) < 1e-6
+    e, n, u = frame.enu(HOME[0], HOME[1], HOME[2] + 1000)
+    assert abs(e) < 1e-6 and abs(n) < 1e-6 and abs(u - 1000) < 1e-6
+    e, n, u = frame.enu(HOME[0], HOME[1] + 0.01, HOME[2])
+    assert n > 1000 and abs(e) < 1e-6
+
+
+def test_closest_approach_without_movement():
+    assert closest_approach((1.0, 2.0, 3.0), (1.0, 2.0, 3.0)) == (1e9, 1e9)
+
+
+if __name__ == '__main__':
+    tests = [name for name in sorted(dir()) if name.startswith('test_')]
+    passed = failed = 0
+    for test in tests:
+        try:
+            globals()[test]()
+            print(f"  PASS  {test}")
+            passed += 1
+        except (AssertionError, Exception) as e:
+            print(f"  FAIL  {test}: {e}")
+            failed += 1
+    print(f"\n{passed} passed, {failed} failed")
@@ -0,0 +1,283 @@
+import os
+import time
+import tempfile
+
+from dfld.InfluxWriter import BatchedInfluxWriter, make_line
+from dfld.Spool import SegmentSpool
+
+
+class ClientError(Exception):
+    """same attributes as influxdb.exceptions.InfluxDBClientError"""
+
+    def __init__(self, content, code):
+        super().__init__(content)
+        self.content = content
+        self.code = code
+
+
+class FakeClient:
+    def __init__(self, fail=False, fail_times=0, reject=()):
+        self.calls = []
+        self.fail = fail
+        self.fail_times = fail_times
+        self.reject = reject  # lines answered with 400 (field type conflict)
+
+    def write_points(self, points, time_precision=None, database=None, protocol='json'):
+        if self.fail:
+            raise ConnectionError('influxdb down')
+        if self.fail_times:
+            self.fail_times -= 1
+            raise ConnectionError('influxdb restarting')
+        if any(p in self.reject for p in points):
+            raise ClientError('partial write: field type conflict', 400)
+        assert protocol == 'line'
+        assert time_precision == 'n'
+        self.calls.append(list(points))
+        return True
+
+    def ping(self):
+        if self.fail:
+            raise ConnectionError('influxdb down')
+        return '1.8.10'
+
+
+def test_make_line_types_and_escaping():
+    point = {
+        "measurement": "spl",
+        "tags": {"source": "dnms usb", "empty": ""},
+        "fields": {"dB_A_avg": 42.5, "count": 3, "ok": True, "label": 'a "b"', "skip": None},
+        "time": 1700000000123456789,
+    }
+    line = make_line(point)
+    assert line == ('spl,source=dnms\\ usb '
+                    'count=3i,dB_A_avg=42.5,label="a \\"b\\"",ok=true '
+                    '1700000000123456789'), line
+
+
+def test_make_line_without_fields():
+    assert make_line({"measurement": "spl", "fields": {"x": None}, "time": 1}) is None
+
+
+def test_flush_on_batch_size():
+    client = FakeClient()
+    writer = BatchedInfluxWriter(client, batch_size=3, flush_interval=60)
+    writer.start()
+    for i in range(7):
+        writer.write({"measurement": "spl", "fields": {"v": float(i)}, "time": i})
+    deadline = time.time() + 2
+    while len(client.calls) < 2 and time.time() < deadline:
+        time.sleep(0.01)
+    assert [len(c) for c in client.calls] == [3, 3]
+    writer.close()
+    assert [len(c) for c in client.calls] == [3, 3, 1]
+    st = writer.stats()
+    assert st['written'] == 7
+    assert st['batches'] == 3
+    assert st['batch_max'] == 3
+
+
+def test_flush_on_interval():
+    client = FakeClient()
+    writer = BatchedInfluxWriter(client, batch_size=500, flush_interval=0.05)
+    writer.start()
+    writer.write({"measurement": "spl", "fields": {"v": 1.0}, "time": 1})
+    deadline = time.time() + 2
+    while not client.calls and time.time() < deadline:
+        time.sleep(0.01)
+    assert client.calls == [["spl v=1.0 1"]]
+    writer.close()
+
+
+def test_failed_write_is_counted():
+    writer = BatchedInfluxWriter(FakeClient(fail=True), batch_size=2, flush_interval=60)
+    writer.write({"measurement": "spl", "fields": {"v": 1.0}, "time": 1})
+    writer.close()
+    st = writer.stats()
+    assert st['failed'] == 1
+    assert st['written'] == 0
+
+
+def test_outage_is_spooled_and_replayed_in_time_order():
+    client = FakeClient(fail=True)
+    with tempfile.TemporaryDirectory() as d:
+        writer = BatchedInfluxWriter(client, batch_size=2, flush_interval=60,
+                                     spool=SegmentSpool(d), replay_interval=0.05)
+        writer.start()
+        for t in (5, 3, 4, 1):
+            writer.write({"measurement": "spl", "fields": {"v": float(t)}, "time": t})
+        deadline = time.time() + 2
+        while writer.stats()['spooled'] < 4 and time.time() < deadline:
+            time.sleep(0.01)
+        assert writer.stats()['spooled'] == 4
+        assert writer.stats()['outage']
+
+        client.fail = False
+        deadline = time.time() + 2
+        while writer.stats()['replayed'] < 4 and time.time() < deadline:
+            time.sleep(0.01)
+        writer.close()
+        assert client.calls == [["spl v=1.0 1", "spl v=3.0 3", "spl v=4.0 4", "spl v=5.0 5"]]
+        assert writer.stats()['spool_records'] == 0
+
+
+def test_bounded_retries_and_latency():
+    client = FakeClient(fail_times=2)
+    writer = BatchedInfluxWriter(client, batch_size=10, flush_interval=60, retries=2, retry_delay=0.01,
+                                 track_latency=True)
+    # latency counts from write(), not from the (older) point time
+    writer.write({"measurement": "event_raw", "fields": {"v": 1.0}, "time": time.time_ns() - 2 * 10**9})
+    writer.close()
+    st = writer.stats()
+    assert st['written'] == 1 and st['retried'] == 2 and st['failed'] == 0
+    assert 30 <= st['latency_ms_max'] < 1000  # the two retry delays
+
+    client = FakeClient(fail_times=3)
+    writer = BatchedInfluxWriter(client, batch_size=10, flush_interval=60, retries=2, retry_delay=0.01)
+    writer.write({"measurement": "event_raw", "fields": {"v": 1.0}, "time": 1})
+    writer.close()
+    assert writer.stats()['failed'] == 1 and client.calls == []
+
+
+def test_rejected_point_is_bisected_out():
+    client = FakeClient(reject=('spl v="x" 3',))
+    writer = BatchedInfluxWriter(client, batch_size=500, flush_interval=60, retries=2, retry_delay=0.01)
+    for i in range(8):
+        writer.write({"measurement": "spl", "fields": {"v": "x" if i == 3 else float(i)}, "time": i})
+    writer.close()
+    written = [line for call in client.calls for line in call]
+    assert len(written) == 7 and 'spl v="x" 3' not in written
+    st = writer.stats()
+    assert st['written'] == 7 and st['rejected'] == 1 and st['failed'] == 0 and st['retried'] == 0
+
+
+def test_auth_error_is_an_outage_and_oversized_batch_is_split():
+    class AuthClient(FakeClient):
+        def write_points(self, points, **kwargs):
+            self.calls.append(list(points))
+            raise ClientError('authorization failed', 401)
+
+    client = AuthClient()
+    with tempfile.TemporaryDirectory() as d:
+        writer = BatchedInfluxWriter(client, batch_size=500, flush_interval=60, spool=SegmentSpool(d))
+        for i in range(8):
+            writer.write({"measurement": "spl", "fields": {"v": float(i)}, "time": i})
+        writer.close()
+        st = writer.stats()
+        assert len(client.calls) == 1  # no bisecting
+        assert st['spooled'] == 8 and st['rejected'] == 0 and st['outage']
+
+    class SizeClient(FakeClient):
+        def write_points(self, points, **kwargs):
+            if len(points) > 2 or any(len(p) > 40 for p in points):
+                raise ClientError('request entity too large', 413)
+            self.calls.append(list(points))
+
+    client = SizeClient()
+    with tempfile.TemporaryDirectory() as d:
+        quarantine = f'{d}/rejected.lp'
+        writer = BatchedInfluxWriter(client, batch_size=500, flush_interval=60, quarantine=quarantine)
+        for i in range(8):
+            writer.write({"measurement": "spl", "fields": {"v": "x" * 50 if i == 5 else float(i)}, "time": i})
+        writer.close()
+        st = writer.stats()
+        assert sum(len(c) for c in client.calls) == 7 and st['rejected'] == 1
+        assert not os.path.exists(quarantine)
+
+
+def test_rejected_spool_record_does_not_block_replay():
+    client = FakeClient(fail=True, reject=('spl v="x" 2',))
+    with tempfile.TemporaryDirectory() as d:
+        quarantine = f'{d}/rejected.lp'
+        writer = BatchedInfluxWriter(client, batch_size=2, flush_interval=60, spool=SegmentSpool(f'{d}/spool'),
+                                     replay_interval=0.05, quarantine=quarantine)
+        writer.start()
+        for t in (1, 2, 3, 4):
+            writer.write({"measurement": "spl", "fields": {"v": "x" if t == 2 else float(t)}, "time": t})
+        deadline = time.time() + 2
+        while writer.stats()['spooled'] < 4 and time.time() < deadline:
+            time.sleep(0.01)
+
+        client.fail = False
+        deadline = time.time() + 2
+        while writer.stats()['replayed'] < 3 and time.time() < deadline:
+            time.sleep(0.01)
+        # live points after the poisoned record are written, not spooled
+        writer.write({"measurement": "spl", "fields": {"v": 5.0}, "time": 5})
+        writer.write({"measurement": "spl", "fields": {"v": 6.0}, "time": 6})
+        deadline = time.time() + 2
+        while writer.stats()['written'] < 2 and time.time() < deadline:
+            time.sleep(0.01)
+        writer.close()
+        st = writer.stats()
+        assert st['replayed'] == 3 and st['rejected'] == 1 and st['written'] == 2
+        assert not st['outage'] and st['spool_records'] == 0
+        with open(quarantine) as f:
+            assert f.read() == 'spl v="x" 2\n'
+
+
+def test_rejected_event_does_not_block_event_writer():
+    # detect_flyover settings: small batches, retries with backoff, spool
+    client = FakeClient(reject=('event_raw dist="far" 1',))
+    with tempfile.TemporaryDirectory() as d:
+        writer = BatchedInfluxWriter(client, batch_size=50, flush_interval=0.05, spool=SegmentSpool(d),
+                                     retries=3, retry_delay=0.01)
+        writer.start()
+        writer.write({"measurement": "event_raw", "fields": {"dist": "far"}, "time": 1})
+        for t in (2, 3):
+            writer.write({"measurement": "event_raw", "fields": {"dist": float(t)}, "time": t})
+        deadline = time.time() + 2
+        while writer.stats()['written'] < 2 and time.time() < deadline:
+            time.sleep(0.01)
+        writer.write({"measurement": "event_raw", "fields": {"dist": 4.0}, "time": 4})
+        writer.close()
+        st = writer.stats()
+        assert st['written'] == 3 and st['rejected'] == 1
+        assert st['retried'] == 0 and st['spooled'] == 0 and not st['outage']
+
+
+def test_replay_keeps_spool_on_auth_error():
+    client = FakeClient(fail=True)
+    with tempfile.TemporaryDirectory() as d:
+        writer = BatchedInfluxWriter(client, batch_size=2, flush_interval=60, spool=SegmentSpool(d),
+                                     replay_interval=0.05, quarantine=f'{d}/rejected.lp')
+        writer.start()
+        for t in (1, 2, 3, 4):
+            writer.write({"measurement": "spl", "fields": {"v": float(t)}, "time": t})
+        deadline = time.time() + 2
+        while writer.stats()['spooled'] < 4 and time.time() < deadline:
+            time.sleep(0.01)
+
+        # InfluxDB answers ping() again, but the credentials were changed
+        client.fail = False
+        client.reject = ('spl v=1.0 1', 'spl v=2.0 2', 'spl v=3.0 3', 'spl v=4.0 4')
+        write_points = client.write_points
+
+        def forbidden(points, **kwargs):
+            if client.reject:
+                raise ClientError('forbidden', 403)
+            return write_points(points, **kwargs)
+        client.write_points = forbidden
+        time.sleep(0.3)
+        st = writer.stats()
+        assert st['spool_records'] == 4 and st['rejected'] == 0 and st['replayed'] == 0 and st['outage']
+
+        client.reject = ()
+        deadline = time.time() + 2
+        while writer.stats()['replayed'] < 4 and time.time() < deadline:
+            time.sleep(0.01)
+        writer.close()
+        assert writer.stats()['spool_records'] == 0 and not os.path.exists(f'{d}/rejected.lp')
+
+
+if __name__ == '__main__':
+    tests = [name for name in sorted(dir()) if name.startswith('test_')]
+    passed = failed = 0
+    for test in tests:
+        try:
+            globals()[test]()
+            print(f"  PASS  {test}")
+            passed += 1
+        except (AssertionError, Exception) as e:
+            print(f"  FAIL  {test}: {e}")
+            failed += 1
+    print(f"\n{passed} passed, {failed} failed")
@@ -0,0 +1,62 @@
+from dfld.ModeS import ModeSFilter, crc24_remainder
+
+
+def frame(msg, ts=b'\x00' * 6):
+    msg = bytes.fromhex(msg) if isinstance(msg, str) else msg
+    return bytes([0x1a, 0x33 if len(msg) == 14 else 0x32]) + ts + b'\x20' + msg
+
+
+DF17 = bytes.fromhex('8D4840D6202CC371C32CE0576098')  # valid, ICAO 4840D6
+DF17_CORRUPT = DF17[:5] + bytes([DF17[5] ^ 0x04]) + DF17[6:]
+
+
+def df11(icao, iid=0):
+    data = bytes([0x5d]) + icao.to_bytes(3, 'big')
+    parity = crc24_remainder(data + b'\x00\x00\x00') ^ iid
+    return data + parity.to_bytes(3, 'big')
+
+
+def test_crc24_remainder():
+    assert crc24_remainder(DF17) == 0
+    assert crc24_remainder(DF17_CORRUPT) != 0
+    assert crc24_remainder(df11(0x3c6614, iid=5)) == 5
+
+
+def test_crc_filter():
+    f = ModeSFilter(dedup_window=0)
+    frames = [frame(DF17), frame(DF17_CORRUPT), frame(df11(0x3c6614, iid=3)), frame(df11(0x3c6614, iid=0x80))]
+    assert f.filter(frames, 0.0) == [frames[0], frames[2]]
+    assert f.crc_failed == 2 and f.passed == 2
+
+
+def test_dedup_window():
+    f = ModeSFilter(dedup_window=1.0)
+    # same message, different MLAT timestamps: still a duplicate
+    assert len(f.filter([frame(DF17, b'\x00' * 6), frame(DF17, b'\x01' * 6)], 100.0)) == 1
+    assert f.filter([frame(DF17)], 100.9) == []
+    assert len(f.filter([frame(DF17)], 102.0)) == 1
+    assert f.duplicates == 2
+
+
+def test_allow_lists():
+    f = ModeSFilter(dedup_window=0, df_allow={17}, icao_allow={0x4840d6})
+    mode_ac = bytes([0x1a, 0x31]) + b'\x00' * 7 + b'\x12\x34'
+    assert f.filter([frame(DF17), frame(df11(0x4840d6)), mode_ac], 0.0) == [frame(DF17)]
+    assert f.df_filtered == 2
+    f = ModeSFilter(dedup_window=0, icao_allow={0x3c6614})
+    assert f.filter([frame(DF17), frame(df11(0x3c6614))], 0.0) == [frame(df11(0x3c6614))]
+    assert f.icao_filtered == 1
+
+
+if __name__ == '__main__':
+    tests = [name for name in sorted(dir()) if name.startswith('test_')]
+    passed = failed = 0
+    for test in tests:
+        try:
+            globals()[test]()
+            print(f"  PASS  {test}")
+            passed += 1
+        except (AssertionError, Exception) as e:
+            print(f"  FAIL  {test}: {e}")
+            failed += 1
+    print(f"\n{passed} passed, {failed} failed")
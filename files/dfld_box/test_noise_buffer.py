@@ -0,0 +1,43 @@
+import math
+
+from dfld.NoiseBuffer import NoiseBuffer
+
+
+def test_ring_overwrites_and_skips_gaps():
+    buf = NoiseBuffer(seconds=10)
+    for t in range(1000, 1020):
+        if t != 1015:
+            buf.add(t + 0.5, float(t - 1000))
+    assert buf.window(1000, 1019) == [(t, float(t - 1000)) for t in range(1010, 1020) if t != 1015]
+    assert buf.window(1000, 1004) == []  # overwritten
+    assert buf.window(1005, 1005) == [(1005, 5.0)]  # slot not reused, 1015 missing
+
+
+def test_metrics_of_flyover():
+    buf = NoiseBuffer(seconds=600)
+    # background 40 dB, 10 s at 60 dB, peak 65 dB at 1005, 45 dB shoulder
+    for t in range(900, 1100):
+        buf.add(t, 40.0)
+    for t in range(1000, 1010):
+        buf.add(t, 60.0)
+    buf.add(1005, 65.0)
+    buf.add(1010, 54.0)  # below LAmax - 10
+    m = buf.metrics(1004.2, before=60, after=30)
+    assert m['LAmax'] == 65.0 and m['t_max'] == 1005.0 and m['t10'] == 10.0
+    energy = 9 * 10 ** 6.0 + 10 ** 6.5
+    assert math.isclose(m['SEL'], 10 * math.log10(energy))
+    assert buf.metrics(2000.0) is None
+
+
+if __name__ == '__main__':
+    tests = [name for name in sorted(dir()) if name.startswith('test_')]
+    passed = failed = 0
+    for test in tests:
+        try:
+            globals()[test]()
+            print(f"  PASS  {test}")
+            passed += 1
+        except (AssertionError, Exception) as e:
+            print(f"  FAIL  {test}: {e}")
+            failed += 1
+    print(f"\n{passed} passed, {failed} failed")
@@ -0,0 +1,54 @@
+import os
+import gzip
+import json
+import tempfile
+
+from replay_flyover import read_capture, replay, compare_events
+
+STATION = [8.5, 50.0, 100.0]
+
+
+def write_capture(path):
+    with gzip.open(path, 'wt', encoding='utf-8') as f:
+        for i in range(60):
+            t = 1747000000.0 + i
+            for hex_id, lat in (('3c4594', 50.0), ('4ca2d1', 51.0)):
+                data = {'now': t, 'hex': hex_id, 'flight': 'BOX457  ', 'lon': 8.47 + i * 0.001, 'lat': lat,
+                        'alt_baro': 1000, 'rssi': -17.1}
+                f.write(f'{t + 0.05:.6f}\t{json.dumps(data)}\n')
+        f.write(f'{t + 0.1:.6f}\tnot json\n')
+
+
+def test_replay_is_deterministic_and_matches_golden():
+    with tempfile.TemporaryDirectory() as d:
+        path = os.path.join(d, 'capture.jsonl.gz')
+        write_capture(path)
+        assert sum(1 for _ in read_capture(path)) == 121
+        events, stats = replay(read_capture(path), STATION)
+        assert stats['lines'] == 120 and stats['events'] == 1
+        assert stats['box_rejected'] == 60
+        # virtual clock: event time comes from the capture, not the wall clock
+        assert 1747000025 * 10**9 < events[0]['time'] < 1747000060 * 10**9
+
+        golden = json.loads(json.dumps(events))
+        again, _ = replay(read_capture(path), STATION)
+        assert compare_events(again, golden) == []
+
+        golden[0]['fields']['dist_xy'] += 5.0
+        golden[0]['tags']['flight'] = 'DLH1'
+        diffs = compare_events(again, golden)
+        assert len(diffs) == 2 and 'dist_xy' in diffs[1]
+
+
+if __name__ == '__main__':
+    tests = [name for name in sorted(dir()) if name.startswith('test_')]
+    passed = failed = 0
+    for test in tests:
+        try:
+            globals()[test]()
+            print(f"  PASS  {test}")
+            passed += 1
+        except (AssertionError, Exception) as e:
+            print(f"  FAIL  {test}: {e}")
+            failed += 1
+    print(f"\n{passed} passed, {failed} failed")
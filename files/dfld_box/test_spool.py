@@ -0,0 +1,145 @@
+import os
+import tempfile
+
+from dfld.ForwardQueue import ForwardQueue
+from dfld.Spool import SegmentSpool
+
+
+def test_fifo_across_segments():
+    with tempfile.TemporaryDirectory() as d:
+        spool = SegmentSpool(d, segment_bytes=64, max_bytes=1 << 20, fsync_interval=0)
+        records = [f'record-{i}'.encode() for i in range(20)]
+        spool.append(records[:10])
+        spool.append(records[10:])
+        assert spool.records == 20
+        out = []
+        while spool.records:
+            batch = spool.read(3)
+            out.extend(batch)
+            spool.commit(len(batch))
+        assert out == records
+        assert spool.read(3) == []
+        spool.close()
+        assert [f for f in os.listdir(d) if f.endswith('.seg')] == []
+
+
+def test_reload_after_restart():
+    with tempfile.TemporaryDirectory() as d:
+        spool = SegmentSpool(d, fsync_interval=0)
+        spool.append([b'a', b'b\nwith newline', b'c'])
+        spool.close()
+        spool = SegmentSpool(d)
+        assert spool.records == 3
+        assert spool.read(10) == [b'a', b'b\nwith newline', b'c']
+        spool.commit(2)
+        assert spool.records == 1
+        spool.append([b'd'])
+        assert spool.read(10) == [b'c']
+        spool.commit(1)
+        assert spool.read(10) == [b'd']
+
+
+def test_torn_tail_is_ignored():
+    with tempfile.TemporaryDirectory() as d:
+        spool = SegmentSpool(d)
+        spool.append([b'complete', b'torn-record'])
+        spool.close()
+        seg = os.path.join(d, sorted(os.listdir(d))[0])
+        with open(seg, 'r+b') as f:
+            f.truncate(os.path.getsize(seg) - 3)
+        spool = SegmentSpool(d)
+        assert spool.records == 1
+        assert spool.read(10) == [b'complete']
+
+
+def test_size_cap_drops_oldest():
+    with tempfile.TemporaryDirectory() as d:
+        spool = SegmentSpool(d, segment_bytes=100, max_bytes=300)
+        for i in range(50):
+            spool.append([b'x' * 40])
+        assert spool.bytes <= 300 + 100
+        assert spool.dropped > 0
+        assert spool.records + spool.dropped == 50
+
+
+def test_forward_queue_keeps_order_when_spilling():
+    with tempfile.TemporaryDirectory() as d:
+        queue = ForwardQueue(max_memory=3, spool=SegmentSpool(d))
+        for i in range(8):
+            queue.put(f'{i}'.encode())
+        assert len(queue) == 8
+        out = []
+        while len(queue):
+            records, source = queue.take(2)
+            # only the first record gets delivered, the second goes back
+            queue.done(records, source, 1)
+            out.append(records[0])
+            if len(out) == 2:
+                queue.put(b'late')
+        assert out == [f'{i}'.encode() for i in range(8)] + [b'late']
+        assert queue.stats()['dropped'] == 0
+
+
+def test_forward_queue_without_spool_drops_oldest():
+    queue = ForwardQueue(max_memory=3)
+    for i in range(5):
+        queue.put(f'{i}'.encode())
+    records, source = queue.take(10)
+    assert records == [b'2', b'3', b'4']
+    assert queue.stats()['dropped'] == 2
+
+
+def test_forward_queue_counts_in_flight_once_and_persists_on_close():
+    with tempfile.TemporaryDirectory() as d:
+        queue = ForwardQueue(max_memory=3, spool=SegmentSpool(d))
+        for i in range(5):
+            queue.put(f'{i}'.encode())
+        records, source = queue.take(2)
+        assert source == 'spool' and len(queue) == 5
+        queue.done(records, source, 2)
+        assert len(queue) == 3
+        records, source = queue.take(10)
+        queue.done(records, source, len(records))
+        queue.put(b'5')
+        records, source = queue.take(2)
+        assert source == 'memory' and records == [b'3', b'4'] and len(queue) == 3
+        # shutdown while the records are being published
+        queue.close()
+        queue.done(records, source, 0)
+        spool = SegmentSpool(d)
+        assert spool.read(10) == [b'3', b'4', b'5']
+
+
+def test_forward_queue_spill_during_take_keeps_order():
+    with tempfile.TemporaryDirectory() as d:
+        queue = ForwardQueue(max_memory=3, spool=SegmentSpool(d))
+        for i in range(3):
+            queue.put(f'{i}'.encode())
+        records, source = queue.take(2)
+        assert source == 'memory' and records == [b'0', b'1']
+        # the producer overflows the memory while 0 and 1 are being published
+        for i in range(3, 6):
+            queue.put(f'{i}'.encode())
+        assert len(queue) == 6
+        queue.done(records, source, 1)
+        assert len(queue) == 5
+        out = []
+        while len(queue):
+            records, source = queue.take(10)
+            queue.done(records, source, len(records))
+            out += records
+        assert out == [f'{i}'.encode() for i in range(1, 6)]
+
+
+if __name__ == '__main__':
+    tests = [name for name in sorted(dir()) if name.startswith('test_')]
+    passed = failed = 0
+    for test in tests:
+        try:
+            globals()[test]()
+            print(f"  PASS  {test}")
+            passed += 1
+        except (AssertionError, Exception) as e:
+            print(f"  FAIL  {test}: {e}")
+            failed += 1
+    print(f"\n{passed} passed, {failed} failed")
@@ -0,0 +1,63 @@
+import json
+
+from dfld.TopicRouter import TopicRouter
+
+
+def test_prefix_rewrite():
+    router = TopicRouter.parse('dfld/sensors/noise/ sensebox/x/:dfld/sensors sensebox/y')
+    assert router.route('dfld/sensors/noise/spl', b'1')[1:] == ('sensebox/x/spl', b'1')
+    assert router.route('dfld/sensors/noise', b'1')[1] == 'sensebox/x'
+    assert router.route('dfld/sensors/bme', b'1')[1] == 'sensebox/y/bme'
+    assert router.route('dfld/sensors_other', b'1')[0] is None
+    assert router.route('other/topic', b'1')[0] is None
+
+
+def test_first_configured_mapping_wins():
+    # same semantics as the former linear startswith() loop
+    router = TopicRouter.parse('dfld sensebox/a:dfld/sensors/noise sensebox/b')
+    assert router.route('dfld/sensors/noise/spl', b'1')[1] == 'sensebox/a/sensors/noise/spl'
+    router = TopicRouter.parse('dfld/sensors/noise sensebox/b:dfld sensebox/a')
+    assert router.route('dfld/sensors/noise/spl', b'1')[1] == 'sensebox/b/spl'
+
+
+def test_field_projection():
+    router = TopicRouter.parse('dfld/sensors/noise sensebox/x fields=ts,dB_A_avg')
+    payload = json.dumps({'ts': 't', 'station': 'x', 'dB_A_avg': 42.1, 'dB_A_min': 30.0}).encode()
+    route, topic, out = router.route('dfld/sensors/noise/spl', payload)
+    assert json.loads(out) == {'ts': 't', 'dB_A_avg': 42.1}
+    assert route.bytes_out < route.bytes_in
+    # non-JSON payloads pass unchanged
+    assert router.route('dfld/sensors/noise/raw', b'\x01\x02')[2] == b'\x01\x02'
+    assert route.projection_errors == 1
+
+
+def test_sampling_per_topic():
+    router = TopicRouter.parse('dfld sensebox/x every=3')
+    forwarded = [router.route(t, b'1')[1] for _ in range(6) for t in ('dfld/a', 'dfld/b')]
+    assert forwarded.count('sensebox/x/a') == 2 and forwarded.count('sensebox/x/b') == 2
+    route = router.routes[0]
+    assert (route.matched, route.forwarded, route.sampled_out) == (12, 4, 8)
+
+
+def test_invalid_spec_rejected():
+    for spec in ('dfld', 'dfld sensebox/x every', 'dfld sensebox/x foo=1'):
+        try:
+            TopicRouter.parse(spec)
+        except ValueError:
+            pass
+        else:
+            assert False, f'expected ValueError for "{spec}"'
+
+
+if __name__ == '__main__':
+    tests = [name for name in sorted(dir()) if name.startswith('test_')]
+    passed = failed = 0
+    for test in tests:
+        try:
+            globals()[test]()
+            print(f"  PASS  {test}")
+            passed += 1
+        except (AssertionError, Exception) as e:
+            print(f"  FAIL  {test}: {e}")
+            failed += 1
+    print(f"\n{passed} passed, {failed} failed")
@@ -15,8 +15,14 @@ import os
 for k in "INFLUXDB_SERVER INFLUXDB_USERNAME INFLUXDB_PASSWORD INFLUXDB_DATABASE INFLUXDB_MEASUREMENT DFLD_STATION DFLD_REGION DFLD_LEGACY DFLD_CKSUM TZ".split():
     os.environ.setdefault(k, 'test')
 
+import re
+import bisect
+import tempfile
+import random
+import numpy as np
 import pytz
-from tsdb2ftp import find_dst_transition, adjust_dst
+import tsdb2ftp
+from tsdb2ftp import find_dst_transition, adjust_dst, map_one_day, PartialDay
 
 
 def test_find_dst_spring_forward_berlin():
@@ -105,6 +111,277 @@ def test_adjust_dst_fall_back():
     assert result[10800] == 3
 
 
+def map_one_day_reference(start_date, res, full_transfer, day_seconds=86400, transition_hour=None):
+    """former pure-Python map_one_day (ISO timestamps), reference for the vectorized version"""
+    src = res.raw['series'][0]['values']
+    t0 = start_date
+    if full_transfer:
+        n_day = day_seconds
+    else:
+        last_time = datetime.datetime.fromisoformat(src[-1][0])
+        n_day = int((last_time - t0).total_seconds()) + 1
+    n_src = len(src)
+    dst_idx = 0
+    src_idx = 0
+    times = [0] * n_src
+    values = [0] * n_src
+    data = [0] * day_seconds
+    for idx, v in enumerate(src):
+        times[idx] = datetime.datetime.fromisoformat(v[0])
+        val = round(v[1])
+        val = min(val, 255)
+        val = max(val, 0)
+        values[idx] = int(val)
+    while dst_idx < n_day:
+        t_idx = t0 + datetime.timedelta(seconds=dst_idx)
+        while src_idx+1 < n_src and abs(times[src_idx]-t_idx) > abs(times[src_idx+1]-t_idx):
+            src_idx += 1
+        data[dst_idx] = values[src_idx]
+        dst_idx += 1
+    if transition_hour is not None and day_seconds != 86400:
+        t = transition_hour * 3600
+        if day_seconds == 82800:
+            data = data[:t] + data[t:t+3600] + data[t:]
+        elif day_seconds == 90000:
+            data = data[:t] + data[t+3600:]
+    return data[:86400]
+
+
+class Result:
+    def __init__(self, values):
+        self.raw = {'series': [{'columns': ['time', 'dB_A_avg'], 'values': values}]} if values is not None else {}
+
+
+def query_result(values, chunked=False, chunk_size=0):
+    """like InfluxDBClient.query: a generator of ResultSets per chunk with chunked=True"""
+    if not chunked:
+        return Result(values)
+    if not values:
+        return iter([Result(None)])
+    return (Result(values[i:i + chunk_size]) for i in range(0, len(values), chunk_size))
+
+
+def make_results(day_start, seconds, seed=1, iso=True):
+    """
+    1 Hz samples with jitter, gaps, bin ties and out-of-range levels
+    :return: (result with epoch='ns' timestamps, same result with ISO timestamps)
+    """
+    rnd = random.Random(seed)
+    epoch = datetime.datetime(1970, 1, 1, tzinfo=pytz.utc)
+    t0_us = (day_start - epoch) // datetime.timedelta(microseconds=1)
+    ns, iso_values = [], []
+    t_us = t0_us - 1_000_000
+    while t_us < t0_us + seconds * 1_000_000:
+        level = rnd.choice([rnd.uniform(25.0, 95.0), 300.0, -3.0, 41.5, 42.5])
+        ns.append([t_us * 1000, level])
+        if iso:
+            iso_values.append([(epoch + datetime.timedelta(microseconds=t_us)).isoformat().replace('+00:00', 'Z'), level])
+        step = rnd.choice([1_000_000, 1_000_000, 1_000_000, 500_000, 1_500_000, 2_000_000, 997_731])
+        t_us += step if rnd.random() > 0.001 else 60_000_000  # rare gap
+    return Result(ns), Result(iso_values)
+
+
+def _compare_with_reference(date, full, partial_seconds=None):
+    tz = pytz.timezone('Europe/Berlin')
+    day_start = tz.localize(date).astimezone(pytz.utc)
+    day_seconds = int((tz.localize(date + datetime.timedelta(days=1)).astimezone(pytz.utc)
+                       - day_start).total_seconds())
+    transition_hour, _ = find_dst_transition(day_start, tz)
+    res_ns, res_iso = make_results(day_start, partial_seconds or day_seconds)
+    data = map_one_day(day_start, res_ns, full, day_seconds, transition_hour)
+    expected = map_one_day_reference(day_start, res_iso, full, day_seconds, transition_hour)
+    assert len(data) == 86400 and data.dtype == np.uint8
+    assert data.tobytes() == bytes(expected)
+
+
+def test_map_one_day_matches_reference_normal_day():
+    _compare_with_reference(datetime.datetime(2026, 4, 4), True)
+
+
+def test_map_one_day_matches_reference_spring_forward():
+    _compare_with_reference(datetime.datetime(2026, 3, 29), True)
+
+
+def test_map_one_day_matches_reference_fall_back():
+    _compare_with_reference(datetime.datetime(2026, 10, 25), True)
+
+
+def test_map_one_day_matches_reference_partial_day():
+    _compare_with_reference(datetime.datetime(2026, 4, 4), False, partial_seconds=40000)
+    _compare_with_reference(datetime.datetime(2026, 10, 25), False, partial_seconds=20000)
+
+
+def test_partial_day_incremental_matches_full_query():
+    tz = pytz.timezone('Europe/Berlin')
+    for date in (datetime.datetime(2026, 4, 4), datetime.datetime(2026, 10, 25)):
+        day_start = tz.localize(date).astimezone(pytz.utc)
+        day_seconds = int((tz.localize(date + datetime.timedelta(days=1)).astimezone(pytz.utc)
+                           - day_start).total_seconds())
+        transition_hour, _ = find_dst_transition(day_start, tz)
+        res_ns, _ = make_results(day_start, 50000)
+        values = res_ns.raw['series'][0]['values']
+        partial = PartialDay(date.strftime('%Y-%m-%d'), day_start, day_seconds, transition_hour)
+        # hourly cycles: each query returns the points after the anchor; 10 points
+        # shortly before the high-water mark arrive late, one cycle after their time
+        cuts = [1, 2, 3000, 3001, 17000, 29999, len(values)]
+        for i, b in enumerate(cuts):
+            late = range(max(0, b - 60), max(0, b - 50)) if i + 1 < len(cuts) else range(0)
+            arrived = [v for k, v in enumerate(values[:b]) if k not in late]
+            anchor = partial.anchor
+            partial.extend([v for v in arrived if anchor is None or v[0] > anchor])
+            assert partial.last == values[b - 1]
+        assert partial.extend([]) == 0
+        data = partial.data
+        if transition_hour is not None:
+            data = adjust_dst(data, day_seconds, transition_hour)
+        expected = map_one_day(day_start, res_ns, False, day_seconds, transition_hour)
+        assert data.tobytes() == expected.tobytes()
+
+
+def test_partial_transfer_requeries_late_window_and_skips_unchanged():
+    now = datetime.datetime(2026, 4, 4, 12, 0)
+    day_start = pytz.timezone('Europe/Berlin').localize(datetime.datetime(2026, 4, 4)).astimezone(pytz.utc)
+    res_ns, _ = make_results(day_start, 3600)
+    values = res_ns.raw['series'][0]['values']
+    # first cycle: points 1950..1959 are not written yet, they arrive late
+    arrivals = [values[:1950] + values[1960:2000], values, values]
+    queries, uploads = [], []
+
+    class Client:
+        def query(self, query, epoch=None):
+            queries.append(query)
+            arrived = arrivals[len(queries) - 1]
+            since = re.search(r'time > (\d+) ', query)
+            return Result([v for v in arrived if since is None or v[0] > int(since.group(1))])
+
+    saved = tsdb2ftp._connect, tsdb2ftp._upload, tsdb2ftp.calc_crc, tsdb2ftp.partial_day, os.environ['TZ']
+    os.environ['TZ'] = 'Europe/Berlin'
+    tsdb2ftp._connect = Client
+    tsdb2ftp._upload = lambda buf, day_str: uploads.append(bytes(buf)) or 'ok'
+    tsdb2ftp.calc_crc = lambda data: sum(data)
+    try:
+        assert tsdb2ftp._do_partial_transfer(now, '20260404') == 'ok'
+        assert tsdb2ftp._do_partial_transfer(now, '20260404') == 'ok'
+        assert tsdb2ftp._do_partial_transfer(now, '20260404') == 'unchanged'
+    finally:
+        tsdb2ftp._connect, tsdb2ftp._upload, tsdb2ftp.calc_crc, tsdb2ftp.partial_day, os.environ['TZ'] = saved
+    assert "time >= ('2026-04-04' -     1s)" in queries[0]
+    # the next query starts at the newest point 600 s before the high-water mark
+    limit = values[1999][0] - tsdb2ftp.PARTIAL_LATE_SECONDS * 1_000_000_000
+    anchor = max(v[0] for v in values[:1950] if v[0] <= limit)
+    assert f"time > {anchor} " in queries[1]
+    assert len(uploads) == 2 and len(uploads[1]) == 86402 and uploads[0] != uploads[1]
+    # late points included: same bins as one query over the whole day
+    expected = map_one_day(day_start, res_ns, False)
+    assert uploads[1][:86400] == expected.tobytes()
+
+
+def test_catch_up_chunks_and_uploads_in_order():
+    tz = pytz.timezone('Europe/Berlin')
+    days = [datetime.date(2026, 10, 22) + datetime.timedelta(days=i) for i in range(7)]
+
+    def start_ns(day):
+        return tsdb2ftp.epoch_ns(tz.localize(datetime.datetime.combine(day, datetime.time.min)).astimezone(pytz.utc))
+
+    res_ns, _ = make_results(tz.localize(datetime.datetime(2026, 10, 22)).astimezone(pytz.utc), 7 * 86400 + 3600,
+                             iso=False)
+    # 2026-10-24 has no data at all
+    gap = (start_ns(days[2]) - 2_000_000_000, start_ns(days[3]))
+    values = [v for v in res_ns.raw['series'][0]['values'] if not gap[0] < v[0] < gap[1]]
+
+    times = [v[0] for v in values]
+
+    def select(first, end):
+        return values[bisect.bisect_left(times, start_ns(first) - 1_000_000_000):
+                      bisect.bisect_left(times, start_ns(end))]
+
+    queries, stored, done = [], [], []
+
+    class Client:
+        def query(self, query, epoch=None, chunked=False, chunk_size=0):
+            queries.append(query)
+            first, end = [datetime.datetime.strptime(d, '%Y-%m-%d').date()
+                          for d in re.findall(r"'(\d{4}-\d{2}-\d{2})'", query)]
+            return query_result(select(first, end), chunked, chunk_size)
+
+    class Session:
+        def store(self, buf, day_str):
+            stored.append((day_str, bytes(buf)))
+            return 'error' if day_str == '20261027' else 'ok'
+
+        def close(self):
+            pass
+
+    saved = tsdb2ftp.FtpSession, tsdb2ftp.calc_crc, os.environ['TZ']
+    tsdb2ftp.FtpSession = Session
+    tsdb2ftp.calc_crc = lambda data: 0
+    os.environ['TZ'] = 'Europe/Berlin'
+    try:
+        assert not tsdb2ftp.CatchUp(Client(), days).run(done.append)
+    finally:
+        tsdb2ftp.FtpSession, tsdb2ftp.calc_crc, os.environ['TZ'] = saved
+    # 7 days in chunks of 3: the failed upload of the 6th day stops the run,
+    # the 7th day (third chunk) was already prefetched while it was uploading
+    assert len(queries) == 3
+    assert [d for d, _ in stored] == ['20261022', '20261023', '20261025', '20261026', '20261027']
+    assert done == days[:5]
+    # same bytes as a single day query
+    for day_str, buf in stored:
+        day = datetime.datetime.strptime(day_str, '%Y%m%d').date()
+        next_day = day + datetime.timedelta(days=1)
+        day_start = tz.localize(datetime.datetime.combine(day, datetime.time.min)).astimezone(pytz.utc)
+        day_seconds = (start_ns(next_day) - start_ns(day)) // 1_000_000_000
+        transition_hour, _ = find_dst_transition(day_start, tz)
+        data = map_one_day(day_start, Result(select(day, next_day)), True, day_seconds, transition_hour)
+        assert buf == data.tobytes() + bytes([0, 0])
+
+
+def test_wwx_cache_and_catch_up_from_cache():
+    tz = pytz.timezone('Europe/Berlin')
+    day = datetime.date(2026, 4, 4)
+    day_start = tz.localize(datetime.datetime(2026, 4, 4)).astimezone(pytz.utc)
+    res_ns, _ = make_results(day_start, 86400 + 60, iso=False)
+    queries, stored = [], []
+
+    class Client:
+        def query(self, query, epoch=None, chunked=False, chunk_size=0):
+            queries.append(query)
+            return query_result(res_ns.raw['series'][0]['values'], chunked, chunk_size)
+
+    class Session:
+        def store(self, buf, day_str):
+            stored.append(bytes(buf))
+            return 'ok'
+
+        def close(self):
+            pass
+
+    env = {'TZ': 'Europe/Berlin', 'DFLD_REGION': '7', 'DFLD_STATION': '42'}
+    saved = tsdb2ftp.FtpSession, tsdb2ftp.calc_crc, {k: os.environ[k] for k in env}
+    tsdb2ftp.FtpSession = Session
+    tsdb2ftp.calc_crc = lambda data: sum(data)
+    os.environ.update(env)
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            cache = tsdb2ftp.WwxCache(os.path.join(tmp, 'cache'), keep_days=100000)
+            assert tsdb2ftp.CatchUp(Client(), [day], cache=cache).run(lambda d: None)
+            assert tsdb2ftp.CatchUp(Client(), [day], cache=cache).run(lambda d: None)
+            assert len(queries) == 1 and stored[0] == stored[1]  # second upload from the cache
+            assert cache.days() == ['20260404'] and cache.path('20260404').name == '007-20260404-042.wwx'
+            assert tsdb2ftp.verify_wwx(cache.load('20260404'))
+
+            corrupt = bytearray(stored[0])
+            corrupt[100] ^= 1
+            cache.path('20260401').write_bytes(corrupt)
+            assert cache.load('20260401') is None and cache.load('20260402') is None
+            cache.keep_days = (datetime.date.today() - datetime.date(2026, 4, 3)).days
+            cache.prune()
+            assert cache.days() == ['20260404']
+    finally:
+        tsdb2ftp.FtpSession, tsdb2ftp.calc_crc, restore = saved
+        os.environ.update(restore)
+
+
 if __name__ == '__main__':
     tests = [name for name in sorted(dir()) if name.startswith('test_')]
     passed = failed = 0
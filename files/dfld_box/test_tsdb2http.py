@@ -0,0 +1,136 @@
+import sys
+import types
+import gzip
+import json
+
+# stub modules so tsdb2http can be imported without influxdb / requests
+for mod in ['influxdb', 'requests']:
+    try:
+        __import__(mod)
+    except ImportError:
+        sys.modules[mod] = types.ModuleType(mod)
+if not hasattr(sys.modules['influxdb'], 'InfluxDBClient'):
+    sys.modules['influxdb'].InfluxDBClient = None
+if not hasattr(sys.modules['requests'], 'RequestException'):
+    sys.modules['requests'].RequestException = type('RequestException', (IOError,), {})
+    sys.modules['requests'].Session = None
+
+# provide required env vars, numeric station only while importing
+import os
+saved = {k: os.environ.get(k) for k in ('DFLD_REGION', 'DFLD_STATION', 'DFLD_BACKFILL_INTERVAL')}
+for k in "INFLUXDB_SERVER INFLUXDB_USERNAME INFLUXDB_PASSWORD INFLUXDB_DATABASE".split():
+    os.environ.setdefault(k, 'test')
+os.environ.update({'DFLD_REGION': '1', 'DFLD_STATION': '2', 'DFLD_BACKFILL_INTERVAL': 'hourly'})
+import tsdb2http
+for k, v in saved.items():
+    if v is None:
+        del os.environ[k]
+    else:
+        os.environ[k] = v
+
+import re
+import pathlib
+import tempfile
+import requests
+
+
+def row_time(i):
+    return f'2026-01-01T00:00:{i:02d}Z'
+
+
+class Result:
+    def __init__(self, series):
+        self.raw = {'series': series} if series else {}
+
+
+class FakeClient:
+    """InfluxDB with one row per second, answers the fetch_chunk() query"""
+
+    def __init__(self, n):
+        self.rows = [[row_time(i), 50.0 + i, 40.0, 60.0] for i in range(1, n + 1)]
+        self.queries = []
+
+    def query(self, query):
+        since = re.search(r"time > '([^']+)'", query).group(1)
+        self.queries.append(since)
+        values = [r for r in self.rows if r[0] > since][:tsdb2http.MAX_BATCH_ROWS]
+        return Result([{'columns': ['time', 'dB_A_avg', 'dB_A_min', 'dB_A_max'], 'values': values}] if values else [])
+
+
+class Response:
+    def __init__(self, code):
+        self.status_code = code
+        self.text = ''
+
+    def json(self):
+        return {'written': 0, 'error_count': 0}
+
+
+class FakeSession:
+    """answers the POSTs with the given codes, an exception instance is raised;
+    posted holds the seconds of the rows per POST"""
+
+    def __init__(self, codes):
+        self.codes = list(codes)
+        self.posted = []
+
+    def post(self, url, data, timeout):
+        code = self.codes.pop(0)
+        if isinstance(code, Exception):
+            raise code
+        self.posted.append([int(json.loads(line)['ts'][17:19]) for line in gzip.decompress(data).decode().splitlines()])
+        return Response(code)
+
+
+def run_cycles(client, *sessions):
+    saved = tsdb2http.STATE_FILE, tsdb2http.BAD_DIR, tsdb2http.MAX_BATCH_ROWS
+    with tempfile.TemporaryDirectory() as d:
+        try:
+            tsdb2http.STATE_FILE = pathlib.Path(d) / 'last-tx.txt'
+            tsdb2http.BAD_DIR = pathlib.Path(d) / 'bad-batches'
+            tsdb2http.MAX_BATCH_ROWS = 2
+            tsdb2http.write_state(row_time(0))
+            states = []
+            for session in sessions:
+                tsdb2http.run_cycle(client, session)
+                states.append(tsdb2http.read_state())
+            return states
+        finally:
+            tsdb2http.STATE_FILE, tsdb2http.BAD_DIR, tsdb2http.MAX_BATCH_ROWS = saved
+
+
+def test_failed_post_discards_prefetch_and_retries():
+    client = FakeClient(5)
+    first, retry, idle = FakeSession([200, 500]), FakeSession([200, 207]), FakeSession([])
+    states = run_cycles(client, first, retry, idle)
+    # batch 3..4 failed: state stays at 2, the prefetched batch 5 is not posted
+    assert first.posted == [[1, 2], [3, 4]]
+    assert states[0] == row_time(2)
+    assert client.queries[:3] == [row_time(0), row_time(2), row_time(4)]
+    # the next cycle starts again at the state, 207 advances it as well
+    assert retry.posted == [[3, 4], [5]]
+    assert states[1] == row_time(5)
+    assert idle.posted == [] and states[2] == row_time(5)
+
+
+def test_connection_error_keeps_state():
+    client = FakeClient(3)
+    down, up = FakeSession([requests.RequestException('timeout')]), FakeSession([200, 200])
+    states = run_cycles(client, down, up)
+    assert down.posted == [] and states[0] == row_time(0)
+    assert up.posted == [[1, 2], [3]]
+    assert states[1] == row_time(3)
+
+
+if __name__ == '__main__':
+    tests = [name for name in sorted(dir()) if name.startswith('test_')]
+    passed = failed = 0
+    for test in tests:
+        try:
+            globals()[test]()
+            print(f"  PASS  {test}")
+            passed += 1
+        except (AssertionError, Exception) as e:
+            print(f"  FAIL  {test}: {e}")
+            failed += 1
+    print(f"\n{passed} passed, {failed} failed")
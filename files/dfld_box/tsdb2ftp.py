@@ -4,10 +4,14 @@ import re
 import sys
 import time
 import ftplib
+import hashlib
 import logging
+import argparse
 import pathlib
 import datetime
+from concurrent.futures import ThreadPoolExecutor
 
+import numpy as np
 import pytz
 
 from influxdb import InfluxDBClient
@@ -24,6 +28,8 @@ if len(missing_env)>0:
     logging.error('following environment variables not set: %s', missing_env)
     sys.exit(1)
 
+EPOCH = datetime.datetime(1970, 1, 1, tzinfo=pytz.utc)
+
 
 def delta_t(t1_str, t2_datetime):
     """
@@ -78,11 +84,11 @@ def adjust_dst(data, day_seconds, transition_hour):
     if day_seconds == 82800:
         # spring forward: insert a copy of the transition hour
         logging.info('DST spring forward: repeating hour %d to fill 23h day', transition_hour)
-        result = data[:t] + data[t:t+3600] + data[t:]
+        result = np.concatenate((data[:t], data[t:t+3600], data[t:]))
     elif day_seconds == 90000:
         # fall back: drop the first occurrence of the double hour
         logging.info('DST fall back: overwriting hour %d with following hour', transition_hour)
-        result = data[:t] + data[t+3600:]
+        result = np.concatenate((data[:t], data[t+3600:]))
     else:
         logging.warning('unexpected day length: %d seconds', day_seconds)
         result = data[:86400]
@@ -90,54 +96,71 @@ def adjust_dst(data, day_seconds, transition_hour):
     return result[:86400]
 
 
+def resample(src, t0, first_bin, n_bins):
+    """
+    nearest sample for the 1 s bins first_bin .. first_bin + n_bins - 1
+    :param src: [[time ns, level], ...] sorted by time (epoch='ns' query)
+    :param t0: start of the day in ns
+    :return: uint8 array with n_bins entries
+    """
+    n_src = len(src)
+    times = np.fromiter((v[0] for v in src), dtype=np.int64, count=n_src)
+    values = np.fromiter((v[1] for v in src), dtype=np.float64, count=n_src)
+
+    # closest measurement for all bins at once: times[j-1] < bin <= times[j],
+    # take the later one only if it is strictly closer (ties go to the earlier)
+    bins = t0 + np.arange(first_bin, first_bin + n_bins, dtype=np.int64) * 1_000_000_000
+    j = np.searchsorted(times, bins, side='left')
+    before = np.clip(j - 1, 0, n_src - 1)
+    after = np.minimum(j, n_src - 1)
+    closest = np.where(times[after] - bins < bins - times[before], after, before)
+
+    # round half to even like round(), limit to one byte
+    levels = np.clip(np.rint(values), 0, 255).astype(np.uint8)
+    return levels[closest]
+
+
+def bins_until(t_ns, t0, day_seconds):
+    """number of bins from the start of the day up to and including the one of t_ns"""
+    return max(0, min(int((t_ns - t0) / 1e9) + 1, day_seconds))
+
+
+def epoch_ns(dt):
+    return (dt - EPOCH) // datetime.timedelta(microseconds=1) * 1000
+
+
 def map_one_day(start_date, res, full_transfer, day_seconds=86400, transition_hour=None):
     """
     map one day of data from influxdb to a 1Hz data array
-    :param start_date: start date of the day
-    :param res: result from influxdb query
+    :param start_date: start date of the day (aware datetime)
+    :param res: result from influxdb query with epoch='ns' (integer timestamps)
     :param full_transfer: if True, transfer all data from yesterday
     :param day_seconds: actual number of seconds in the local day
     :param transition_hour: local hour of DST transition, or None
-    :return: data array with 86400 entries (1Hz)
+    :return: uint8 array with 86400 entries (1Hz)
     """
 
     # check if result is empty
     if len(res.raw['series']) == 0:
         logging.warning('no data found for date %s', start_date)
         return None
+    return map_day(res.raw['series'][0]['values'], start_date, full_transfer, day_seconds, transition_hour)
 
-    # fill data array for one day
-    src = res.raw['series'][0]['values']
-    t0 = start_date
+
+def map_day(src, start_date, full_transfer, day_seconds=86400, transition_hour=None):
+    """
+    map_one_day on the values of a query, [[time ns, level], ...] (non-empty)
+    """
+    t0 = epoch_ns(start_date)
 
     if full_transfer:
         n_day = day_seconds
     else:
-        # calculate the number of seconds from start date to last measurement
-        last_time = datetime.datetime.fromisoformat(src[-1][0])
-        n_day = int((last_time - t0).total_seconds()) + 1
+        # number of seconds from start date to last measurement
+        n_day = bins_until(src[-1][0], t0, day_seconds)
 
-    n_src = len(src)
-    dst_idx = 0
-    src_idx = 0
-    times = [0] * n_src
-    values = [0] * n_src
-    data = [0] * day_seconds
-    for idx, v in enumerate(src):
-        times[idx] = datetime.datetime.fromisoformat(v[0])
-        val = round(v[1])
-        val = min(val, 255)
-        val = max(val, 0)
-        values[idx] = int(val)
-
-    while dst_idx < n_day:
-        t_idx = t0 + datetime.timedelta(seconds=dst_idx)
-        # find closest measurment to bin time t_idx,
-        # skip forward while second (later) value is closer
-        while src_idx+1 < n_src and abs(times[src_idx]-t_idx) > abs(times[src_idx+1]-t_idx):
-            src_idx += 1
-        data[dst_idx] = values[src_idx]
-        dst_idx += 1
+    data = np.zeros(day_seconds, dtype=np.uint8)
+    data[:n_day] = resample(src, t0, 0, n_day)
 
     # adjust for DST transition to produce exactly 86400 entries
     if transition_hour is not None and day_seconds != 86400:
@@ -146,21 +169,87 @@ def map_one_day(start_date, res, full_transfer, day_seconds=86400, transition_ho
     return data
 
 
-def get_data(target_dt, full_day):
+def to_wwx(data):
+    """86400 levels + crc byte + 0x00"""
+    bb = bytearray(data.tobytes())
+    bb.extend([calc_crc(bb) & 0xff, 0x00])
+    return bb
+
+
+PARTIAL_LATE_SECONDS = 600  # trailing window re-queried for late points
+
+
+class PartialDay:
     """
-    get one day of data from influxdb v1
-    :param target_dt: datetime whose date identifies the day to query
-    :param full_day: True for a completed past day (fill full 86400 entries);
-                     False for today's partial (fill up to last measurement)
-    :return: (buf, query_ok). buf is a bytearray on success, None otherwise.
-             query_ok is False only on connection/query failure (transient —
-             caller should retry). An empty result for the queried day
-             returns (None, True) so the caller can distinguish "day has no
-             data" from "influx unreachable".
+    Puffer des laufenden Tages fuer den stuendlichen Teil-Upload.
+
+    Haelt die 1-Hz-Bins bis zur letzten Messung (High-Water-Mark) und die
+    Rohwerte der letzten PARTIAL_LATE_SECONDS davor. Jeder Zyklus fragt ab
+    dem Anker (letzte Messung vor diesem Fenster) ab und baut die Bins ab
+    dem Anker neu; so landen auch verspaetet eingetroffene Punkte mit
+    Zeitstempel vor der High-Water-Mark noch im Teil-Upload. Die
+    Abfrage-Kosten bleiben ueber den Tag konstant. Noch spaetere Punkte
+    kommen mit dem vollen Tag am Folgetag.
     """
 
-    date_str = target_dt.strftime('%Y-%m-%d')
-
+    def __init__(self, date_str, day_start, day_seconds, transition_hour):
+        self.date_str = date_str
+        self.t0 = epoch_ns(day_start)
+        self.day_seconds = day_seconds
+        self.transition_hour = transition_hour
+        self.data = np.zeros(day_seconds, dtype=np.uint8)
+        self.n_day = 0
+        self.last = None           # [time ns, level] of the newest sample
+        self.tail = []             # anchor + samples of the late window, [[time ns, level], ...]
+        self.uploaded_hash = None  # sha1 of the last uploaded file
+
+    @property
+    def anchor(self):
+        """time ns of the next query start (exclusive), None before the first sample"""
+        return self.tail[0][0] if self.tail else None
+
+    def extend(self, values):
+        """
+        :param values: all samples after the anchor, [[time ns, level], ...]
+        :return: number of new bins
+        """
+        if not values:
+            return 0
+        src = self.tail[:1] + values
+        if self.tail:
+            # bins from the anchor on, earlier bins have their neighbours already
+            first_bin = max(0, -(-(src[0][0] - self.t0) // 1_000_000_000))
+        else:
+            first_bin = 0
+        n_day = max(bins_until(src[-1][0], self.t0, self.day_seconds), self.n_day)
+        if n_day > first_bin:
+            self.data[first_bin:n_day] = resample(src, self.t0, first_bin, n_day - first_bin)
+        n_new = n_day - self.n_day
+        self.n_day = n_day
+        self.last = src[-1]
+        # new anchor: newest sample at least PARTIAL_LATE_SECONDS before the high-water mark
+        limit = self.last[0] - PARTIAL_LATE_SECONDS * 1_000_000_000
+        k = 0
+        for i in range(len(src) - 1, -1, -1):
+            if src[i][0] <= limit:
+                k = i
+                break
+        self.tail = src[k:]
+        return n_new
+
+    def wwx(self):
+        data = self.data
+        if self.transition_hour is not None and self.day_seconds != 86400:
+            data = adjust_dst(data, self.day_seconds, self.transition_hour)
+        return to_wwx(data)
+
+
+# today's buffer, replaced when the date changes
+partial_day = None
+
+
+def _connect():
+    """:return: InfluxDBClient or None"""
     try:
         # create connection to influxdb v1
         logging.info('connecting to influx database (%s)...', os.environ["INFLUXDB_SERVER"])
@@ -176,13 +265,17 @@ def get_data(target_dt, full_day):
         logging.debug('switched to database "%s"', os.environ["INFLUXDB_DATABASE"])
     except Exception as e:
         logging.error('failed to connect to influxdb: %s', e)
-        return None, False
+        return None
+    return client
 
-    measurement = os.environ["INFLUXDB_MEASUREMENT"]
 
-    # calculate local day boundaries (handles DST transitions correctly)
-    tz = os.environ['TZ']
-    local_tz = pytz.timezone(tz)
+def _local_day(target_dt):
+    """
+    local day boundaries (handles DST transitions correctly)
+    :return: (date_str, next_date_str, day_start in UTC, day_seconds, transition_hour)
+    """
+    date_str = target_dt.strftime('%Y-%m-%d')
+    local_tz = pytz.timezone(os.environ['TZ'])
     day = datetime.datetime.strptime(date_str, '%Y-%m-%d')
     day_start = local_tz.localize(day).astimezone(pytz.utc)
     next_day = day + datetime.timedelta(days=1)
@@ -193,59 +286,269 @@ def get_data(target_dt, full_day):
     transition_hour, offset_delta = find_dst_transition(day_start, local_tz)
     if transition_hour is not None:
         logging.info('DST transition at local hour %d (offset change: %+ds)', transition_hour, offset_delta)
+    return date_str, next_day.strftime('%Y-%m-%d'), day_start, day_seconds, transition_hour
+
+
+class FtpSession:
+    """
+    FTP-Verbindung fuer alle Dateien eines Laufs: connect und login nur
+    beim ersten store(), quit in close().
+    """
+
+    def __init__(self):
+        self.ftp = None
+
+    def store(self, buf, day_str):
+        """:return: 'ok' or 'error'"""
+        ftp_filename = f"{int(os.environ['DFLD_CKSUM']):04x}-{int(os.environ['DFLD_REGION']):03d}-{day_str}-{int(os.environ['DFLD_STATION']):03d}.wwx"
+        try:
+            if self.ftp is None:
+                ftp_dst = deobfuscate_string(os.environ['DFLD_LEGACY']).split(':')
+                ftp = ftplib.FTP()
+                ftp.connect(ftp_dst[0], int(ftp_dst[1]))
+                ftp.login(ftp_dst[2], ftp_dst[3])
+                self.ftp = ftp
+            logging.info('transfering %s bytes of data to file %s via ftp...', len(buf), ftp_filename)
+            with io.BytesIO(buf) as f:
+                self.ftp.storbinary(f'STOR {ftp_filename}', f)
+            return 'ok'
+        except ftplib.all_errors as e:
+            logging.error('ftp error: %s', e)
+            logging.error('transfer failed, retry in 1 hour')
+            self.close()
+            return 'error'
+
+    def close(self):
+        if self.ftp is not None:
+            try:
+                self.ftp.quit()
+            except ftplib.all_errors:
+                self.ftp.close()
+            self.ftp = None
+
+
+def _upload(buf, day_str):
+    """single file in its own session, :return: 'ok' or 'error'"""
+    session = FtpSession()
+    try:
+        return session.store(buf, day_str)
+    finally:
+        session.close()
+
+
+WWX_SIZE = 86402  # 86400 levels + crc byte + 0x00
+
+
+def verify_wwx(buf):
+    """True if buf has the .wwx length, the CRC byte of the levels and the trailing 0x00"""
+    return len(buf) == WWX_SIZE and buf[86400] == calc_crc(buf[:86400]) & 0xff and buf[86401] == 0
+
+
+class WwxCache:
+    """
+    Abgeschlossene Tage als fertige .wwx-Dateien ({region}-{date}-{station}.wwx).
 
-    # read one day of data from influxdb v1
-    # use next day's midnight as boundary instead of +86400s
-    # so DST transition days (23h or 25h) are queried correctly
-    next_date_str = next_day.strftime('%Y-%m-%d')
+    Ein voller Tag aendert sich nicht mehr: ein fehlgeschlagener Upload wird
+    im naechsten Zyklus aus dem Cache wiederholt statt den Tag erneut aus
+    InfluxDB zu lesen, und `tsdb2ftp.py resend` laedt Tage sofort erneut
+    hoch. Dateien aelter als keep_days werden beim Speichern entfernt.
+    """
+
+    def __init__(self, directory, keep_days=60):
+        self.directory = pathlib.Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.keep_days = keep_days
+
+    def path(self, day_str):
+        return self.directory / f"{int(os.environ['DFLD_REGION']):03d}-{day_str}-{int(os.environ['DFLD_STATION']):03d}.wwx"
+
+    def store(self, day_str, buf):
+        path = self.path(day_str)
+        tmp = path.with_suffix('.tmp')
+        with open(tmp, 'wb') as f:
+            f.write(buf)
+        os.replace(tmp, path)
+        self.prune()
+
+    def load(self, day_str):
+        """:return: cached buffer, None if missing or corrupt"""
+        try:
+            buf = self.path(day_str).read_bytes()
+        except OSError:
+            return None
+        if not verify_wwx(buf):
+            logging.warning('cached %s is corrupt, ignored', self.path(day_str).name)
+            return None
+        return buf
+
+    def days(self):
+        """:return: sorted list of cached day strings (YYYYMMDD)"""
+        pattern = re.compile(r'^\d{3}-(\d{8})-\d{3}\.wwx$')
+        return sorted(m.group(1) for m in (pattern.match(p.name) for p in self.directory.iterdir()) if m)
+
+    def prune(self):
+        oldest = (datetime.date.today() - datetime.timedelta(days=self.keep_days)).strftime('%Y%m%d')
+        for day_str in self.days():
+            if day_str < oldest:
+                self.path(day_str).unlink(missing_ok=True)
+
+
+# finalized days, None if WWX_CACHE_DIR is not usable
+cache = None
+
+
+# days per query during catch-up, about 260k points / a few MB per query
+CATCHUP_CHUNK_DAYS = 3
+
+
+class CatchUp:
+    """
+    Nachholen mehrerer voller Tage nach einem Ausfall.
+
+    Die Tage werden in Bloecken von CATCHUP_CHUNK_DAYS mit einer Abfrage
+    (chunked) gelesen und im Speicher an den lokalen Tagesgrenzen
+    geschnitten. Ein Thread fragt ab und mappt Tag N+1, waehrend Tag N
+    hochgeladen wird; hochgeladen wird der Reihe nach ueber eine
+    FtpSession, last_transfer.txt wird nach jedem Tag fortgeschrieben und
+    beim ersten Fehler angehalten.
+    """
+
+    def __init__(self, client, days, chunk_days=CATCHUP_CHUNK_DAYS, cache=None):
+        self.client = client
+        self.days = days
+        self.cache = cache
+        self.chunks = [days[i:i + chunk_days] for i in range(0, len(days), chunk_days)]
+        self._chunk = None  # (index, times ns array, values) of the last queried chunk
+
+    def _query_chunk(self, index):
+        chunk = self.chunks[index]
+        first = datetime.datetime.combine(chunk[0], datetime.time.min)
+        last = datetime.datetime.combine(chunk[-1], datetime.time.min)
+        date_str = first.strftime('%Y-%m-%d')
+        next_date_str = (last + datetime.timedelta(days=1)).strftime('%Y-%m-%d')
+        query = (f"SELECT dB_A_avg FROM {os.environ['INFLUXDB_MEASUREMENT']} WHERE "
+                 f"time >= ('{date_str}' -     1s) AND "
+                 f"time <  '{next_date_str}' "
+                 f"tz('{os.environ['TZ']}')")
+        logging.debug('SQL query: %s', query)
+        # chunked=True: the client yields one ResultSet per chunk of the response
+        values = []
+        for part in self.client.query(query, epoch='ns', chunked=True, chunk_size=20000):
+            series = part.raw.get('series')
+            if series:
+                values.extend(series[0]['values'])
+        logging.info('%d points for %s .. %s', len(values), chunk[0], chunk[-1])
+        times = np.fromiter((v[0] for v in values), dtype=np.int64, count=len(values))
+        self._chunk = (index, times, values)
+
+    def prepare(self, day):
+        """
+        query (once per chunk) and map one full day, cached days come from the cache
+        :return: .wwx buffer, None if the day has no data
+        """
+        if self.cache is not None:
+            buf = self.cache.load(day.strftime('%Y%m%d'))
+            if buf is not None:
+                logging.info('%s from cache', day)
+                return buf
+        index = next(i for i, chunk in enumerate(self.chunks) if day in chunk)
+        if self._chunk is None or self._chunk[0] != index:
+            self._query_chunk(index)
+        _, times, values = self._chunk
+        target_dt = datetime.datetime.combine(day, datetime.time.min)
+        _, _, day_start, day_seconds, transition_hour = _local_day(target_dt)
+        t0 = epoch_ns(day_start)
+        # same range as a single day query: [day - 1s, next day)
+        a = int(np.searchsorted(times, t0 - 1_000_000_000, side='left'))
+        b = int(np.searchsorted(times, t0 + day_seconds * 1_000_000_000, side='left'))
+        if a == b:
+            return None
+        buf = to_wwx(map_day(values[a:b], day_start, True, day_seconds, transition_hour))
+        if self.cache is not None:
+            try:
+                self.cache.store(day.strftime('%Y%m%d'), buf)
+            except OSError as e:
+                logging.error('cannot cache %s: %s', day, e)
+        return buf
+
+    def run(self, on_done):
+        """
+        :param on_done: called with each day after its upload (or if it has no data), in order
+        :return: True if all days were processed
+        """
+        session = FtpSession()
+        try:
+            with ThreadPoolExecutor(max_workers=1) as pool:
+                pending = pool.submit(self.prepare, self.days[0])
+                for i, day in enumerate(self.days):
+                    day_str = day.strftime('%Y%m%d')
+                    try:
+                        buf = pending.result()
+                    except Exception as e:
+                        logging.error('query of %s failed: %s', day_str, e)
+                        return False
+                    if i + 1 < len(self.days):
+                        # map the next day while this one is uploaded
+                        pending = pool.submit(self.prepare, self.days[i + 1])
+                    logging.info('processing %s fullday=True ...', day_str)
+                    if buf is None:
+                        logging.info('no data available for %s', day_str)
+                    elif session.store(buf, day_str) == 'error':
+                        # transient failure — resume from this same day next cycle
+                        return False
+                    on_done(day)
+            return True
+        finally:
+            session.close()
+
+
+def _do_partial_transfer(now_dt, today_str):
+    """
+    Extend today's buffer with the points after its high-water mark and
+    upload it unless the content is unchanged since the last upload.
+    :return: 'ok', 'unchanged', 'empty' or 'error'
+    """
+    global partial_day
+    date_str, next_date_str, day_start, day_seconds, transition_hour = _local_day(now_dt)
+    if partial_day is None or partial_day.date_str != date_str:
+        partial_day = PartialDay(date_str, day_start, day_seconds, transition_hour)
+
+    client = _connect()
+    if client is None:
+        return 'error'
+    measurement = os.environ["INFLUXDB_MEASUREMENT"]
+    tz = os.environ['TZ']
+    if partial_day.anchor is None:
+        since = f"time >= ('{date_str}' -     1s)"
+    else:
+        since = f"time > {int(partial_day.anchor)}"
     query = (f"SELECT dB_A_avg FROM {measurement} WHERE "
-             f"time >= ('{date_str}' -     1s) AND "
+             f"{since} AND "
              f"time <  '{next_date_str}' "
              f"tz('{tz}')")
     logging.debug('SQL query: %s', query)
-    result = client.query(query)
-    if len(result.raw["series"]) == 0:
-        logging.warning('no data found for date %s', date_str)
-        return None, True
-    logging.debug('number of points in result: %s', len(result.raw["series"][0]["values"]))
-
-    data = map_one_day(day_start, result, full_day, day_seconds, transition_hour)
-    bb = None
-    if data:
-        bb = bytearray(data)
-        bb.extend([calc_crc(data) & 0xff, 0x00])
-        logging.debug('length of bytebuffer: %s', len(bb))
-    return bb, True
-
-
-def _do_transfer(target_dt, day_str, full_day):
-    """
-    Query InfluxDB for a single day and, if non-empty, FTP the result.
-    :return: 'ok', 'empty' (query succeeded but day has no data), or
-             'error' (connection/FTP failure — caller should retry later)
-    """
-    buf, query_ok = get_data(target_dt, full_day)
-    if not query_ok:
+    try:
+        result = client.query(query, epoch='ns')
+    except Exception as e:
+        logging.error('query failed: %s', e)
         return 'error'
-    if not buf or len(buf) == 0:
-        logging.info('no data available for %s', day_str)
+    series = result.raw.get('series')
+    values = series[0]['values'] if series else []
+    n_new = partial_day.extend(values)
+    logging.info('%d points since anchor, %d new bins, %d bins today', len(values), n_new, partial_day.n_day)
+    if partial_day.n_day == 0:
+        logging.info('no data available for %s', today_str)
         return 'empty'
 
-    ftp_filename = f"{int(os.environ['DFLD_CKSUM']):04x}-{int(os.environ['DFLD_REGION']):03d}-{day_str}-{int(os.environ['DFLD_STATION']):03d}.wwx"
-    try:
-        ftp_dst = deobfuscate_string(os.environ['DFLD_LEGACY']).split(':')
-        ftp = ftplib.FTP()
-        ftp.connect(ftp_dst[0], int(ftp_dst[1]))
-        ftp.login(ftp_dst[2], ftp_dst[3])
-        logging.info('transfering %s bytes of data to file %s via ftp...', len(buf), ftp_filename)
-        with io.BytesIO(buf) as f:
-            ftp.storbinary(f'STOR {ftp_filename}', f)
-        ftp.quit()
-        return 'ok'
-    except ftplib.all_errors as e:
-        logging.error('ftp error: %s', e)
-        logging.error('transfer failed, retry in 1 hour')
-        return 'error'
+    buf = partial_day.wwx()
+    digest = hashlib.sha1(buf).hexdigest()
+    if digest == partial_day.uploaded_hash:
+        logging.info('content of %s unchanged, upload skipped', today_str)
+        return 'unchanged'
+    status = _upload(buf, today_str)
+    if status == 'ok':
+        partial_day.uploaded_hash = digest
+    return status
 
 
 def check_for_transfer():
@@ -268,29 +571,75 @@ def check_for_transfer():
             print(last_str, file=f)
         logging.info('last transfer date initialized to %s', last_str)
 
-    # catch up one full day at a time from last_transfer+1 up to yesterday
-    day = datetime.datetime.strptime(last_str, '%Y%m%d').date() + datetime.timedelta(days=1)
-    while day <= yesterday_date:
-        day_str = day.strftime('%Y%m%d')
-        target_dt = datetime.datetime.combine(day, datetime.time.min)
-        logging.info('processing %s fullday=True ...', day_str)
-        status = _do_transfer(target_dt, day_str, full_day=True)
-        if status == 'error':
-            # transient failure — resume from this same day next cycle
+    # catch up full days from last_transfer+1 up to yesterday
+    first = datetime.datetime.strptime(last_str, '%Y%m%d').date() + datetime.timedelta(days=1)
+    days = [first + datetime.timedelta(days=i) for i in range((yesterday_date - first).days + 1)]
+    if days:
+        client = _connect()
+        if client is None:
+            return
+
+        def mark_done(day):
+            with open(last_transfer_filename, mode="w", encoding="utf-8") as f:
+                print(day.strftime('%Y%m%d'), file=f)
+
+        if not CatchUp(client, days, cache=cache).run(mark_done):
             return
-        with open(last_transfer_filename, mode="w", encoding="utf-8") as f:
-            print(day_str, file=f)
-        day += datetime.timedelta(days=1)
 
     # partial transfer for today (never marks last_transfer)
     today_str = now_dt.strftime('%Y%m%d')
     logging.info('processing %s fullday=False ...', today_str)
-    _do_transfer(now_dt, today_str, full_day=False)
+    _do_partial_transfer(now_dt, today_str)
+
+def main(argv=None):
+    global cache
+    parser = argparse.ArgumentParser(description='Transfer the 1 Hz SPL day files (.wwx) to the DFLD FTP server')
+    sub = parser.add_subparsers(dest='command')
+    sub.add_parser('run', help='hourly transfer (default)')
+    sub.add_parser('list', help='list the cached days')
+    verify = sub.add_parser('verify', help='check length and CRC of cached days')
+    verify.add_argument('days', nargs='*', help='YYYYMMDD (default: all cached days)')
+    resend = sub.add_parser('resend', help='upload cached days again')
+    resend.add_argument('days', nargs='+', help='YYYYMMDD')
+    args = parser.parse_args(argv)
+
+    cache_dir = os.environ.get('WWX_CACHE_DIR', '/var/lib/tsdb2ftp/cache')
+    if cache_dir:
+        try:
+            cache = WwxCache(cache_dir, keep_days=int(os.environ.get('WWX_CACHE_DAYS', 60)))
+        except OSError as e:
+            logging.error('cannot open cache %s, caching disabled: %s', cache_dir, e)
+
+    if args.command in ('list', 'verify', 'resend'):
+        if cache is None:
+            return 1
+        if args.command == 'list':
+            for day_str in cache.days():
+                path = cache.path(day_str)
+                print(f'{day_str}  {path.stat().st_size:6d}  {path.name}')
+            return 0
+        failed = 0
+        for day_str in args.days or cache.days():
+            buf = cache.load(day_str)
+            if buf is None:
+                print(f'{day_str}  missing or corrupt')
+                failed += 1
+            elif args.command == 'verify':
+                print(f'{day_str}  ok')
+            elif _upload(buf, day_str) == 'ok':
+                print(f'{day_str}  sent')
+            else:
+                print(f'{day_str}  upload failed')
+                failed += 1
+        return 1 if failed else 0
 
-if __name__ == '__main__':
     # inital delay to wait for system startup
     logging.info('waiting 60 seconds for system startup...')
     time.sleep(60)
     while True:
         check_for_transfer()
         time.sleep(3600)
+
+
+if __name__ == '__main__':
+    sys.exit(main())